@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # master.py, slave.py and client.py live here
+sys.path.insert(0, ROOT)
+
+from client import SyncClient
+from logger import Logger
+from metrics import Histogram
+
+
+def read_vecs(path: str, limit: int=None) -> np.array:
+    if path.endswith('.npy'):
+        data = np.load(path, mmap_mode='r')
+        return np.ascontiguousarray(data[:limit], dtype=np.float32)
+    # .fvecs / .ivecs / .bvecs: every row is an int32 dimension followed by that many values
+    dtype = {'.fvecs': np.float32, '.ivecs': np.int32, '.bvecs': np.uint8}[os.path.splitext(path)[1]]
+    raw = np.fromfile(path, dtype=np.uint8)
+    dim = int(raw[:4].view(np.int32)[0])
+    row = 4 + dim * np.dtype(dtype).itemsize
+    rows = raw.reshape(-1, row)[:limit]
+    data = rows[:, 4:].copy().view(dtype).reshape(len(rows), dim)
+    return data if dtype is np.int32 else data.astype(np.float32)
+
+
+def synthetic(num: int, queries: int, dim: int, clusters: int=64, seed: int=0) -> tuple[np.array, np.array]:
+    # Gaussian mixture, so approximate indexes see the cluster structure they are built for
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    base = centers[rng.integers(clusters, size=num)] + rng.normal(scale=0.3, size=(num, dim)).astype(np.float32)
+    query = centers[rng.integers(clusters, size=queries)] + rng.normal(scale=0.3, size=(queries, dim)).astype(np.float32)
+    return base.astype(np.float32), query.astype(np.float32)
+
+
+def ground_truth(base: np.array, query: np.array, K: int, chunk: int=65536) -> np.array:
+    # exact squared L2 neighbours, the same metric as the slaves' indexes
+    query_norm = (query.astype(np.float64) ** 2).sum(axis=1)[:, None]
+    best_dis = np.full((len(query), 0), np.inf)
+    best_ids = np.zeros((len(query), 0), dtype=np.int64)
+    for start in range(0, len(base), chunk):
+        part = base[start: start + chunk].astype(np.float64)
+        dis = query_norm - 2 * query.astype(np.float64) @ part.T + (part ** 2).sum(axis=1)[None, :]
+        dis = np.concatenate([best_dis, dis], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(part)), (len(query), len(part)))], axis=1)
+        keep = np.argpartition(dis, min(K, dis.shape[1] - 1), axis=1)[:, :K]
+        best_dis = np.take_along_axis(dis, keep, axis=1)
+        best_ids = np.take_along_axis(ids, keep, axis=1)
+    order = np.argsort(best_dis, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def latency(histogram: Histogram, errors: int, seconds: float, items: int=None) -> dict:
+    summary = histogram.summary()
+    result = {
+        'requests': histogram.count,
+        'errors': errors,
+        'seconds': seconds,
+        'qps': histogram.count / seconds if seconds else 0.0,
+    }
+    if items is not None:
+        result['items'] = items
+        result['items_per_second'] = items / seconds if seconds else 0.0
+    result.update({f"{field}_ms": summary[field] * 1e3 for field in ['mean', 'p50', 'p90', 'p99', 'p999', 'max']})
+    return result
+
+
+class Cluster:
+    def __init__(self, slaves: int, host: str='127.0.0.1', port: int=47000, replication: int=2, index_type: str='Flat',
+        workdir: str=None, keep: bool=False, log_level: str='warning', max_client_inflight: int=8):
+        self.slaves = slaves
+        self.host = host
+        self.port = port  # master port, slave i listens on port + 1 + i
+        self.replication = min(replication, slaves)
+        self.index_type = index_type
+        self.workdir = workdir or tempfile.mkdtemp(prefix='azu-bench-')  # one working directory per node
+        self.keep = keep  # leave the working directories behind for inspection
+        self.log_level = log_level
+        self.max_client_inflight = max_client_inflight
+        self.nodes = [f"{host}:{port + 1 + num}" for num in range(slaves)]
+        self.processes = {}  # name -> Popen
+
+
+    def spawn(self, name: str, script: str, args: list) -> subprocess.Popen:
+        cwd = os.path.join(self.workdir, name)
+        os.makedirs(cwd, exist_ok=True)
+        with open(os.path.join(cwd, 'stderr.log'), 'w') as stderr:
+            process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)] + [str(arg) for arg in args],
+                cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+        self.processes[name] = process
+        return process
+
+
+    def start(self, logger: Logger, timeout: float=60.0) -> tuple[bool, str]:
+        self.spawn('master', 'master.py', ['--ip', self.host, '--port', self.port, '--slaves', ','.join(self.nodes),
+            '--replication', self.replication, '--max-client-inflight', self.max_client_inflight,
+            '--max-inflight', max(64, self.max_client_inflight), '--log-level', self.log_level])
+        for num, node in enumerate(self.nodes):
+            self.spawn(f"slave{num}", 'slave.py', ['--ip', self.host, '--port', self.port + 1 + num, '--master-ip', self.host,
+                '--master-port', self.port, '--node', node, '--index-type', self.index_type, '--log-level', self.log_level])
+        logger.log(f"Spawn Master [{self.host}]-[{self.port}] and Slave(s) {self.nodes} under [{self.workdir}].")
+
+        deadline = time.time() + timeout
+        with SyncClient('admin', self.host, self.port, max_connections=1, timeout=5.0, logger=logger) as api:
+            while time.time() < deadline:
+                for name, process in self.processes.items():
+                    if process.poll() is not None:
+                        return False, f"[{name}] exited with [{process.returncode}], see [{os.path.join(self.workdir, name, 'stderr.log')}]."
+                OK_stats, stats, _ = api.stats()
+                if OK_stats and stats['master']['gauges'].get('azu_master_alive_slaves') == self.slaves:
+                    return True, f"Master sees [{self.slaves}] alive Slave(s)."
+                time.sleep(0.5)
+        return False, f"Only part of the [{self.slaves}] Slave(s) became alive within [{timeout}] seconds."
+
+
+    def stop(self, logger: Logger) -> None:
+        for process in self.processes.values():
+            process.terminate()
+        for name, process in self.processes.items():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                logger.log(f"Kill [{name}], it did not stop in time.", level='warning')
+        if not self.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class ClusterBenchmark:
+    def __init__(self, api: SyncClient, base: np.array, query: np.array, truth: np.array, concurrency: int=8, logger: Logger=None):
+        self.api = api
+        self.base = base
+        self.query = query
+        self.truth = truth  # exact neighbour row ids of every query, best first
+        self.concurrency = concurrency  # client threads issuing requests at once
+        self.logger = logger
+        self.lock = threading.Lock()
+
+
+    def key(self, num: int) -> str:
+        return f"v{num}"
+
+
+    def drive(self, calls: list) -> tuple[Histogram, int, float, list]:
+        histogram = Histogram()
+        errors = []
+        results = [None] * len(calls)
+
+        def run(num: int) -> None:
+            start_time = time.perf_counter()
+            OK_call, result, msg = calls[num]()
+            seconds = time.perf_counter() - start_time
+            with self.lock:
+                histogram.record(seconds)
+                if not OK_call:
+                    errors.append(msg)
+            results[num] = result if OK_call else None
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(run, range(len(calls))))
+        seconds = time.perf_counter() - start_time
+        if errors:
+            self.logger.log(f"[{len(errors)}] request(s) failed, first: [{errors[0]}].", level='warning')
+        return histogram, len(errors), seconds, results
+
+
+    def ingest(self, batch: int) -> dict:
+        calls = []
+        for start in range(0, len(self.base), batch):
+            keys = [self.key(num) for num in range(start, min(start + batch, len(self.base)))]
+            calls.append(lambda keys=keys, start=start: self.api.bulk_upload(keys, self.base[start: start + len(keys)]))
+        histogram, errors, seconds, _ = self.drive(calls)
+        return latency(histogram, errors, seconds, len(self.base))
+
+
+    def lookup(self, num: int, seed: int=0) -> dict:
+        picks = np.random.default_rng(seed).integers(len(self.base), size=num)
+        histogram, errors, seconds, results = self.drive([lambda pick=pick: self.api.get(self.key(pick)) for pick in picks])
+        mismatches = sum(1 for pick, result in zip(picks, results)
+            if result is not None and not np.array_equal(np.asarray(result).reshape(-1), self.base[pick]))
+        result = latency(histogram, errors, seconds)
+        result['mismatches'] = mismatches  # vectors read back different from what was uploaded
+        return result
+
+
+    def topk(self, K: int, query_batch: int=1, nprobe: int=None, efSearch: int=None) -> dict:
+        if query_batch > 1:
+            calls = [lambda start=start: self.api.batch_topk(self.query[start: start + query_batch], K, nprobe, efSearch)
+                for start in range(0, len(self.query), query_batch)]
+        else:
+            calls = [lambda num=num: self.api.topk(self.query[num], K, nprobe, efSearch) for num in range(len(self.query))]
+        histogram, errors, seconds, results = self.drive(calls)
+
+        answers = []
+        for result in results:
+            if query_batch > 1:
+                answers.extend(result if result is not None else [None] * query_batch)
+            else:
+                answers.append(result)
+        hits = []
+        for truth, answer in zip(self.truth, answers[:len(self.query)]):
+            found = set() if answer is None else set(answer[0][:K])
+            hits.append(len(found & {self.key(num) for num in truth[:K]}) / K)
+
+        result = latency(histogram, errors, seconds, len(self.query))
+        result['recall_at_k'] = float(np.mean(hits)) if hits else 0.0
+        result['K'] = K
+        return result
+
+
+def load(args: argparse.Namespace, logger: Logger) -> tuple[np.array, np.array, np.array]:
+    truth = None
+    if args.dataset == 'synthetic':
+        base, query = synthetic(args.num or 10000, args.queries, args.dim, seed=args.seed)
+    else:
+        base = read_vecs(args.dataset, args.num)
+        query = read_vecs(args.query, args.queries)
+        if args.groundtruth and args.num is None:
+            truth = read_vecs(args.groundtruth, args.queries)
+    if truth is None or truth.shape[1] < args.K:
+        start_time = time.perf_counter()
+        truth = ground_truth(base, query, args.K)
+        logger.log(f"Compute exact top-[{args.K}] of [{len(query)}] quer(ies) in [{time.perf_counter() - start_time:.2f}] seconds.")
+    return base, query, truth
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Launch a loopback AZU cluster and measure ingest, lookup and top-K.')
+    parser.add_argument('--slaves', type=int, default=3)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=47000, help='master port, slave i listens on port + 1 + i')
+    parser.add_argument('--replication', type=int, default=2)
+    parser.add_argument('--index-type', default='Flat', choices=['Flat', 'IVFFlat', 'IVFPQ', 'HNSW'])
+    parser.add_argument('--dataset', default='synthetic', help="'synthetic' or a base .fvecs/.bvecs/.npy file")
+    parser.add_argument('--query', help='query .fvecs/.bvecs/.npy file, required with a dataset file')
+    parser.add_argument('--groundtruth', help='.ivecs ground truth, used only when the whole base is loaded')
+    parser.add_argument('--num', type=int, default=None, help='base vectors, 10000 synthetic or the whole dataset file by default')
+    parser.add_argument('--dim', type=int, default=128, help='synthetic dimension')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=500, help='vectors per bulk upload')
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--K', type=int, default=10)
+    parser.add_argument('--query-batch', type=int, default=1, help='queries per batchTopK, 1 sends single topK')
+    parser.add_argument('--nprobe', type=int, default=None)
+    parser.add_argument('--efSearch', type=int, default=None)
+    parser.add_argument('--settle', type=float, default=0.0, help='seconds to wait after ingest, e.g. for index training')
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--keep', action='store_true', help='keep node working directories')
+    parser.add_argument('--log-level', default='warning', choices=list(Logger.levels))
+    parser.add_argument('--output', default=None, help='write the JSON results here as well as to stdout')
+    args = parser.parse_args()
+    if args.dataset != 'synthetic' and not args.query:
+        parser.error('--query is required with a dataset file')
+
+    logger = Logger('benchmark', echo=False)
+    base, query, truth = load(args, logger)
+    cluster = Cluster(args.slaves, args.host, args.port, args.replication, args.index_type, args.workdir, args.keep, args.log_level,
+        max_client_inflight=max(8, args.concurrency))
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ['output']},
+        'dataset': {'base': list(base.shape), 'query': list(query.shape)},
+    }
+    try:
+        OK_start, msg = cluster.start(logger)
+        logger.log(msg)
+        if not OK_start:
+            print(msg, file=sys.stderr)
+            return 1
+
+        with SyncClient('admin', args.host, args.port, max_connections=args.concurrency, window=1, logger=logger) as api:
+            bench = ClusterBenchmark(api, base, query, truth, args.concurrency, logger)
+            results['ingest'] = bench.ingest(args.batch)
+            if args.settle:
+                time.sleep(args.settle)
+            results['lookup'] = bench.lookup(args.lookups, args.seed)
+            results['topk'] = bench.topk(args.K, args.query_batch, args.nprobe, args.efSearch)
+            OK_stats, stats, _ = api.stats()
+            if OK_stats:
+                results['cluster'] = {node: stats[node]['gauges'] for node in stats if isinstance(stats[node], dict) and 'gauges' in stats[node]}
+    finally:
+        cluster.stop(logger)
+        logger.flush()
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    failed = sum(results[stage]['errors'] for stage in ['ingest', 'lookup', 'topk'])
+    return 1 if failed or results['lookup']['mismatches'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
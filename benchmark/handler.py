@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # master.py, slave.py and client.py live here
+sys.path.insert(0, ROOT)
+
+from slave import Handler
+from logger import Logger
+from metrics import Histogram
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline', 'handler.json')
+
+
+def rss() -> float:
+    # resident set size in MiB, faiss and numpy allocate outside the Python heap so tracemalloc would miss them
+    with open('/proc/self/statm', 'r') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def peak_rss() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class HandlerBenchmark:
+    def __init__(self, num: int, dim: int, index_type: str='Flat', ops: int=1000, writes: int=200, queries: int=100, K: int=10,
+        batch: int=10000, commit_interval: float=0.005, seed: int=0, logger: Logger=None):
+        self.num = num  # vectors in the collection before any op is timed
+        self.dim = dim
+        self.index_type = index_type
+        self.ops = ops  # timed lookups and hash finds
+        self.writes = writes  # timed single uploads, each waits for its group commit
+        self.queries = queries  # timed top-K searches
+        self.K = K
+        self.batch = batch  # vectors per bulk load call while filling the collection
+        self.commit_interval = commit_interval
+        self.seed = seed
+        self.logger = logger
+        self.index_config = {'index_type': index_type, 'index_types': {}, 'train_threshold': 10000}
+
+
+    def key(self, num: int) -> str:
+        return f"v{num}"
+
+
+    def vectors(self, start: int, count: int) -> np.array:
+        rng = np.random.default_rng((self.seed, start))
+        return rng.standard_normal((count, self.dim), dtype=np.float32)
+
+
+    def handler(self) -> Handler:
+        handler = Handler(self.commit_interval, index_config=self.index_config)
+        if not handler.rebuild(self.logger):
+            raise RuntimeError('Fail to open Handler, see log.')
+        commit = threading.Thread(target=handler.wal.run_commit, args=(self.logger, ))
+        commit.daemon = True
+        commit.start()
+        return handler
+
+
+    def timed(self, calls: list, items: int=None) -> dict:
+        histogram = Histogram()
+        errors = 0
+        rss_before = rss()
+        start_time = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            result = call()
+            histogram.record(time.perf_counter() - call_start)
+            errors += 0 if result[0] else 1
+        seconds = time.perf_counter() - start_time
+        summary = histogram.summary()
+        result = {
+            'calls': histogram.count,
+            'errors': errors,
+            'seconds': seconds,
+            'ops_per_second': (items or histogram.count) / seconds if seconds else 0.0,
+            'rss_delta_mb': rss() - rss_before,
+        }
+        result.update({f"{field}_us": summary[field] * 1e6 for field in ['mean', 'p50', 'p90', 'p99', 'max']})
+        return result
+
+
+    def populate(self, handler: Handler) -> dict:
+        calls = []
+        for start in range(0, self.num, self.batch):
+            count = min(self.batch, self.num - start)
+            calls.append(lambda start=start, count=count: handler.create_batch_data('admin#bulkUpload',
+                ([self.key(num) for num in range(start, start + count)], self.vectors(start, count)), self.logger))
+        return self.timed(calls, self.num)
+
+
+    def run_ops(self) -> dict:
+        rng = np.random.default_rng(self.seed)
+        handler = self.handler()
+        results = {'bulk_load': self.populate(handler)}
+        if self.index_type != 'Flat':
+            start_time = time.perf_counter()
+            handler.vector_index.train(handler.load_vectors, self.logger)
+            results['train'] = {'seconds': time.perf_counter() - start_time}
+        results['rss_mb'] = rss()
+
+        writes = self.vectors(self.num, self.writes)
+        results['create_data'] = self.timed([lambda num=num: handler.create_data(f"admin#upload#w{num}", writes[num], self.logger)
+            for num in range(self.writes)])
+
+        picks = rng.integers(self.num, size=self.ops)
+        results['look_target_data'] = self.timed([lambda pick=pick: handler.look_target_data(self.key(pick), self.logger)
+            for pick in picks])
+
+        hashes = [handler.catalog.get(self.key(pick)).data_hash for pick in picks]
+        results['find_target_hash_data'] = self.timed([lambda data_hash=data_hash: handler.find_target_hash_data(data_hash, self.logger)
+            for data_hash in hashes])
+
+        query = rng.standard_normal((self.queries, self.dim), dtype=np.float32)
+        results['find_topK'] = self.timed([lambda num=num: handler.find_topK('admin', query[num], self.K, self.logger)
+            for num in range(self.queries)])
+
+        if not handler.checkpoint(self.logger):
+            raise RuntimeError('Fail to checkpoint Handler, see log.')
+        results['peak_rss_mb'] = peak_rss()
+        return results
+
+
+    def run_rebuild(self) -> dict:
+        handler = Handler(self.commit_interval, index_config=self.index_config)
+        rss_before = rss()
+        start_time = time.perf_counter()
+        OK_rebuild = handler.rebuild(self.logger)
+        return {
+            'rebuild': {
+                'calls': 1,
+                'errors': 0 if OK_rebuild else 1,
+                'seconds': time.perf_counter() - start_time,
+                'keys': len(handler.catalog.records),
+                'rss_delta_mb': rss() - rss_before,
+            },
+            'rebuild_peak_rss_mb': peak_rss(),
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, metric: str, min_samples: int=20, latency_floor: float=50.0,
+    seconds_floor: float=0.5, memory_floor: float=16.0) -> list:
+    # a value regresses past baseline * (1 + tolerance) and an absolute floor, so scheduler noise on microsecond
+    # percentiles and on single samples (a small bulk load, rebuild seconds, rss) does not fail the run
+    regressions = []
+    for case, ops in baseline.get('results', {}).items():
+        current = results.get(case)
+        if current is None:
+            continue
+        for op, stats in ops.items():
+            if op not in current:
+                continue
+            if not isinstance(stats, dict):
+                field, unit, floor, old, new = op, 'MB', memory_floor, stats, current[op]
+            elif metric in stats and min(stats.get('calls', 0), current[op].get('calls', 0)) >= min_samples:
+                field, unit, floor, old, new = metric, 'us', latency_floor, stats[metric], current[op].get(metric)
+            else:
+                field, unit, floor, old, new = 'seconds', 's', seconds_floor, stats.get('seconds'), current[op].get('seconds')
+            if old is None or new is None or old <= 0:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append({'case': case, 'op': op, 'field': field, 'unit': unit, 'baseline': old, 'current': new, 'ratio': new / old})
+    return regressions
+
+
+def worker(args: argparse.Namespace) -> int:
+    os.chdir(args.workdir)
+    logger = Logger('handler', level=args.log_level, echo=False)
+    bench = HandlerBenchmark(args.sizes[0], args.dims[0], args.index_type, args.ops, args.writes, args.queries, args.K, args.batch,
+        args.commit_interval, args.seed, logger)
+    results = bench.run_ops() if args.phase == 'ops' else bench.run_rebuild()
+    logger.flush()
+    print(json.dumps(results))
+    return 0
+
+
+def spawn(args: argparse.Namespace, phase: str, num: int, dim: int, workdir: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), '--phase', phase, '--workdir', workdir, '--sizes', num, '--dims', dim,
+        '--index-type', args.index_type, '--ops', args.ops, '--writes', args.writes, '--queries', args.queries, '--K', args.K,
+        '--batch', args.batch, '--commit-interval', args.commit_interval, '--seed', args.seed, '--log-level', args.log_level]
+    # one process per phase, so peak memory and rebuild start from a clean interpreter
+    process = subprocess.run([str(arg) for arg in command], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"[{phase}] of [{num}x{dim}] failed: {process.stderr.strip()[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Time Handler operations in-process as the collection grows.')
+    parser.add_argument('--sizes', type=lambda text: [int(float(size)) for size in str(text).split(',')], default=[1000, 100000, 1000000])
+    parser.add_argument('--dims', type=lambda text: [int(dim) for dim in str(text).split(',')], default=[32, 128])
+    parser.add_argument('--index-type', default='Flat', choices=['Flat', 'IVFFlat', 'IVFPQ', 'HNSW'])
+    parser.add_argument('--ops', type=int, default=1000, help='timed look_target_data and find_target_hash_data calls')
+    parser.add_argument('--writes', type=int, default=200, help='timed create_data calls')
+    parser.add_argument('--queries', type=int, default=100, help='timed find_topK calls')
+    parser.add_argument('--K', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=10000, help='vectors per bulk load while filling the collection')
+    parser.add_argument('--commit-interval', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='warning', choices=list(Logger.levels))
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed growth over the baseline, 0.25 is 25%%')
+    parser.add_argument('--metric', default='p50_us', help='per-op percentile compared with the baseline')
+    parser.add_argument('--min-samples', type=int, default=20, help='calls an op needs before its percentile is compared')
+    parser.add_argument('--latency-floor', type=float, default=50.0, help='microseconds a percentile must also grow by')
+    parser.add_argument('--seconds-floor', type=float, default=0.5, help='seconds a single-sample timing must also grow by')
+    parser.add_argument('--memory-floor', type=float, default=16.0, help='MiB an rss value must also grow by')
+    parser.add_argument('--save-baseline', action='store_true', help='write these results as the new baseline')
+    parser.add_argument('--output', default=None, help='write the JSON results here as well as to stdout')
+    parser.add_argument('--phase', choices=['ops', 'rebuild'], help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.phase:
+        return worker(args)
+
+    results = {}
+    for num in args.sizes:
+        for dim in args.dims:
+            workdir = tempfile.mkdtemp(prefix='azu-handler-')
+            try:
+                case = spawn(args, 'ops', num, dim, workdir)
+                case.update(spawn(args, 'rebuild', num, dim, workdir))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            results[f"{num}x{dim}"] = case
+            print(f"[{num}x{dim}] done: " + ', '.join(f"{op} p50 [{stats['p50_us']:.1f}] us" for op, stats in case.items()
+                if isinstance(stats, dict) and 'p50_us' in stats), file=sys.stderr)
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ['output', 'phase', 'workdir', 'save_baseline', 'baseline']},
+        'results': results,
+    }
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as file:
+            report['regressions'] = compare(results, json.load(file), args.tolerance, args.metric, args.min_samples,
+                args.latency_floor, args.seconds_floor, args.memory_floor)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in [args.output, args.baseline if args.save_baseline else None]:
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(text + '\n')
+    formats = {'us': '{:.1f} us', 's': '{:.3f} s', 'MB': '{:.1f} MiB'}
+    for regression in report.get('regressions', []):
+        text_format = formats[regression['unit']]
+        print(f"Regression in [{regression['case']}] [{regression['op']}]: [{regression['field']}] "
+            f"[{text_format.format(regression['baseline'])}] -> [{text_format.format(regression['current'])}].", file=sys.stderr)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
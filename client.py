@@ -1,94 +1,399 @@
+import argparse
 import socket
 import numpy as np
-import datetime
-import time
-import pickle
 import hashlib
 import os
-import shutil
+import queue
+import time
+import threading
+import asyncio
+from transport import Transport
+from logger import Logger, summary
+import tracing
+from tracing import Trace, Tracer
 
 
-class Logger:
-    def __init__(self, name: str):
-        self.log_file = f'log/{name}_new.log'
-        now_time = self.get_time()
+class ClientSocket:
+    def __init__(self, master_ip: str, master_port: int, buffer: int, window: int=8, timeout: float=None, tracer: Tracer=None):
+        self.master_ip = master_ip
+        self.master_port = master_port
+        self.buffer = buffer
+        self.transport = Transport(buffer)
+        self.timeout = timeout  # seconds one socket call may block, None waits forever
+        self.window = window  # requests kept outstanding on the connection, matches Master per-client limit
+        self.conn = None  # persistent connection to Master
+        self.next_id = 0
+        self.tracer = tracer  # trace every request end to end when set
 
-        if not os.path.exists('log'):
-            os.mkdir('log')
-        if not os.path.exists(self.log_file):
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        else:
-            with open('log/last_open_time.log', 'r') as file:
-                last_open_time = file.readline()
-                shutil.move(self.log_file, f'log/{name}_{last_open_time}.log')
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        with open(self.log_file, 'w') as file:
-            msg = f"[{now_time}] {name} starts\n"
-            file.write(msg)
-            print(msg)
-
-
-    def get_time(self) -> str:
-        now_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return str(now_time)
-
-    def log(self, msg) -> bool:
-        now_time = self.get_time()
-        if not isinstance(msg, str):
-            msg = str(msg)
 
+    def connect(self, logger: Logger) -> bool:
+        if self.conn is not None:
+            return True
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(self.timeout)
         try:
-            with open(self.log_file, 'a') as file:
-                new_msg = f"[{now_time}] {msg}\n"
-                file.write(new_msg)
-                # print(new_msg)  # <== For client, print is down, for master and slave, print is on.
-                return True
+            client_socket.connect((self.master_ip, self.master_port))
+        except Exception:
+            client_socket.close()
+            raise
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.conn = client_socket
+        logger.log(f"Client connected to Master [{self.master_ip}]-[{self.master_port}].")
+        return False
+
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+    def run(self, user_cmd, logger: Logger, destination=None) -> tuple[bool, object]:
+        OK_run, replies = self.pipeline([user_cmd], logger, destination)
+        if not OK_run:
+            return False, replies
+        return True, replies[0]
+
+
+    def pipeline(self, user_cmds: list, logger: Logger, destination=None) -> tuple[bool, object]:
+        try:
+            reused = self.connect(logger)
+            replies = [None] * len(user_cmds)
+            outstanding = {}  # request id -> (index in user_cmds, Trace, start time)
+            sent = 0
+            while sent < len(user_cmds) or outstanding:
+                while sent < len(user_cmds) and len(outstanding) < self.window:
+                    self.next_id += 1
+                    trace = Trace(tracing.new_id(), 'client', tracing.TRACE | tracing.RETURN) if self.tracer is not None else None
+                    start_time = time.perf_counter()
+                    if trace is None:
+                        OK_send, msg = self.transport.send(self.conn, user_cmds[sent], self.next_id)
+                    else:
+                        OK_send, msg = self.transport.send(self.conn, user_cmds[sent], self.next_id, None, trace.trace_id, trace.flags)
+                    logger.log(f"Client sent [{msg}] to Master [{self.master_ip}]-[{self.master_port}].")
+                    if not OK_send:
+                        self.close()
+                        if reused and sent == 0:
+                            logger.log("Connection to Master is stale, reconnect.")
+                            return self.pipeline(user_cmds, logger, destination)
+                        return False, msg
+                    logger.log(f"Client sent [{summary(user_cmds[sent])}] to Master [{self.master_ip}]-[{self.master_port}].", level='debug')
+                    if trace is not None:
+                        trace.add_timing('client', msg, 'encode', 'send')
+                    outstanding[self.next_id] = (sent, trace, start_time)
+                    sent += 1
+
+                OK_receive, message_from_master, msg = self.transport.receive(self.conn, destination)
+                logger.log(msg)
+                if not OK_receive:
+                    self.close()
+                    if reused and not any(reply is not None for reply in replies):
+                        logger.log("Connection to Master is stale, reconnect.")
+                        return self.pipeline(user_cmds, logger, destination)
+                    return False, msg
+                request = outstanding.pop(msg.request_id, None)
+                if request is None:
+                    logger.log(f"Drop reply with unknown request id [{msg.request_id}].")
+                    self.transport.release(message_from_master)
+                    continue
+                logger.log(message_from_master, level='debug')
+                index, trace, start_time = request
+                replies[index] = message_from_master
+                if trace is not None:
+                    trace.add_timing('client', msg, 'decode', 'recv')
+                    trace.extend(msg.spans)
+                    trace.add('client.total', time.perf_counter() - start_time)
+                    self.tracer.finish(trace)
+
+            return True, replies
+
         except Exception as e:
-            new_msg = f"[{now_time}] {msg} {e}\n"
-            print(new_msg)
-            return False
+            logger.log(e, level='error')
+            self.close()
+            return False, str(e)
 
 
-class ClientSocket:
-    def __init__(self, master_ip: str, master_port: int, buffer: int):
+class ClientAPI:
+    # Operations shared by SyncClient and AsyncClient: each one builds the command and hands it to call(),
+    # which returns (ok, result, msg) directly for SyncClient and as an awaitable for AsyncClient.
+    def __init__(self, name: str, logger: Logger=None, destination=None, trace: bool=False):
+        self.name = name
+        self.logger = logger if logger is not None else Logger('client', echo=False)
+        self.destination = destination  # called with (skeleton, dtype, shape) to place large arrays, see Transport.allocate
+        self.tracer = Tracer('client') if trace else None  # per-hop spans of every request, last ones in tracer.recent
+
+
+    def command(self, opt: str, *fields) -> str:
+        for field in fields:
+            if '#' in str(field):
+                raise ValueError(f"Field [{field}] must not contain '#'.")
+        return '#'.join([self.name, opt] + [str(field) for field in fields])
+
+
+    def search_fields(self, K: int, nprobe: int=None, efSearch: int=None) -> list:
+        if int(K) <= 0:
+            raise ValueError(f"Expect K to be a positive int, but got [{K}].")
+        params = ','.join(f"{param}={int(value)}" for param, value in [('nprobe', nprobe), ('efSearch', efSearch)] if value is not None)
+        return [int(K), params] if params else [int(K)]
+
+
+    def vector_hash(self, vector: np.array) -> str:
+        return hashlib.sha256(np.asarray(vector).flatten().tobytes()).hexdigest()
+
+
+    def parse(self, OK_request: bool, message_from_master) -> tuple[bool, object, str]:
+        if not OK_request:
+            return False, None, str(message_from_master)
+        if isinstance(message_from_master, tuple):
+            text, result = message_from_master
+        else:
+            text, result = message_from_master, None
+        status, _, msg = text.partition('#')
+        return status == f"{True}", result, msg
+
+
+    def upload(self, key: str, vector: np.array):
+        return self.call(lambda: (self.command('upload', key), np.asarray(vector)))
+
+
+    def bulk_upload(self, keys: list, vectors: np.array):
+        def build():
+            stacked = np.asarray(vectors)
+            if len(keys) != len(stacked):
+                raise ValueError(f"Got [{len(keys)}] keys for [{len(stacked)}] vectors.")
+            for key in keys:
+                self.command('bulkUpload', key)
+            return self.command('bulkUpload'), ([str(key) for key in keys], stacked)
+        return self.call(build)
+
+
+    def get(self, key: str):
+        return self.call(lambda: self.command('find', key))
+
+
+    def delete(self, key: str):
+        return self.call(lambda: self.command('delete', key))
+
+
+    def modify(self, key: str, vector: np.array, cmd: str):
+        def build():
+            if 'TARGET_VECTOR' not in cmd or 'INPUT_VECTOR' not in cmd:
+                raise ValueError(f"No 'TARGET_VECTOR' or 'INPUT_VECTOR' is found in [{cmd}].")
+            return self.command('modify', key, cmd), np.asarray(vector)
+        return self.call(build)
+
+
+    def find_hash(self, target):
+        return self.call(lambda: self.command('hash', target if isinstance(target, str) else self.vector_hash(target)))
+
+
+    def topk(self, vector: np.array, K: int, nprobe: int=None, efSearch: int=None):
+        return self.call(lambda: (self.command('topK', *self.search_fields(K, nprobe, efSearch)), np.asarray(vector)))
+
+
+    def batch_topk(self, vectors: np.array, K: int, nprobe: int=None, efSearch: int=None):
+        def build():
+            stacked = np.asarray(vectors)
+            if stacked.ndim < 2:
+                raise ValueError(f"Expect stacked vectors of shape (n, ...), but got shape [{stacked.shape}].")
+            return self.command('batchTopK', *self.search_fields(K, nprobe, efSearch)), stacked
+        return self.call(build)
+
+
+    def stats(self):
+        return self.call(lambda: self.command('stats'))
+
+
+class SyncClient(ClientAPI):
+    def __init__(self, name: str, master_ip: str, master_port: int, max_connections: int=4, window: int=2, timeout: float=30.0,
+        logger: Logger=None, destination=None, trace: bool=False):
+        super().__init__(name, logger, destination, trace)
         self.master_ip = master_ip
         self.master_port = master_port
-        self.buffer = buffer
+        self.max_connections = max_connections  # threads that may talk to Master at once
+        self.window = window  # pipelined requests per connection, max_connections * window within Master per-client limit
+        self.timeout = timeout
+        self.limit = threading.BoundedSemaphore(max_connections)
+        self.sockets = queue.LifoQueue()  # idle ClientSocket, most recently used first
+
+
+    def __enter__(self):
+        return self
 
 
-    def run(self, msg_bytes: bytes, logger: Logger) -> tuple[bool, str]:
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+    def checkout(self) -> ClientSocket:
         try:
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((self.master_ip, self.master_port))
-            logger.log(f"Client connected to Master [{self.master_ip}]-[{self.master_port}].")
+            return self.sockets.get_nowait()
+        except queue.Empty:
+            return ClientSocket(self.master_ip, self.master_port, 1024, self.window, self.timeout, self.tracer)
 
-            msg_len = len(msg_bytes)
-            len_to_master = f"len#{msg_len}"
-            client_socket.send(pickle.dumps(len_to_master))
-            logger.log(f"Client sent [{len_to_master}] to Master [{self.master_ip}]-[{self.master_port}].")
-            time.sleep(0.1)
 
-            client_socket.sendall(msg_bytes)
-            logger.log(f"Client sent [{pickle.loads(msg_bytes)}] to Master [{self.master_ip}]-[{self.master_port}].")
+    def pipeline(self, user_cmds: list) -> tuple[bool, object]:
+        with self.limit:
+            client_socket = self.checkout()
+            try:
+                return client_socket.pipeline(user_cmds, self.logger, self.destination)
+            finally:
+                self.sockets.put(client_socket)
 
-            data_from_master = client_socket.recv(self.buffer)
-            message_from_master = pickle.loads(data_from_master)
-            logger.log(message_from_master)
-            msg_len = int(message_from_master.split('#')[1])
 
-            data_from_master = client_socket.recv(msg_len)
-            message_from_master = pickle.loads(data_from_master)
-            logger.log(message_from_master)
+    def request(self, user_cmd) -> tuple[bool, object]:
+        OK_request, replies = self.pipeline([user_cmd])
+        if not OK_request:
+            return False, replies
+        return True, replies[0]
 
-            client_socket.close()
 
-            return True, message_from_master
+    def call(self, build) -> tuple[bool, object, str]:
+        try:
+            return self.parse(*self.request(build()))
 
         except Exception as e:
-            logger.log(e)
-            return False, str(e)
+            self.logger.log(e, level='error')
+            return False, None, str(e)
+
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.sockets.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class AsyncChannel:
+    def __init__(self, transport: Transport, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, destination, logger: Logger,
+        tracer: Tracer=None):
+        self.transport = transport
+        self.reader = reader
+        self.writer = writer
+        self.destination = destination
+        self.tracer = tracer
+        self.send_lock = asyncio.Lock()  # one frame on the wire at a time
+        self.pending = {}  # request id -> asyncio.Future
+        self.next_id = 0
+        self.closed = False
+        self.reading = asyncio.get_running_loop().create_task(self.read(logger))
+
+
+    async def read(self, logger: Logger) -> None:
+        while True:
+            OK_receive, message_from_master, header = await self.transport.receive_async(self.reader, self.destination)
+            if not OK_receive:
+                self.close(f"Connection to Master lost: [{header}].")
+                return
+            reply = self.pending.pop(header.request_id, None)
+            if reply is None or reply.done():
+                logger.log(f"Drop late reply [{header.request_id}] from Master.")
+                self.transport.release(message_from_master)
+                continue
+            reply.set_result((True, message_from_master, header))
+
+
+    def close(self, reason: str) -> None:
+        self.closed = True
+        pending, self.pending = self.pending, {}
+        for reply in pending.values():
+            if not reply.done():
+                reply.set_result((False, reason, None))
+        self.writer.close()
+
+
+    async def request(self, user_cmd, timeout: float) -> tuple[bool, object, bool]:
+        if self.closed:
+            return False, "Connection to Master is closed.", False
+        self.next_id += 1
+        request_id = self.next_id
+        reply = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = reply
+        trace = Trace(tracing.new_id(), 'client', tracing.TRACE | tracing.RETURN) if self.tracer is not None else None
+        trace_id, flags = (trace.trace_id, trace.flags) if trace is not None else (0, 0)
+        start_time = time.perf_counter()
+
+        async with self.send_lock:
+            OK_send, msg = await self.transport.send_async(self.writer, user_cmd, request_id, None, trace_id, flags)
+        if not OK_send:
+            self.close(msg)
+            return False, msg, False
+        if trace is not None:
+            trace.add_timing('client', msg, 'encode', 'send')
+
+        try:
+            OK_request, message_from_master, header = await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            return False, f"Master timed out after [{timeout}] seconds.", True
+        if trace is not None and header is not None:
+            trace.add_timing('client', header, 'decode', 'recv')
+            trace.extend(header.spans)
+            trace.add('client.total', time.perf_counter() - start_time)
+            self.tracer.finish(trace)
+        return OK_request, message_from_master, True
+
+
+class AsyncClient(ClientAPI):
+    def __init__(self, name: str, master_ip: str, master_port: int, max_connections: int=1, max_inflight: int=8, timeout: float=30.0,
+        logger: Logger=None, destination=None, trace: bool=False):
+        super().__init__(name, logger, destination, trace)
+        self.master_ip = master_ip
+        self.master_port = master_port
+        self.transport = Transport(1024)
+        self.max_connections = max_connections  # multiplexed connections to Master
+        self.timeout = timeout
+        self.limit = asyncio.Semaphore(max_inflight)  # requests in flight, keep within Master per-client limit
+        self.channels = []
+        self.turn = 0
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+    async def channel(self) -> AsyncChannel:
+        self.channels = [channel for channel in self.channels if not channel.closed]
+        self.turn += 1
+        if len(self.channels) >= self.max_connections:
+            return self.channels[self.turn % len(self.channels)]
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.master_ip, self.master_port), self.timeout)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.logger.log(f"Client connected to Master [{self.master_ip}]-[{self.master_port}].")
+        channel = AsyncChannel(self.transport, reader, writer, self.destination, self.logger, self.tracer)
+        self.channels.append(channel)
+        return channel
+
+
+    async def request(self, user_cmd) -> tuple[bool, object]:
+        async with self.limit:
+            OK_request, message_from_master, sent = await (await self.channel()).request(user_cmd, self.timeout)
+            if not OK_request and not sent:
+                self.logger.log(f"Connection to Master is stale: [{message_from_master}], reconnect.")
+                OK_request, message_from_master, sent = await (await self.channel()).request(user_cmd, self.timeout)
+            return OK_request, message_from_master
+
+
+    async def call(self, build) -> tuple[bool, object, str]:
+        try:
+            return self.parse(*await self.request(build()))
+
+        except Exception as e:
+            self.logger.log(e, level='error')
+            return False, None, str(e)
+
+
+    async def close(self) -> None:
+        channels, self.channels = self.channels, []
+        for channel in channels:
+            channel.close("Client closed.")
+            channel.reading.cancel()
 
 
 class Client:
@@ -97,22 +402,23 @@ class Client:
         self.master_ip = master_ip
         self.master_port = master_port
 
-        self.logger = Logger('client')
+        self.logger = Logger('client', echo=False)
 
-        self.clientsocket = ClientSocket(self.master_ip, self.master_port, 1024)
-        self.logger.log("Create ClientSocket successfully.")
+        self.api = SyncClient(self.name, self.master_ip, self.master_port, max_connections=1, timeout=None,
+            logger=self.logger, destination=self.download)
+        self.logger.log("Create SyncClient successfully.")
 
 
     def threads(self, ) -> bool:
         try:
             self.logger.log(f"Start Client thread successfully.")
-            self.logger.log(f"Start ClientSocket thread [{self.clientsocket}] successfully.")
+            self.logger.log(f"Start SyncClient [{self.api}] successfully.")
 
             self.run()
 
             return True
         except Exception as e:
-            self.logger.log(e)
+            self.logger.log(e, level='error')
             return False
 
 
@@ -128,7 +434,7 @@ class Client:
             if input_path[0] == '/':
                 if os.path.exists(input_path):
                     if input_path[-4:] == '.npy':
-                        vector = np.load(input_path)
+                        vector = np.load(input_path, mmap_mode='r')
                         full_path = input_path
                     else:
                         return False, '', None, f"Expect to input .npy file, but got [.{input_path.split('.')[-1]}] file."
@@ -139,7 +445,7 @@ class Client:
                 abs_target_vector_path = os.path.join(pwd, input_path)
                 if os.path.exists(abs_target_vector_path):
                     if abs_target_vector_path[-4:] == '.npy':
-                        vector = np.load(abs_target_vector_path)
+                        vector = np.load(abs_target_vector_path, mmap_mode='r')
                         full_path = abs_target_vector_path
                     else:
                         return False, '', None, f"Expect to input .npy file, but got [.{abs_target_vector_path.split('.')[-1]}] file."
@@ -152,6 +458,43 @@ class Client:
             return False, '', None, str(e)
 
 
+    def bulk_upload_vector(self) -> tuple[bool, list, np.array, str]:
+        try:
+            input_path = input("Enter stacked vectors (.npy of shape (n, ...)) or a directory of .npy files: ")
+            input_path = str(input_path)
+            if input_path[0] != '/':
+                input_path = os.path.join(os.getcwd(), input_path)
+            if not os.path.exists(input_path):
+                return False, [], None, f"[{input_path}] is invalid."
+
+            if os.path.isdir(input_path):
+                file_list = sorted(file for file in os.listdir(input_path) if file[-4:] == '.npy')
+                if not file_list:
+                    return False, [], None, f"No .npy file is found in [{input_path}]."
+                key_list = [file[:-4] for file in file_list]
+                vectors = np.stack([np.load(os.path.join(input_path, file)) for file in file_list])
+
+            elif input_path[-4:] == '.npy':
+                vectors = np.load(input_path, mmap_mode='r')
+                key_path = input("Enter key file with one key per line, or a key prefix: ")
+                key_path = str(key_path)
+                if os.path.isfile(key_path):
+                    with open(key_path, 'r') as file:
+                        key_list = [line.strip() for line in file if line.strip()]
+                else:
+                    key_list = [f"{key_path}{num}" for num in range(len(vectors))]
+                if len(key_list) != len(vectors):
+                    return False, [], None, f"Got [{len(key_list)}] keys for [{len(vectors)}] vectors."
+
+            else:
+                return False, [], None, f"Expect to input .npy file or directory, but got [{input_path}]."
+
+            return True, key_list, vectors, f"[{self.name}] upload [{len(key_list)}] vectors of shape [{vectors.shape[1:]}] in bulk."
+
+        except Exception as e:
+            return False, [], None, str(e)
+
+
     def delete_vector(self) -> tuple[bool, str, str]:
         try:
             target_key = input("Enter key of target vector: ")
@@ -174,7 +517,7 @@ class Client:
             if input_path[0] == '/':
                 if os.path.exists(input_path):
                     if input_path[-4:] == '.npy':
-                        vector = np.load(input_path)
+                        vector = np.load(input_path, mmap_mode='r')
                     else:
                         return False, '', None, '', f"Expect to input .npy file, but got [.{input_path.split('.')[-1]}] file."
                 else:
@@ -184,7 +527,7 @@ class Client:
                 abs_target_vector_path = os.path.join(pwd, input_path)
                 if os.path.exists(abs_target_vector_path):
                     if abs_target_vector_path[-4:] == '.npy':
-                        vector = np.load(abs_target_vector_path)
+                        vector = np.load(abs_target_vector_path, mmap_mode='r')
                     else:
                         return False, '', None, '', f"Expect to input .npy file, but got [.{abs_target_vector_path.split('.')[-1]}] file."
                 else:
@@ -255,7 +598,7 @@ class Client:
             return False, '', str(e)
 
 
-    def topK_fn(self, vector_path: str) -> tuple[bool, np.array, str]:
+    def topK_fn(self, vector_path: str) -> tuple[bool, np.array, object]:
         try:
             if os.path.exists(vector_path):
                 if vector_path[-4:] == '.npy':
@@ -263,13 +606,21 @@ class Client:
                     try:
                         K = int(K)
                     except Exception as e:
-                        self.logger.log(e)
+                        self.logger.log(e, level='error')
                         return False, None, ''
 
                     if K > 0:
                         vector = np.load(vector_path)
                         self.logger.log(f"[{self.name}] amin to find top-[{K}] vectors similar to [{vector_path}].")
-                        return True, vector, str(K)
+                        params = input("Enter search params (Example: nprobe=16,efSearch=128), empty for default: ")
+                        params = str(params).replace(' ', '')
+                        search = {'nprobe': None, 'efSearch': None}
+                        for item in [item for item in params.split(',') if item]:
+                            param, _, value = item.partition('=')
+                            if param not in search:
+                                return False, None, f"Unknown search param [{param}], expect nprobe or efSearch."
+                            search[param] = int(value)
+                        return True, vector, (K, search['nprobe'], search['efSearch'])
                     else:
                         return False, None, f"Expect to int a positive int, but [{K}] is not positive."
                 else:
@@ -281,7 +632,7 @@ class Client:
             return False, None, str(e)
 
 
-    def topK(self) -> tuple[bool, np.array, str]:
+    def topK(self) -> tuple[bool, np.array, object]:
         try:
             target_vector_path = input("Enter target vector path: ")
             if target_vector_path[0] == '/':
@@ -297,6 +648,20 @@ class Client:
             return False, None, str(e)
 
 
+    def batch_topK(self) -> tuple[bool, np.array, object]:
+        try:
+            target_vector_path = input("Enter path of stacked query vectors (.npy of shape (n, ...)): ")
+            if target_vector_path[0] != '/':
+                target_vector_path = os.path.join(os.getcwd(), target_vector_path)
+            OK_topK_fn, vectors, msg = self.topK_fn(target_vector_path)
+            if OK_topK_fn and vectors.ndim < 2:
+                return False, None, f"Expect stacked vectors of shape (n, ...), but got shape [{vectors.shape}]."
+            return OK_topK_fn, vectors, msg
+
+        except Exception as e:
+            return False, None, str(e)
+
+
     def help(self) -> bool:
         try:
             self.logger.log("Show help list.")
@@ -306,11 +671,13 @@ class Client:
             print("(4) Look up target vector.")
             print("(5) Find target hash vector.")
             print("(6) Find top-K similar vectors.")
-            print("(7) Help")
-            print("(8) Quit.")
+            print("(7) Find top-K similar vectors for a batch of queries.")
+            print("(8) Upload numpy vectors in bulk.")
+            print("(9) Help")
+            print("(10) Quit.")
             return True
         except Exception as e:
-            self.logger.log(e)
+            self.logger.log(e, level='error')
             return False
 
 
@@ -322,75 +689,83 @@ class Client:
             return False, str(e)
 
 
-    def get_input(self) -> tuple[bool, bytes]:
+    def get_input(self) -> tuple[bool, object]:
         try:
             user_input = input("Choose operation, enter number: ")
             try:
                 user_input = int(user_input)
             except Exception as e:
-                self.logger.log(e)
+                self.logger.log(e, level='error')
                 msg = f"Expect to input int, but got [{user_input}]"
-                return False, pickle.dumps(msg)
+                return False, msg
 
-            if 1 <= user_input <= 8:
+            if 1 <= user_input <= 10:
                 if user_input == 1:
                     self.logger.log(f"[{self.name}] input [1] to upload new vector.")
                     signal, key, vector, msg = self.upload_vector()
                     self.logger.log(msg)
 
-                    cmd_vector = (f"{self.name}#upload#{key}", vector)
-                    cmd_vector_stream = pickle.dumps(cmd_vector)
-                    user_cmd = cmd_vector_stream
+                    user_cmd = ('upload', (key, vector))
 
                 elif user_input == 2:
                     self.logger.log(f"[{self.name}] input [2] to delete target vector.")
                     signal, key, msg = self.delete_vector()
                     self.logger.log(msg)
 
-                    user_cmd = pickle.dumps(f"{self.name}#delete#{key}")
+                    user_cmd = ('delete', (key,))
 
                 elif user_input == 3:
                     self.logger.log(f"[{self.name}] input [3] to modify target vector.")
                     signal, key, new_vector, cmd, msg = self.modify_vector()
                     self.logger.log(msg)
 
-                    cmd_vector = (f"{self.name}#modify#{key}#{cmd}", new_vector)
-                    cmd_vector_stream = pickle.dumps(cmd_vector)
-                    user_cmd = cmd_vector_stream
+                    user_cmd = ('modify', (key, new_vector, cmd))
 
                 elif user_input == 4:
                     self.logger.log(f"[{self.name}] input [4] to find target vector.")
                     signal, key, msg = self.find_vector()
                     self.logger.log(msg)
 
-                    user_cmd = pickle.dumps(f"{self.name}#find#{key}")
+                    user_cmd = ('get', (key,))
 
                 elif user_input == 5:
                     self.logger.log(f"[{self.name}] input [5] to find hash vector.")
                     signal, hash_value, msg = self.find_hash()
                     self.logger.log(msg)
 
-                    user_cmd = pickle.dumps(f"{self.name}#hash#{hash_value}")
+                    user_cmd = ('find_hash', (hash_value,))
 
                 elif user_input == 6:
                     self.logger.log(f"[{self.name}] input [6] to find top-K.")
                     signal, vector, msg = self.topK()
                     self.logger.log(msg)
 
-                    cmd_vector = (f"{self.name}#topK#{msg}", vector)
-                    cmd_vector_stream = pickle.dumps(cmd_vector)
-                    user_cmd = cmd_vector_stream
+                    user_cmd = ('topk', (vector,) + msg) if signal else msg
 
                 elif user_input == 7:
-                    self.logger.log(f"[{self.name}] input [7] for help.")
-                    signal = self.help()
-                    return signal, pickle.dumps('help')
+                    self.logger.log(f"[{self.name}] input [7] to find top-K in batch.")
+                    signal, vectors, msg = self.batch_topK()
+                    self.logger.log(msg)
+
+                    user_cmd = ('batch_topk', (vectors,) + msg) if signal else msg
 
                 elif user_input == 8:
-                    self.logger.log(f"[{self.name}] input [8] to quit.")
+                    self.logger.log(f"[{self.name}] input [8] to upload vectors in bulk.")
+                    signal, key_list, vectors, msg = self.bulk_upload_vector()
+                    self.logger.log(msg)
+
+                    user_cmd = ('bulk_upload', (key_list, vectors))
+
+                elif user_input == 9:
+                    self.logger.log(f"[{self.name}] input [9] for help.")
+                    signal = self.help()
+                    return signal, 'help'
+
+                elif user_input == 10:
+                    self.logger.log(f"[{self.name}] input [10] to quit.")
                     signal, msg = self.quit()
                     self.logger.log(msg)
-                    return signal, pickle.dumps('quit')
+                    return signal, 'quit'
 
                 return signal, user_cmd
 
@@ -398,11 +773,26 @@ class Client:
                 msg = f"No operation mapping to input [{user_input}] was selected."
                 self.logger.log(msg)
                 print(msg)
-                return False, pickle.dumps(msg)
+                return False, msg
 
         except Exception as e:
-            self.logger.log(e)
-            return False, pickle.dumps(str(e))
+            self.logger.log(e, level='error')
+            return False, str(e)
+
+
+    def make_download(self) -> None:
+        if not os.path.exists('download'):
+            os.mkdir('download')
+            self.logger.log("make directory 'download' successful.")
+
+
+    def download(self, skeleton, data_dtype: str, data_shape: tuple) -> np.array:
+        if not isinstance(skeleton, tuple) or not skeleton[0].startswith(f"{True}#Return ["):
+            return None
+        key = skeleton[0][len(f"{True}#Return ["):].split(']')[0]
+        self.make_download()
+        save_path = os.path.join('download', f"{key}.npy")
+        return np.lib.format.open_memmap(save_path, mode='w+', dtype=np.dtype(data_dtype), shape=data_shape)
 
 
     def run(self) -> bool:
@@ -410,41 +800,65 @@ class Client:
             print("WELCOME TO AZU")
             self.help()
             while True:
-                OK_get_input, msg_bytes = self.get_input()
+                OK_get_input, user_cmd = self.get_input()
 
-                if OK_get_input and pickle.loads(msg_bytes) == 'quit':
+                if OK_get_input and user_cmd == 'quit':
+                    self.api.close()
                     return True
-                elif OK_get_input and pickle.loads(msg_bytes) == 'help':
+                elif OK_get_input and user_cmd == 'help':
                     continue
                 elif OK_get_input:
-                    OK_run, msg_from_master = self.clientsocket.run(msg_bytes, self.logger)
-                    print(msg_from_master)
-                    if isinstance(msg_from_master, tuple):
-                        vector = msg_from_master[1]
-                        key = pickle.loads(msg_bytes).split('#')[2]
-                        if not os.path.exists('download'):
-                            os.mkdir('download')
-                            self.logger.log("make directory 'download' successful.")
+                    opt, args = user_cmd
+                    OK_run, result, msg = getattr(self.api, opt)(*args)
+                    print(f"{OK_run}#{msg}")
+                    if not OK_run or result is None:
+                        continue
+                    if opt == 'batch_topk':
+                        for num, (keys, distances) in enumerate(result):
+                            print(f"Query [{num}]: keys {keys} distances {distances}")
+                    elif opt == 'topk':
+                        keys, distances = result
+                        print(f"keys {keys} distances {distances}")
+                    elif opt in ['upload', 'bulk_upload', 'delete', 'modify']:
+                        for node, (OK_node, node_msg) in result.items():
+                            if opt == 'bulk_upload' and isinstance(node_msg, tuple):
+                                print(f"Slave [{node}]: {node_msg[0]}")
+                                for key, OK_create, msg in node_msg[1]:
+                                    if not OK_create:
+                                        print(f"Slave [{node}]: [{key}] {msg}")
+                            else:
+                                print(f"Slave [{node}]: {node_msg}")
+                    elif opt == 'find_hash':
+                        print(f"key [{result}]")
+                    elif opt == 'get':
+                        print(result)
+                        key = args[0]
                         save_path = os.path.join('download', f"{key}.npy")
-                        np.save(save_path, vector)
+                        if isinstance(result, np.memmap) and result.filename == os.path.abspath(save_path):
+                            result.flush()
+                        else:
+                            self.make_download()
+                            np.save(save_path, result)
                         msg = f"Save download vector [{key}] to file [{save_path}]."
                         self.logger.log(msg)
                         print(msg)
                 else:
-                    print(pickle.loads(msg_bytes))
+                    print(user_cmd)
 
             return True
         except Exception as e:
             print(e)
-            self.logger.log(e)
+            self.logger.log(e, level='error')
             return False
 
 
 
 if __name__ == '__main__':
-    name = 'guest'  # ['admin', 'guest', 'other']
-    master_ip = 'master_IP'
-    master_port = 65530
-    client = Client(name, master_ip, master_port)
-    client.threads()
+    parser = argparse.ArgumentParser(description='AZU interactive client.')
+    parser.add_argument('--name', default='guest', help='admin, guest or any other user name')
+    parser.add_argument('--master-ip', default='master_IP')
+    parser.add_argument('--master-port', type=int, default=65530)
+    args = parser.parse_args()
 
+    client = Client(args.name, args.master_ip, args.master_port)
+    client.threads()
@@ -0,0 +1,151 @@
+import numpy as np
+import datetime
+import os
+import shutil
+import sys
+import zlib
+import time
+import queue
+import atexit
+import threading
+
+
+def summary(obj, max_chars: int=256, max_items: int=8) -> str:
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            head = b''
+        elif obj.flags.c_contiguous:
+            head = obj.reshape(-1)[:1024].tobytes()
+        else:
+            head = obj.flat[:1024].tobytes()
+        return f"ndarray(dtype={obj.dtype.str}, shape={obj.shape}, crc32={zlib.crc32(head):08x})"
+    if isinstance(obj, (tuple, list)):
+        items = [summary(item, max_chars, max_items) for item in obj[:max_items]]
+        if len(obj) > max_items:
+            items.append(f"... +{len(obj) - max_items} more")
+        text = ', '.join(items)
+        return f"({text})" if isinstance(obj, tuple) else f"[{text}]"
+    if isinstance(obj, dict):
+        items = [f"{summary(key, max_chars, max_items)}: {summary(value, max_chars, max_items)}" for key, value in list(obj.items())[:max_items]]
+        if len(obj) > max_items:
+            items.append(f"... +{len(obj) - max_items} more")
+        return f"{{{', '.join(items)}}}"
+    text = obj if isinstance(obj, str) else repr(obj)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+    return text
+
+
+class Logger:
+    levels = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+    def __init__(self, name: str, level: str='info', echo: bool=True, max_bytes: int=64 * 1024 * 1024, backups: int=5,
+        max_queue: int=65536, flush_interval: float=0.2, max_chars: int=4096):
+        self.name = name
+        self.log_file = f'log/{name}_new.log'
+        self.level = self.levels[level]  # messages below this level are dropped before they are queued
+        self.echo = echo  # also print to stdout, on for master and slave, off for client
+        self.max_bytes = max_bytes  # rotate the log file past this size
+        self.backups = backups  # rotated files kept as <log_file>.1 ... <log_file>.N
+        self.flush_interval = flush_interval  # seconds a message may wait in the queue
+        self.max_chars = max_chars  # longer messages are truncated
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0  # messages lost because the queue was full
+        now_time = self.get_time()
+
+        if not os.path.exists('log'):
+            os.mkdir('log')
+        if not os.path.exists(self.log_file):
+            with open('log/last_open_time.log', 'w') as file:
+                file.write(now_time)
+        else:
+            with open('log/last_open_time.log', 'r') as file:
+                last_open_time = file.readline()
+                shutil.move(self.log_file, f'log/{name}_{last_open_time}.log')
+            with open('log/last_open_time.log', 'w') as file:
+                file.write(now_time)
+        self.file = open(self.log_file, 'w')
+        msg = f"[{now_time}] {name} starts\n"
+        self.file.write(msg)
+        self.file.flush()
+        if self.echo:
+            print(msg)
+
+        self.writer = threading.Thread(target=self.write)
+        self.writer.daemon = True
+        self.writer.start()
+        atexit.register(self.flush)
+
+
+    def get_time(self) -> str:
+        now_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return str(now_time)
+
+
+    def enabled(self, level: str) -> bool:
+        return self.levels[level] >= self.level
+
+
+    def log(self, msg, level: str='info') -> bool:
+        if self.levels[level] < self.level:
+            return True
+        if not isinstance(msg, str):
+            msg = summary(msg, self.max_chars)
+        elif len(msg) > self.max_chars:
+            msg = summary(msg, self.max_chars)
+
+        try:
+            self.queue.put_nowait((time.time(), level, msg))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+
+    def format(self, record: tuple) -> str:
+        created, level, msg = record
+        now_time = datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        if level == 'info':
+            return f"[{now_time}] {msg}\n"
+        return f"[{now_time}] [{level.upper()}] {msg}\n"
+
+
+    def rotate(self) -> None:
+        self.file.close()
+        for num in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.log_file}.{num}"):
+                os.replace(f"{self.log_file}.{num}", f"{self.log_file}.{num + 1}")
+        if self.backups > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        self.file = open(self.log_file, 'w')
+
+
+    def write(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < 4096:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+
+            text = ''.join(self.format(record) for record in batch)
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                text += self.format((time.time(), 'warning', f"Drop [{dropped}] log message(s), queue is full."))
+            try:
+                self.file.write(text)
+                self.file.flush()
+                if self.echo:
+                    sys.stdout.write(text)
+                if self.file.tell() >= self.max_bytes:
+                    self.rotate()
+            except Exception as e:
+                print(f"{text} {e}")
+            for _ in batch:
+                self.queue.task_done()
+
+
+    def flush(self) -> None:
+        self.queue.join()
@@ -1,55 +1,282 @@
+import argparse
 import socket
 import numpy as np
 import threading
-import datetime
 import time
-import os
-import pickle
-import shutil
-
-
-class Logger:
-    def __init__(self, name: str):
-        self.log_file = f'log/{name}_new.log'
-        now_time = self.get_time()
-
-        if not os.path.exists('log'):
-            os.mkdir('log')
-        if not os.path.exists(self.log_file):
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        else:
-            with open('log/last_open_time.log', 'r') as file:
-                last_open_time = file.readline()
-                shutil.move(self.log_file, f'log/{name}_{last_open_time}.log')
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        with open(self.log_file, 'w') as file:
-            msg = f"[{now_time}] {name} starts\n"
-            file.write(msg)
-            print(msg)
-
-    
-    def get_time(self) -> str:
-        now_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return str(now_time)
-
-
-    def log(self, msg) -> bool:
-        now_time = self.get_time()
-        if not isinstance(msg, str):
-            msg = str(msg)
+import heapq
+import hashlib
+import bisect
+import random
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from transport import Transport
+from logger import Logger, summary
+from metrics import Metrics
+import tracing
+from tracing import Trace, Tracer
+
+
+class HashRing:
+    def __init__(self, nodes: list, replication: int=2, virtual_nodes: int=64):
+        self.nodes = list(nodes)
+        self.replication = max(1, min(replication, len(self.nodes)))
+        self.virtual_nodes = virtual_nodes
+
+        points = sorted((self.position(f"{node}#{num}"), node) for node in self.nodes for num in range(virtual_nodes))
+        self.positions = [position for position, _ in points]
+        self.owners = [node for _, node in points]
+        self.arcs = sorted(set(self.walk(num) for num in range(len(self.owners))))
+
+
+    def position(self, value: str) -> int:
+        return int(hashlib.sha256(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+    def walk(self, start: int) -> tuple:
+        replicas = []
+        for num in range(len(self.owners)):
+            node = self.owners[(start + num) % len(self.owners)]
+            if node not in replicas:
+                replicas.append(node)
+                if len(replicas) == self.replication:
+                    break
+        return tuple(replicas)
+
+
+    def replicas(self, key: str) -> tuple:
+        if not self.owners:
+            return ()
+        start = bisect.bisect(self.positions, self.position(key)) % len(self.owners)
+        return self.walk(start)
+
+
+    def cover(self, alive: list, covered: list=()) -> tuple[list, int]:
+        uncovered = [arc for arc in self.arcs if not any(node in arc for node in covered)]
+        chosen = []
+        while uncovered:
+            counts = {}
+            for arc in uncovered:
+                for node in arc:
+                    if node in alive:
+                        counts[node] = counts.get(node, 0) + 1
+            if not counts:
+                break
+            best = max(counts.values())
+            node = random.choice([node for node, count in counts.items() if count == best])
+            chosen.append(node)
+            uncovered = [arc for arc in uncovered if node not in arc]
+        return chosen, len(uncovered)
+
+
+class RoutingTable:
+    def __init__(self):
+        self.key_nodes = {}  # key -> set of slaves holding it
+        self.key_hashes = {}  # key -> data hash
+        self.hash_keys = {}  # data hash -> key
+        self.lock = threading.Lock()
+
+
+    def put_locked(self, node: str, key: str, data_hash: str) -> None:
+        old_hash = self.key_hashes.get(key)
+        if old_hash is not None and old_hash != data_hash and self.hash_keys.get(old_hash) == key:
+            del self.hash_keys[old_hash]
+        if data_hash is not None:
+            self.key_hashes[key] = data_hash
+            self.hash_keys[data_hash] = key
+        self.key_nodes.setdefault(key, set()).add(node)
+
+
+    def remove_locked(self, node: str, key: str) -> None:
+        nodes = self.key_nodes.get(key)
+        if nodes is None:
+            return
+        nodes.discard(node)
+        if not nodes:
+            del self.key_nodes[key]
+            data_hash = self.key_hashes.pop(key, None)
+            if data_hash is not None and self.hash_keys.get(data_hash) == key:
+                del self.hash_keys[data_hash]
+
+
+    def put(self, node: str, key: str, data_hash: str) -> None:
+        with self.lock:
+            self.put_locked(node, key, data_hash)
+
+
+    def remove(self, node: str, key: str) -> None:
+        with self.lock:
+            self.remove_locked(node, key)
+
+
+    def load(self, node: str, key_list: list, data_hashes: list) -> None:
+        with self.lock:
+            for key in [key for key, nodes in self.key_nodes.items() if node in nodes]:
+                self.remove_locked(node, key)
+            for key, data_hash in zip(key_list, data_hashes):
+                self.put_locked(node, key, data_hash)
+
+
+    def nodes(self, key: str) -> list:
+        with self.lock:
+            return sorted(self.key_nodes.get(key, ()))
+
+
+    def key_of(self, data_hash: str) -> str:
+        with self.lock:
+            return self.hash_keys.get(data_hash)
+
+
+class SlaveChannel:
+    def __init__(self, node: str, conn: socket.socket, transport: Transport, logger: Logger):
+        self.node = node
+        self.conn = conn
+        self.transport = transport
+        self.send_lock = threading.Lock()  # one frame on the wire at a time
+        self.lock = threading.Lock()
+        self.pending = {}  # request id -> [threading.Event, (ok, reply, header)]
+        self.next_id = 0
+        self.closed = False
+        self.last_used = time.time()
+
+        reader = threading.Thread(target=self.read, args=(logger,))
+        reader.daemon = True
+        reader.start()
+
+
+    def read(self, logger: Logger) -> None:
+        while True:
+            OK_receive, message_from_slave, header = self.transport.receive(self.conn)
+            if not OK_receive:
+                self.close(f"Connection to Slave [{self.node}] lost: [{header}].")
+                return
+            with self.lock:
+                slot = self.pending.pop(header.request_id, None)
+            if slot is None:
+                logger.log(f"Drop late reply [{header.request_id}] from Slave [{self.node}].")
+                self.transport.release(message_from_slave)
+                continue
+            slot[1] = (True, message_from_slave, header)
+            slot[0].set()
+
+
+    def close(self, reason: str) -> None:
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for slot in pending.values():
+            slot[1] = (False, reason, None)
+            slot[0].set()
+        self.conn.close()
+
+
+    def request(self, msg_to_slave, timeout: float) -> tuple[bool, object, bool]:
+        slot = [threading.Event(), None]
+        with self.lock:
+            if self.closed:
+                return False, f"Connection to Slave [{self.node}] is closed.", False
+            self.next_id += 1
+            request_id = self.next_id
+            self.pending[request_id] = slot
+
+        trace = tracing.current()
+        trace_id, flags = (trace.trace_id, trace.flags) if trace is not None else (0, 0)
+        with self.send_lock:
+            OK_send, msg = self.transport.send(self.conn, msg_to_slave, request_id, None, trace_id, flags)
+        if not OK_send:
+            self.close(msg)
+            return False, msg, False
+
+        if not slot[0].wait(timeout):
+            with self.lock:
+                self.pending.pop(request_id, None)
+            return False, f"Slave [{self.node}] timed out after [{timeout}] seconds.", True
+        self.last_used = time.time()
+        OK_request, message_from_slave, header = slot[1]
+        if trace is not None and header is not None:
+            trace.extend(header.spans)
+        return OK_request, message_from_slave, True
+
+
+class SlavePool:
+    def __init__(self, slave_port: int, transport: Transport, timeout: float=5.0, max_channels: int=2, idle_check: float=30.0):
+        self.slave_port = slave_port
+        self.transport = transport
+        self.timeout = timeout  # seconds one request may wait for its reply
+        self.max_channels = max_channels  # multiplexed connections kept per slave
+        self.idle_check = idle_check  # idle seconds before a connection is pinged
+        self.channels = {}  # node -> list of SlaveChannel
+        self.turn = 0
+        self.lock = threading.Lock()
+
+
+    def address(self, node: str) -> tuple[str, int]:
+        if ':' in node:
+            host, _, port = node.rpartition(':')
+            return host, int(port)
+        return node, self.slave_port
 
+
+    def connect(self, node: str) -> socket.socket:
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
         try:
-            with open(self.log_file, 'a') as file:
-                new_msg = f"[{now_time}] {msg}\n"
-                file.write(new_msg)
-                print(new_msg)
-                return True
-        except Exception as e:
-            new_msg = f"[{now_time}] {msg} {e}\n"
-            print(new_msg)
-            return False
+            conn.connect(self.address(node))
+        except Exception:
+            conn.close()
+            raise
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+
+    def channel(self, node: str, logger: Logger) -> SlaveChannel:
+        with self.lock:
+            live = [channel for channel in self.channels.get(node, []) if not channel.closed]
+            self.channels[node] = live
+            self.turn += 1
+            if len(live) >= self.max_channels:
+                return live[self.turn % len(live)]
+
+        channel = SlaveChannel(node, self.connect(node), self.transport, logger)
+        logger.log(f"Open multiplexed connection to Slave [{node}].")
+        with self.lock:
+            self.channels.setdefault(node, []).append(channel)
+        return channel
+
+
+    def request(self, node: str, msg_to_slave, logger: Logger, timeout: float=None) -> tuple[bool, object]:
+        timeout = self.timeout if timeout is None else timeout
+        OK_request, message_from_slave, sent = self.channel(node, logger).request(msg_to_slave, timeout)
+        if not OK_request and not sent:
+            logger.log(f"Connection to Slave [{node}] is stale: [{message_from_slave}], reconnect.")
+            OK_request, message_from_slave, sent = self.channel(node, logger).request(msg_to_slave, timeout)
+        if not OK_request and sent:
+            return None, f"{message_from_slave} Outcome unknown."  # None: the request reached the slave and may have been applied
+        return OK_request, message_from_slave
+
+
+    def drop(self, node: str) -> None:
+        with self.lock:
+            channels = self.channels.pop(node, [])
+        for channel in channels:
+            channel.close(f"Slave [{node}] is dead.")
+
+
+    def check(self, logger: Logger) -> int:
+        now_time = time.time()
+        with self.lock:
+            idle = [channel for channels in self.channels.values() for channel in channels
+                if not channel.closed and now_time - channel.last_used >= self.idle_check]
+
+        closed = 0
+        for channel in idle:
+            OK_ping, message_from_slave, _ = channel.request("master#ping", self.timeout)
+            if not OK_ping:
+                channel.close(message_from_slave)
+                closed += 1
+                logger.log(f"Drop connection to Slave [{channel.node}]: [{message_from_slave}].")
+        return closed
 
 
 class MasterSocket:
@@ -58,7 +285,18 @@ class MasterSocket:
         local_port: int, 
         slave_port: int, 
         buffer: int, 
-        data_node: list
+        data_node: list,
+        slave_timeout: float=5.0,
+        slave_rate: float=8 * 1024 * 1024,
+        fan_out_workers: int=32,
+        replication: int=2,
+        virtual_nodes: int=64,
+        max_inflight: int=64,
+        max_client_inflight: int=8,
+        max_queue: int=256,
+        backlog: int=1024,
+        metrics: Metrics=None,
+        tracer: Tracer=None
     ):
         self.local_IP = local_IP
         self.local_port = local_port
@@ -66,12 +304,45 @@ class MasterSocket:
         self.slave_port = slave_port
 
         self.buffer = buffer
+        self.transport = Transport(buffer)
 
-        self.all_node_opt = ['upload', 'delete', 'modify']
-        self.single_node_opt = ['find', 'hash', 'topK']
+        self.replica_node_opt = ['upload', 'delete', 'modify']
+        self.bulk_node_opt = ['bulkUpload']
+        self.single_node_opt = ['find', 'hash']
+        self.gather_node_opt = ['topK', 'batchTopK']
+
+        self.slave_timeout = slave_timeout  # seconds one slave may take to answer
+        self.slave_rate = slave_rate  # bytes per second a slave takes in at least, array payloads get that much longer
+        self.fan_out = ThreadPoolExecutor(max_workers=fan_out_workers)
 
         self.data_node = data_node
         self.alive_node = None
+        self.node_hosts = {}  # node -> resolved address its heart beats must come from
+        self.ring = HashRing(data_node, replication, virtual_nodes)
+        self.routing = RoutingTable()
+        self.pool = SlavePool(slave_port, self.transport, slave_timeout)
+
+        self.max_inflight = max_inflight  # client requests executed at once
+        self.max_client_inflight = max_client_inflight  # requests one client address may have open
+        self.max_queue = max_queue  # requests waiting for a free slot before new ones are turned away
+        self.backlog = backlog
+        self.requests = ThreadPoolExecutor(max_workers=max_inflight)  # runs the blocking slave calls
+        self.inflight = None  # asyncio.Semaphore, made on the event loop
+        self.client_inflight = {}  # client address -> open requests
+        self.waiting = 0
+        self.running = 0
+        self.peak_waiting = 0
+        self.rejected = 0
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.gauge('azu_master_queue_waiting', lambda: self.waiting)
+        self.metrics.gauge('azu_master_queue_running', lambda: self.running)
+        self.metrics.gauge('azu_master_queue_peak_waiting', lambda: self.peak_waiting)
+        self.metrics.gauge('azu_master_clients', lambda: len(self.client_inflight))
+        self.metrics.gauge('azu_master_routed_keys', lambda: len(self.routing.key_nodes))
+        self.metrics.gauge('azu_master_alive_slaves', lambda: len([node for node, (is_alive, _) in (self.alive_node or {}).items() if is_alive]))
+        self.metrics.gauge('azu_master_slave_connections', lambda: sum(len(channels) for channels in self.pool.channels.values()))
+        self.tracer = tracer  # writes traces of requests the client asked to trace, None keeps them in replies only
 
 
     def update_alive_dict(self, logger: Logger) -> dict:
@@ -84,7 +355,7 @@ class MasterSocket:
             return new_dict
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             new_dict = {}
             return new_dict
 
@@ -92,209 +363,494 @@ class MasterSocket:
     def run(self, logger: Logger) -> bool:
         try:
             self.alive_node = self.update_alive_dict(logger)
-
-            master_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            master_socket.bind((self.local_IP, self.local_port))
-            master_socket.listen(10)
-            logger.log(f"Master Socket listens on [{self.local_IP}]-[{self.local_port}], max for 10 incomes.")
-        
-            try:
-                while True:
-                    conn, addr = master_socket.accept()
-                    
-                    if addr[0] in self.data_node:
-                        thread = threading.Thread(target=self.heart_beat, 
-                            args=(conn, addr, logger))
-                        thread.start()
-                        logger.log(f"Master connect to Slave [{addr[0]}]-[{addr[1]}].")
-                    
-                    else:
-                        thread = threading.Thread(target=self.both_socket, 
-                            args=(conn, addr, logger))
-                        thread.start()
-                        logger.log(f"Master connect to Client [{addr[0]}]-[{addr[1]}].")
-
-                return True
-
-            except Exception as e:
-                logger.log(e)
-                master_socket.close()
-                return False
+            asyncio.run(self.serve(logger))
+            return True
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
-    def both_socket(self, client_conn: socket.socket, client_addr: list, logger: Logger) -> bool:
+    async def serve(self, logger: Logger) -> None:
+        self.inflight = asyncio.Semaphore(self.max_inflight)
+        server = await asyncio.start_server(lambda reader, writer: self.accept(reader, writer, logger),
+            self.local_IP, self.local_port, backlog=self.backlog)
+        logger.log(f"Master Socket listens on [{self.local_IP}]-[{self.local_port}], max for [{self.max_inflight}] requests in flight.")
+        async with server:
+            await server.serve_forever()
+
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, logger: Logger) -> bool:
+        addr = writer.get_extra_info('peername')
         try:
-            data_from_client = client_conn.recv(self.buffer)
-            message_from_client = pickle.loads(data_from_client)
-            logger.log(f"Master receive [{message_from_client}] from Client [{client_addr[0]}]-[{client_addr[1]}].")
+            logger.log(f"Master connect to [{addr[0]}]-[{addr[1]}].")
+            return await self.both_socket(reader, writer, addr, logger)
+
+        finally:
+            writer.close()
+
 
-            _, msg_len = message_from_client.split('#')
-            
-            data_from_client = client_conn.recv(int(msg_len))
-            message_from_client = pickle.loads(data_from_client)
-            logger.log(f"Master receive [{message_from_client}] from Client [{client_addr[0]}]-[{client_addr[1]}].")
-            msg_to_slave = message_from_client
+    def queue_stats(self) -> dict:
+        return {
+            'waiting': self.waiting,
+            'running': self.running,
+            'peak_waiting': self.peak_waiting,
+            'rejected': self.rejected,
+            'clients': len(self.client_inflight),
+        }
 
+
+    def execute(self, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        try:
             if isinstance(msg_to_slave, tuple):
                 opt = msg_to_slave[0].split('#')[1]
-                print(opt)
             else:
                 opt = msg_to_slave.split('#')[1]
-                print(opt)
 
             status_send_back = False
-            msg_send_back = 'Empty infomation.'
+            msg_send_back = f"{False}#No operation mapping to [{opt}]."
 
-            if opt in self.all_node_opt:
-                all_status = True
+            if opt in self.replica_node_opt:
+                key = msg_to_slave[0].split('#')[2] if isinstance(msg_to_slave, tuple) else msg_to_slave.split('#')[2]
+                status_send_back, msg_send_back = self.replicate(self.ring.replicas(key), msg_to_slave, logger)
+                self.route_acks(opt, key, msg_send_back, logger)
 
-                for node in self.data_node:
-                    is_alive, _ = self.alive_node[node]
-                    if not is_alive:
-                        logger.log(f"Slave [{node}] is dead, ignore it.")
-                        continue
-
-                    slave_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    try:
-                        slave_conn.connect((node, self.slave_port))
-                        logger.log(f"Master connect to Slave [{node}]-[{self.slave_port}].")
-
-                        msg_len = len(pickle.dumps(msg_to_slave))
-                        msg = f"len#{msg_len}"
-                        slave_conn.sendall(pickle.dumps(msg))
-                        logger.log(f"Master send [{msg}] to Slave [{node}]-[{self.slave_port}].")
-                        time.sleep(0.1)
-
-                        slave_conn.sendall(pickle.dumps(msg_to_slave))
-                        logger.log(f"Master send [{msg_to_slave}] to Slave [{node}]-[{self.slave_port}].")
-
-                        data_from_slave = slave_conn.recv(self.buffer)
-                        message_from_client = pickle.loads(data_from_slave)
-                        logger.log(f"Master receive [{message_from_client}] from Slave [{node}]-[{self.slave_port}].")
-
-                        _, msg_len = message_from_client.split('#')
-                        data_from_slave = slave_conn.recv(int(msg_len))
-                        message_from_client = pickle.loads(data_from_slave)
-                        logger.log(f"Master receive [{message_from_client}] from Slave [{node}]-[{self.slave_port}].")
-
-                        status = message_from_client.split('#')[0]
-                        slave_conn.close()
-
-                        if bool(status):
-                            continue
-                        else:
-                            all_status = False
-                            break
-
-                    except Exception as e:
-                        logger.log(e)
-                        status_send_back = False
-                        msg_send_back = e
-
-                if all_status:
-                    logger.log("Execute Client command successfully.")
-                    status_send_back = True
-                else:
-                    logger.log("Fail to execute Client command.")
-                    status_send_back = False
-                msg_send_back = message_from_client
-            
-            elif opt in self.single_node_opt:
-                not_done = True
-                return_from_slave = None
+            elif opt in self.bulk_node_opt:
+                status_send_back, msg_send_back = self.bulk_replicate(msg_to_slave, logger)
+                self.route_acks(opt, None, msg_send_back, logger)
 
-                for node in self.data_node:
-                    is_alive, _ = self.alive_node[node]
-                    if not is_alive:
-                        logger.log(f"Slave [{node}] is dead, ignore it.")
-                        continue
-                    
-                    slave_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    try:
-                        slave_conn.connect((node, self.slave_port))
-                        logger.log(f"Master connect to Slave [{node}]-[{self.slave_port}].")
-
-                        msg_len = len(pickle.dumps(msg_to_slave))
-                        msg = f"len#{msg_len}"
-                        slave_conn.sendall(pickle.dumps(msg))
-                        logger.log(f"Master send [{msg}] to Slave [{node}]-[{self.slave_port}].")
-                        time.sleep(0.1)
-
-                        slave_conn.sendall(pickle.dumps(msg_to_slave))
-                        logger.log(f"Master send [{msg_to_slave}] to Slave [{node}]-[{self.slave_port}].")
-
-                        data_from_slave = slave_conn.recv(self.buffer)
-                        message_from_client = pickle.loads(data_from_slave)
-                        logger.log(f"Master receive [{message_from_client}] from Slave [{node}]-[{self.slave_port}].")
-
-                        _, msg_len = message_from_client.split('#')
-                        data_from_slave = slave_conn.recv(int(msg_len))
-                        message_from_slave = pickle.loads(data_from_slave)
-                        logger.log(f"Master receive [{message_from_slave}] from Slave [{node}]-[{self.slave_port}].")
-                        
-                        if opt == 'find':
-                            status = message_from_slave[0].split('#')[0]
-                        else:
-                            status = message_from_slave.split('#')[0]
-                        
-                        slave_conn.close()
-
-                        if bool(status):
-                            not_done = False
-                            return_from_slave = message_from_slave
-                            break
-                        else:
-                            continue
-
-                    except Exception as e:
-                        logger.log(e)
-                        status_send_back = False
-                        msg_send_back = str(e)
-
-                if not not_done:
-                    logger.log("Fail to execute Client command.")
-                    status_send_back = False
-                else:
-                    logger.log("Execute Client command successfully.")
-                    status_send_back = True
-                msg_send_back = return_from_slave
+            elif opt == 'find':
+                key = msg_to_slave.split('#')[2]
+                status_send_back, msg_send_back = self.ask_first(self.lookup_nodes(key), msg_to_slave, logger)
+
+            elif opt == 'hash':
+                key = self.routing.key_of(msg_to_slave.split('#')[2])
+                status_send_back, msg_send_back = self.ask_first(self.lookup_nodes(key), msg_to_slave, logger)
+
+            elif opt in self.gather_node_opt:
+                status_send_back, msg_send_back = self.gather_topK(opt, msg_to_slave, logger)
+
+            elif opt == 'queue':
+                status_send_back, msg_send_back = True, (f"{True}#Master request queue.", self.queue_stats())
+
+            elif opt == 'stats':
+                status_send_back, msg_send_back = self.collect_stats(msg_to_slave, logger)
+
+            return status_send_back, msg_send_back
 
-            msg_len = len(pickle.dumps(msg_send_back))
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, f"{False}#{e}"
+
+
+    async def admit(self, client: str, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        if self.client_inflight.get(client, 0) >= self.max_client_inflight:
+            self.rejected += 1
+            self.metrics.inc('azu_master_rejected_total', reason='client')
+            msg = f"Master busy, client [{client}] already has [{self.client_inflight[client]}] request(s) in flight."
+            logger.log(msg)
+            return False, f"{False}#{msg}"
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            self.metrics.inc('azu_master_rejected_total', reason='queue')
+            msg = f"Master busy, [{self.waiting}] request(s) queued."
+            logger.log(msg)
+            return False, f"{False}#{msg}"
+
+        self.client_inflight[client] = self.client_inflight.get(client, 0) + 1
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        trace = tracing.current()
+        start_time = time.perf_counter()
+        try:
+            async with self.inflight:
+                self.waiting -= 1
+                self.running += 1
+                if trace is not None:
+                    trace.add('master.queue', time.perf_counter() - start_time)
+                try:
+                    loop = asyncio.get_running_loop()
+                    with tracing.span('master.execute'):
+                        return await loop.run_in_executor(self.requests, contextvars.copy_context().run, self.execute, msg_to_slave, logger)
+                finally:
+                    self.running -= 1
+
+        finally:
+            self.client_inflight[client] -= 1
+            if self.client_inflight[client] == 0:
+                del self.client_inflight[client]
+
+
+    async def answer(self, writer: asyncio.StreamWriter, send_lock: asyncio.Lock, header, msg_to_slave, client_addr: tuple, logger: Logger) -> bool:
+        start_time = time.perf_counter()
+        opt = header.op
+        self.metrics.inc('azu_master_bytes_received_total', self.transport.frame.size + header.length)
+        trace = None
+        if header.flags & tracing.TRACE:
+            trace = Trace(header.trace_id, 'master', header.flags)
+            trace.add_timing('master', header, 'decode', 'recv')
+        tracing.current_trace.set(trace)
+        try:
+            try:
+                status_send_back, msg_send_back = await self.admit(client_addr[0], msg_to_slave, logger)
+            finally:
+                self.transport.release(msg_to_slave)
+
+            spans = trace.spans if trace is not None and header.flags & tracing.RETURN else None
+            async with send_lock:
+                OK_send, msg = await self.transport.send_async(writer, msg_send_back, header.request_id, 0, header.trace_id, header.flags, spans)
+            logger.log(f"Master send [{msg}] to Client [{client_addr[0]}]-[{client_addr[1]}].")
+            logger.log(f"Master send [{summary(msg_send_back)}] to Client [{client_addr[0]}]-[{client_addr[1]}].", level='debug')
+            self.transport.release(msg_send_back)
+            if OK_send:
+                self.metrics.inc('azu_master_bytes_sent_total', self.transport.frame.size + msg.length)
+                if trace is not None:
+                    trace.add_timing('master', msg, 'encode', 'send')
+            if trace is not None and self.tracer is not None:
+                self.tracer.finish(trace)
+            self.metrics.observe('azu_master_request_seconds', time.perf_counter() - start_time, op=opt)
+            self.metrics.inc('azu_master_requests_total', op=opt, status=status_send_back)
+            return OK_send
 
-            len_msg = f"len#{msg_len}"
-            client_conn.sendall(pickle.dumps(len_msg))
-            logger.log(f"Master send [{len_msg}] to Client [{client_addr[0]}]-[{client_addr[1]}].")
-            time.sleep(0.1)
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
 
-            client_conn.sendall(pickle.dumps(msg_send_back))
-            logger.log(f"Master send [{msg_send_back}] to Client [{client_addr[0]}]-[{client_addr[1]}].")
-            client_conn.close()
 
+    async def both_socket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client_addr: tuple, logger: Logger) -> bool:
+        send_lock = asyncio.Lock()  # replies leave in completion order, one frame at a time
+        answers = set()
+        try:
+            while True:
+                OK_receive, message_from_client, header = await self.transport.receive_async(reader)
+                if not OK_receive:
+                    logger.log(f"Client [{client_addr[0]}]-[{client_addr[1]}] closed: [{header}].")
+                    break
+                if header.op == 'heartbeat':
+                    self.heart_beat(message_from_client, client_addr, logger)
+                    continue
+                logger.log(f"Master receive [{header}] from Client [{client_addr[0]}]-[{client_addr[1]}].")
+                logger.log(f"Master receive [{summary(message_from_client)}] from Client [{client_addr[0]}]-[{client_addr[1]}].", level='debug')
+                answer = asyncio.create_task(self.answer(writer, send_lock, header, message_from_client, client_addr, logger))
+                answers.add(answer)
+                answer.add_done_callback(answers.discard)
+
+            if answers:
+                await asyncio.wait(answers)
             return True
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
-    def heart_beat(self, slave_conn: socket.socket, slave_addr: list, logger: Logger) -> bool:
+    def request_timeout(self, msg_to_slave) -> float:
+        return self.slave_timeout + sum(array.nbytes for array in self.transport.walk_arrays(msg_to_slave)) / self.slave_rate
+
+
+    def ask_slave(self, node: str, msg_to_slave, logger: Logger, timeout: float=None) -> tuple[bool, object]:
+        try:
+            start_time = time.perf_counter()
+            with tracing.span(f"master.ask {node}"):
+                OK_ask, message_from_slave = self.pool.request(node, msg_to_slave, logger, timeout)
+            opt = Transport.ops[self.transport.op_code(msg_to_slave)]
+            self.metrics.observe('azu_master_slave_seconds', time.perf_counter() - start_time, node=node, op=opt)
+            if not OK_ask:
+                self.metrics.inc('azu_master_slave_errors_total', node=node, op=opt)
+            if OK_ask:
+                logger.log(f"Master receive [{summary(message_from_slave)}] from Slave [{node}].", level='debug')
+            return OK_ask, message_from_slave
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def alive_nodes(self, logger: Logger, nodes: list=None) -> list:
+        alive = []
+        for node in (self.data_node if nodes is None else nodes):
+            is_alive, _ = self.alive_node[node]
+            if not is_alive:
+                logger.log(f"Slave [{node}] is dead, ignore it.")
+                continue
+            alive.append(node)
+        return alive
+
+
+    def lookup_nodes(self, key: str) -> list:
+        if key is None:
+            return list(self.data_node)
+        nodes = self.routing.nodes(key)
+        return nodes + [node for node in self.ring.replicas(key) if node not in nodes]
+
+
+    def route_acks(self, opt: str, key: str, msg_send_back, logger: Logger) -> None:
+        if not isinstance(msg_send_back, tuple):
+            return
+        for node, (OK_node, message_from_slave) in msg_send_back[1].items():
+            if OK_node is None:
+                # the write may still land, route by what the slave actually holds
+                self.fan_out.submit(self.pull_catalog, node, logger)
+            elif opt == 'delete':
+                if OK_node:
+                    self.routing.remove(node, key)
+            elif opt == 'bulkUpload':
+                if isinstance(message_from_slave, tuple) and len(message_from_slave) > 2:
+                    for key, data_hash in message_from_slave[2].items():
+                        self.routing.put(node, key, data_hash)
+            elif OK_node and isinstance(message_from_slave, tuple):
+                self.routing.put(node, key, message_from_slave[1])
+
+
+    def pull_catalog(self, node: str, logger: Logger) -> bool:
+        OK_ask, message_from_slave = self.ask_slave(node, "master#catalog", logger)
+        if not OK_ask or not isinstance(message_from_slave, tuple):
+            logger.log(f"Fail to pull catalog from Slave [{node}]: [{message_from_slave}].")
+            return False
+        key_list, data_hashes = message_from_slave[1]
+        self.routing.load(node, key_list, data_hashes)
+        logger.log(f"Route [{len(key_list)}] key(s) to Slave [{node}].")
+        return True
+
+
+    def ask_first(self, nodes: list, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        message_from_slave = f"{False}#No alive slave holds the target."
+        for node in self.alive_nodes(logger, nodes):
+            OK_ask, message_from_slave = self.ask_slave(node, msg_to_slave, logger)
+            if not OK_ask:
+                logger.log(message_from_slave)
+                message_from_slave = f"{False}#{message_from_slave}"
+                continue
+
+            status = message_from_slave[0] if isinstance(message_from_slave, tuple) else message_from_slave
+            if status.split('#')[0] == f"{True}":
+                logger.log("Execute Client command successfully.")
+                return True, message_from_slave
+
+        logger.log("Fail to execute Client command.")
+        return False, message_from_slave
+
+
+    def scatter(self, node_msgs: dict, logger: Logger) -> dict:
+        # the deadline grows with the arrays sent, a large bulk load must not be cut off while the slave still stores it
+        timeouts = {node: self.request_timeout(msg_to_slave) for node, msg_to_slave in node_msgs.items()}
+        futures = {self.fan_out.submit(contextvars.copy_context().run, self.ask_slave, node, msg_to_slave, logger, timeouts[node]): node
+            for node, msg_to_slave in node_msgs.items()}
+        deadline = max(timeouts.values(), default=self.slave_timeout) * 2  # one reconnect may resend the request
+        done, not_done = wait(futures, timeout=deadline)
+
+        results = {}
+        for future, node in futures.items():
+            if future in not_done:
+                future.cancel()
+                results[node] = (None, f"Slave [{node}] did not answer within [{deadline:.1f}] seconds. Outcome unknown.")
+            else:
+                results[node] = future.result()
+        return results
+
+
+    def collect_stats(self, msg_to_slave: str, logger: Logger) -> tuple[bool, object]:
+        try:
+            name = msg_to_slave.split('#')[0]
+            if name != 'admin':
+                msg = f"[{name}] has no privilege to read stats. This operation is logged."
+                logger.log(msg)
+                return False, f"{False}#{msg}"
+
+            stats = {'master': self.metrics.snapshot()}
+            alive = self.alive_nodes(logger)
+            for node, (OK_ask, message_from_slave) in self.scatter({node: "master#stats" for node in alive}, logger).items():
+                if OK_ask and isinstance(message_from_slave, tuple):
+                    stats[node] = message_from_slave[1]
+                else:
+                    stats[node] = message_from_slave
+            return True, (f"{True}#Collect metrics from master and [{len(alive)}] alive slave(s).", stats)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, f"{False}#{e}"
+
+
+    def collect_status(self, results: dict) -> dict:
+        node_status = {}
+        for node, (OK_ask, message_from_slave) in results.items():
+            if not OK_ask:
+                node_status[node] = (OK_ask, message_from_slave)  # None keeps an unknown outcome apart from a failure
+                continue
+            status = message_from_slave[0] if isinstance(message_from_slave, tuple) else message_from_slave
+            node_status[node] = (status.split('#')[0] == f"{True}", message_from_slave)
+        return node_status
+
+
+    def replicate(self, owners: tuple, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        try:
+            nodes = self.alive_nodes(logger, owners)
+            node_status = self.collect_status(self.scatter({node: msg_to_slave for node in nodes}, logger))
+
+            done = [node for node, (status, _) in node_status.items() if status]
+            unknown = [node for node, (status, _) in node_status.items() if status is None]
+            all_status = len(nodes) > 0 and len(done) == len(nodes)
+            if all_status:
+                logger.log("Execute Client command successfully.")
+            else:
+                logger.log("Fail to execute Client command.")
+            msg = f"Execute on [{len(done)}] of [{len(nodes)}] alive replica(s) {list(owners)}."
+            if unknown:
+                msg = f"{msg} Outcome unknown on {unknown}."
+            return all_status, (f"{all_status}#{msg}", node_status)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, f"{False}#{e}"
+
+
+    def bulk_replicate(self, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        try:
+            cmd, (key_list, vectors) = msg_to_slave
+            alive = self.alive_nodes(logger)
+
+            positions = {node: [] for node in alive}
+            orphans = []
+            for num, key in enumerate(key_list):
+                owners = [node for node in self.ring.replicas(key) if node in positions]
+                if not owners:
+                    orphans.append(key)
+                for node in owners:
+                    positions[node].append(num)
+
+            node_msgs = {}
+            for node, nums in positions.items():
+                if len(nums) == len(key_list):
+                    node_msgs[node] = msg_to_slave
+                elif nums:
+                    node_msgs[node] = (cmd, ([key_list[num] for num in nums], vectors[nums]))
+            node_status = self.collect_status(self.scatter(node_msgs, logger))
+
+            done = [node for node, (status, _) in node_status.items() if status]
+            unknown = [node for node, (status, _) in node_status.items() if status is None]
+            all_status = len(node_msgs) > 0 and len(done) == len(node_msgs) and not orphans
+            if all_status:
+                logger.log("Execute Client command successfully.")
+            else:
+                logger.log("Fail to execute Client command.")
+            msg = f"Spread [{len(key_list)}] vector(s) over [{len(node_msgs)}] alive slave(s), [{len(done)}] succeeded."
+            if unknown:
+                msg = f"{msg} Outcome unknown on {unknown}, they did not answer in time."
+            if orphans:
+                msg = f"{msg} [{len(orphans)}] key(s) have no alive replica: {orphans[:10]}."
+            return all_status, (f"{all_status}#{msg}", node_status)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, f"{False}#{e}"
+
+
+    def merge_topK(self, answers: list, K: int) -> tuple[list, list]:
+        seen = set()
+        keys, distances = [], []
+        for distance, key in heapq.merge(*[sorted(zip(dis_list, key_list)) for key_list, dis_list in answers]):
+            if key in seen:
+                continue
+            seen.add(key)
+            keys.append(key)
+            distances.append(float(distance))
+            if len(keys) == K:
+                break
+        return keys, distances
+
+
+    def gather_topK(self, opt: str, msg_to_slave, logger: Logger) -> tuple[bool, object]:
+        try:
+            K = int(msg_to_slave[0].split('#')[2])
+            alive = self.alive_nodes(logger)
+            answered, answers, failed = [], [], []
+            while True:
+                nodes, lost = self.ring.cover([node for node in alive if node not in failed], answered)
+                if not nodes:
+                    break
+                results = self.scatter({node: msg_to_slave for node in nodes}, logger)
+
+                for node, (OK_ask, message_from_slave) in results.items():
+                    if OK_ask and isinstance(message_from_slave, tuple) and message_from_slave[0].split('#')[0] == f"{True}":
+                        answered.append(node)
+                        answers.append(message_from_slave[1])
+                    else:
+                        logger.log(f"Slave [{node}] fails top-K: [{message_from_slave}], ask another replica.")
+                        failed.append(node)
+                if all(node in answered for node in nodes):
+                    break
+
+            if not answers:
+                msg = f"Fail to find top-[{K}] similar data, no slave answered out of [{len(alive)}]."
+                logger.log(msg)
+                return False, f"{False}#{msg}"
+
+            if opt == 'topK':
+                merged = self.merge_topK(answers, K)
+                msg = f"Find top-[{K}] similar data with key [{merged[0]}] and instances [{merged[1]}] from [{len(answers)}] slave(s)."
+            else:
+                merged = [self.merge_topK(query_answers, K) for query_answers in zip(*answers)]
+                msg = f"Find top-[{K}] similar data for [{len(merged)}] quer(ies) from [{len(answers)}] slave(s)."
+            if failed:
+                msg = f"{msg} Slave(s) {failed} did not answer."
+            if lost:
+                msg = f"{msg} [{lost}] shard range(s) have no alive replica."
+            logger.log(msg)
+            return True, (f"{True}#{msg}", merged)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, f"{False}#{e}"
+
+
+    def node_host(self, node: str) -> str:
+        host = self.node_hosts.get(node)
+        if host is None:
+            host, _ = self.pool.address(node)
+            try:
+                host = socket.gethostbyname(host)
+            except OSError:
+                pass
+            self.node_hosts[node] = host
+        return host
+
+
+    def heart_beat(self, message_from_slave: str, slave_addr: tuple, logger: Logger) -> bool:
         try:
-            data_from_slave = slave_conn.recv(self.buffer)
-            message_from_slave = pickle.loads(data_from_slave)
             logger.log(f"Master receive [{message_from_slave}] from Slave [{slave_addr[0]}]-[{slave_addr[1]}].")
 
-            slave_alive_time = int(message_from_slave)
-            self.alive_node[slave_addr[0]] = [True, slave_alive_time]
-            logger.log(f"Slave [{slave_addr[0]}] is alive at time [{slave_alive_time}]")
+            alive_time, _, node = str(message_from_slave).partition('#')
+            node = node or slave_addr[0]  # slaves advertise <ip>:<port>, older ones send the timestamp only
+            if node not in self.alive_node:
+                logger.log(f"Heart beat from unknown Slave [{node}], ignored.", level='warning')
+                return False
+            if self.node_host(node) != slave_addr[0]:
+                logger.log(f"Heart beat for Slave [{node}] from [{slave_addr[0]}] does not match its host, ignored.", level='warning')
+                return False
+
+            slave_alive_time = int(alive_time)
+            was_alive, _ = self.alive_node[node]
+            self.alive_node[node] = [True, slave_alive_time]
+            if not was_alive:
+                self.fan_out.submit(self.pull_catalog, node, logger)
+            logger.log(f"Slave [{node}] is alive at time [{slave_alive_time}]")
+            logger.log(f"Master request queue [{self.queue_stats()}].")
 
             return True
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
+            return False
+
+
+    def check_pool(self, sleep_time: int, logger: Logger) -> bool:
+        try:
+            while True:
+                time.sleep(sleep_time)
+                closed = self.pool.check(logger)
+                logger.log(f"Check pooled Slave connections, [{closed}] dropped.")
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
             return False
 
 
@@ -309,12 +865,13 @@ class MasterSocket:
                         logger.log(f"Slave [{node}] is alive.")
                     else:
                         self.alive_node[node] = [False, last_alive_time]
+                        self.pool.drop(node)
                         logger.log(f"Slave [{node}] is dead at time [{now_time}].")
                 logger.log(f"Process update alive sleep for [{sleep_time + 5}] seconds.")
                 time.sleep(sleep_time + 5)
             return True
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
@@ -323,21 +880,43 @@ class Master:
         master_ip: str, 
         master_port: int, 
         slave_ip: list, 
-        slave_port: int
+        slave_port: int,
+        replication: int=2,
+        max_inflight: int=64,
+        max_client_inflight: int=8,
+        slave_timeout: float=5.0,
+        slave_rate: float=8 * 1024 * 1024,
+        log_level: str='info'
     ):
         self.master_ip = master_ip
         self.master_port = master_port
         self.slave_ip = slave_ip
         self.slave_port = slave_port
-
-        self.logger = Logger('master')
+        self.replication = replication  # copies kept of every key
+        self.max_inflight = max_inflight
+        self.max_client_inflight = max_client_inflight
+        self.slave_timeout = slave_timeout  # seconds a slave may take to answer a request without arrays
+        self.slave_rate = slave_rate  # bytes per second added to that for the arrays a request carries
+        self.metrics_file = 'metrics/master.prom'  # Prometheus text dump, None to disable
+        self.metrics_inter = 15
+
+        self.logger = Logger('master', level=log_level)
+        self.metrics = Metrics()
+        self.tracer = Tracer('master')
 
         self.mastersocket = MasterSocket(
             local_IP=self.master_ip, 
             local_port=self.master_port, 
             slave_port=self.slave_port, 
             buffer=1024, 
-            data_node=self.slave_ip
+            data_node=self.slave_ip,
+            slave_timeout=self.slave_timeout,
+            slave_rate=self.slave_rate,
+            replication=self.replication,
+            max_inflight=self.max_inflight,
+            max_client_inflight=self.max_client_inflight,
+            metrics=self.metrics,
+            tracer=self.tracer
         )
         self.logger.log("Create MasterSocket successfully.")
 
@@ -346,29 +925,50 @@ class Master:
         try:
             ms_run = threading.Thread(target=self.mastersocket.run, args=(self.logger,))
             ms_al = threading.Thread(target=self.mastersocket.update_alive, args=(20, self.logger,))
+            ms_pool = threading.Thread(target=self.mastersocket.check_pool, args=(30, self.logger,))
 
             ms_run.daemon = True
             ms_al.daemon = True
+            ms_pool.daemon = True
 
             ms_run.start()
             ms_al.start()
+            ms_pool.start()
 
             self.logger.log(f"Start MasterSocket.run thread [{ms_run}] successfully.")
             self.logger.log(f"Start MasterSocket.update_alive thread [{ms_al}] successfully.")
+            self.logger.log(f"Start MasterSocket.check_pool thread [{ms_pool}] successfully.")
+
+            if self.metrics_file:
+                ms_metrics = threading.Thread(target=self.metrics.run_dump, args=(self.metrics_file, self.metrics_inter, self.logger,))
+                ms_metrics.daemon = True
+                ms_metrics.start()
+                self.logger.log(f"Start Metrics.run_dump thread [{ms_metrics}] successfully.")
 
             while True:
                 time.sleep(20)
 
             return True
         except Exception as e:
-            self.logger.log(e)
+            self.logger.log(e, level='error')
             return False
 
 
 if __name__ == '__main__':
-    master_ip = '0.0.0.0'  # '10.211.55.74'
-    master_port = 65530
-    slave_ip = ['slave_IP1', 'slave_IP2', '...']
-    slave_port = 65531
-    master = Master(master_ip, master_port, slave_ip, slave_port)
+    parser = argparse.ArgumentParser(description='AZU master node.')
+    parser.add_argument('--ip', default='0.0.0.0', help='address the master listens on')
+    parser.add_argument('--port', type=int, default=65530)
+    parser.add_argument('--slaves', default='slave_IP1,slave_IP2', help='comma separated slave <ip> or <ip>:<port>')
+    parser.add_argument('--slave-port', type=int, default=65531, help='port of slaves given without one')
+    parser.add_argument('--replication', type=int, default=2)
+    parser.add_argument('--max-inflight', type=int, default=64)
+    parser.add_argument('--max-client-inflight', type=int, default=8)
+    parser.add_argument('--slave-timeout', type=float, default=5.0, help='seconds a slave may take to answer a request without arrays')
+    parser.add_argument('--slave-rate', type=float, default=8.0, help='MiB per second a slave is given for the arrays a write carries')
+    parser.add_argument('--log-level', default='info', choices=list(Logger.levels))
+    args = parser.parse_args()
+
+    slave_ip = [node.strip() for node in args.slaves.split(',') if node.strip()]
+    master = Master(args.ip, args.port, slave_ip, args.slave_port, args.replication,
+        args.max_inflight, args.max_client_inflight, args.slave_timeout, args.slave_rate * 1024 * 1024, args.log_level)
     master.threads()
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+import contextlib
+
+
+class Histogram:
+    def __init__(self, sub_bits: int=5, unit: float=1e-6):
+        self.sub_bits = sub_bits  # 2 ** sub_bits buckets per power of two, relative error below 2 ** (1 - sub_bits)
+        self.unit = unit  # seconds per recorded integer step, microseconds by default
+        self.counts = {}  # bucket index -> count
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+
+    def index(self, value: int) -> int:
+        sub = 1 << self.sub_bits
+        if value < sub:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return sub + (shift - 1) * (sub >> 1) + (value >> shift) - (sub >> 1)
+
+
+    def bounds(self, index: int) -> tuple[int, int]:
+        sub = 1 << self.sub_bits
+        if index < sub:
+            return index, index + 1
+        shift = (index - sub) // (sub >> 1) + 1
+        lower = ((index - sub) % (sub >> 1) + (sub >> 1)) << shift
+        return lower, lower + (1 << shift)
+
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds / self.unit))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                lower, upper = self.bounds(index)
+                return min(self.max, max(self.min, (lower + upper) / 2 * self.unit))
+        return self.max
+
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'min': self.min or 0.0,
+            'max': self.max or 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+        }
+
+
+class Metrics:
+    quantiles = [('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'), ('0.999', 'p999')]
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # (name, labels) -> callable returning the current value
+        self.lock = threading.Lock()
+
+
+    def labels(self, labels: dict) -> tuple:
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+    def series(self, name: str, labels: tuple) -> str:
+        if not labels:
+            return name
+        text = ','.join(f'{label}="{value}"' for label, value in labels)
+        return f"{name}{{{text}}}"
+
+
+    def inc(self, name: str, value: float=1, **labels) -> None:
+        key = (name, self.labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, self.labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.record(seconds)
+
+
+    def gauge(self, name: str, read, **labels) -> None:
+        with self.lock:
+            self.gauges[(name, self.labels(labels))] = read
+
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+
+    def read_gauges(self) -> dict:
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = {}
+        for key, read in gauges:
+            try:
+                values[key] = float(read())
+            except Exception:
+                continue
+        return values
+
+
+    def snapshot(self) -> dict:
+        gauges = self.read_gauges()
+        with self.lock:
+            return {
+                'counters': {self.series(*key): value for key, value in self.counters.items()},
+                'gauges': {self.series(*key): value for key, value in gauges.items()},
+                'histograms': {self.series(*key): histogram.summary() for key, histogram in self.histograms.items()},
+            }
+
+
+    def prometheus(self) -> str:
+        gauges = self.read_gauges()
+        lines = []
+        typed = set()
+        with self.lock:
+            for kind, values in [('counter', self.counters), ('gauge', gauges)]:
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        typed.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{self.series(name, labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} summary")
+                summary = histogram.summary()
+                for quantile, field in self.quantiles:
+                    lines.append(f"{self.series(name, labels + (('quantile', quantile), ))} {summary[field]}")
+                lines.append(f"{self.series(name + '_sum', labels)} {summary['sum']}")
+                lines.append(f"{self.series(name + '_count', labels)} {summary['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+    def dump(self, path: str) -> bool:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.tmp", 'w') as file:
+            file.write(self.prometheus())
+        os.replace(f"{path}.tmp", path)
+        return True
+
+
+    def run_dump(self, path: str, interval: float, logger) -> bool:
+        try:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    logger.log(f"Fail to dump metrics to [{path}]: [{e}].", level='warning')
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
@@ -1,3 +1,5 @@
+import argparse
+import sys
 import socket
 import numpy as np
 import threading
@@ -8,50 +10,71 @@ import pickle
 import faiss
 import os
 import glob
-import shutil
+import struct
+import zlib
+import contextlib
+import ast
+from concurrent.futures import ThreadPoolExecutor
+from transport import Transport
+from logger import Logger, summary
+from metrics import Metrics
+import tracing
+from tracing import Trace, Tracer, traced
+
+
+class RWLock:
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0  # threads holding the lock shared
+        self.writer = False  # a thread holds the lock exclusive
+        self.waiting_writers = 0  # writers queued, new readers wait behind them
 
 
-class Logger:
-    def __init__(self, name: str):
-        self.log_file = f'log/{name}_new.log'
-        now_time = self.get_time()
+    def acquire_read(self) -> None:
+        with self.cond:
+            while self.writer or self.waiting_writers > 0:
+                self.cond.wait()
+            self.readers += 1
 
-        if not os.path.exists('log'):
-            os.mkdir('log')
-        if not os.path.exists(self.log_file):
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        else:
-            with open('log/last_open_time.log', 'r') as file:
-                last_open_time = file.readline()
-                shutil.move(self.log_file, f'log/{name}_{last_open_time}.log')
-            with open('log/last_open_time.log', 'w') as file:
-                file.write(now_time)
-        with open(self.log_file, 'w') as file:
-            msg = f"[{now_time}] {name} starts\n"
-            file.write(msg)
-            print(msg)
 
+    def release_read(self) -> None:
+        with self.cond:
+            self.readers -= 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+
+    def acquire_write(self) -> None:
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writer or self.readers > 0:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = True
 
-    def get_time(self) -> str:
-        now_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return str(now_time)
 
-    def log(self, msg) -> bool:
-        now_time = self.get_time()
-        if not isinstance(msg, str):
-            msg = str(msg)
+    def release_write(self) -> None:
+        with self.cond:
+            self.writer = False
+            self.cond.notify_all()
 
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
         try:
-            with open(self.log_file, 'a') as file:
-                new_msg = f"[{now_time}] {msg}\n"
-                file.write(new_msg)
-                print(new_msg)
-                return True
-        except Exception as e:
-            new_msg = f"[{now_time}] {msg} {e}\n"
-            print(new_msg)
-            return False
+            yield
+        finally:
+            self.release_read()
+
+
+    def __enter__(self):
+        self.acquire_write()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.release_write()
 
 
 class Data:
@@ -67,8 +90,10 @@ class Data:
         self.owner = owner  # which owner this data belongs to
         self.vector_data = None  # vector data
         self.data_shape = None  # vector shape
+        self.data_dtype = None  # vector dtype
         self.size = None  # disk space this data takes
         self.path = path  # path to the data locally
+        self.location = None  # (partition, segment, row) in segment store
         self.key_hash = None  # hash of key
         self.data_hash = None  # hash of data
 
@@ -89,10 +114,14 @@ class Data:
             return False, str(e)
 
 
-    def save_data(self, vector: np.array) -> tuple[bool, str]:
+    def save_data(self, vector: np.array, store) -> tuple[bool, str]:
         try:
-            np.save(self.path, vector)
-            return True, f"Save [{self.key}] data to [{self.path}] successfully."
+            OK_append, location, msg = store.append(self.owner, self.key, vector)
+            if not OK_append:
+                return False, msg
+            self.location = location
+            self.path = store.segment_path(location)
+            return True, f"Save [{self.key}] data to [{self.path}]-[{location[2]}] successfully."
         except Exception as e:
             return False, str(e)
 
@@ -100,6 +129,7 @@ class Data:
     def get_shape(self, vector: np.array) -> tuple[bool, str]:
         try:
             self.data_shape = vector.shape
+            self.data_dtype = vector.dtype.str
             return True, f"The shape of [{self.key}] is [{self.data_shape}]."
         except Exception as e:
             return False, str(e)
@@ -107,7 +137,7 @@ class Data:
 
     def get_size(self) -> tuple[bool, str]:
         try:
-            file_size = os.path.getsize(self.path)
+            file_size = int(np.prod(self.data_shape)) * np.dtype(self.data_dtype).itemsize
 
             KB = 1024
             MB = KB * 1024
@@ -130,11 +160,66 @@ class Data:
             return False, str(e)
 
 
-    def modify_data(self, cmd: str, new_data: np.array) -> tuple[bool, np.array, str]:
+    modify_ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}  # allowed <op>= in a modify command
+
+
+    def parse_index(self, node, name: str):
+        # NAME or NAME[...] where the subscript holds only int literals, slices of them and tuples of both
+        def literal(part):
+            if part is None:
+                return None
+            if isinstance(part, ast.UnaryOp) and isinstance(part.op, ast.USub):
+                return -literal(part.operand)
+            if isinstance(part, ast.Constant) and type(part.value) is int:
+                return part.value
+            raise ValueError(f"Only int literals are allowed in an index, got [{ast.dump(part)}].")
+
+        def index(part):
+            if isinstance(part, ast.Slice):
+                return slice(literal(part.lower), literal(part.upper), literal(part.step))
+            if isinstance(part, ast.Tuple):
+                return tuple(index(item) for item in part.elts)
+            return literal(part)
+
+        if isinstance(node, ast.Name) and node.id == name:
+            return ()
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == name:
+            return index(node.slice)
+        raise ValueError(f"Expect [{name}] or [{name}[...]], got [{ast.unparse(node)}].")
+
+
+    def apply_modify(self, cmd: str, ori_data: np.array, new_data: np.array) -> None:
+        # TARGET_VECTOR[...] (=|+=|-=|*=|/=) INPUT_VECTOR[...], parsed and applied without executing the command
+        tree = ast.parse(cmd.strip(), mode='exec')
+        if len(tree.body) != 1 or not isinstance(tree.body[0], (ast.Assign, ast.AugAssign)):
+            raise ValueError(f"Expect one assignment to TARGET_VECTOR, got [{cmd}].")
+        statement = tree.body[0]
+        if isinstance(statement, ast.Assign):
+            if len(statement.targets) != 1:
+                raise ValueError(f"Expect one assignment to TARGET_VECTOR, got [{cmd}].")
+            target, op = statement.targets[0], None
+        else:
+            target, op = statement.target, self.modify_ops.get(type(statement.op))
+            if op is None:
+                raise ValueError(f"Operator [{type(statement.op).__name__}] is not allowed, use =, +=, -=, *= or /=.")
+
+        target_index = self.parse_index(target, 'TARGET_VECTOR')
+        value = np.asarray(new_data)[self.parse_index(statement.value, 'INPUT_VECTOR')]
+        if op is None:
+            ori_data[target_index] = value
+        else:
+            ori_data[target_index] = op(ori_data[target_index], value)
+
+
+    def modify_data(self, cmd: str, new_data: np.array, store) -> tuple[bool, np.array, str]:
         try:
-            ori_data = np.load(self.path)
-            exec(cmd, {'TARGET_VECTOR': ori_data, 'INPUT_VECTOR': new_data})
-            np.save(self.path, ori_data)
+            OK_read, ori_data, msg = store.read(self.key)
+            if not OK_read:
+                return False, None, msg
+            self.apply_modify(cmd, ori_data, new_data)
+            OK_save_data, msg = self.save_data(ori_data, store)
+            if not OK_save_data:
+                return False, None, msg
 
             return True, ori_data, f"Execute [{cmd}] successfully."
 
@@ -142,9 +227,11 @@ class Data:
             return False, None, str(e)
 
 
-    def look_data(self) -> tuple[bool, np.array, str]:
+    def look_data(self, store) -> tuple[bool, np.array, str]:
         try:
-            look_data = np.load(self.path)
+            OK_read, look_data, msg = store.read(self.key)
+            if not OK_read:
+                return False, None, msg
 
             return True, look_data, f"Look [{self.key}] data locally."
 
@@ -160,35 +247,1225 @@ class Data:
             return False, str(e)
 
 
+    def to_record(self):
+        return Record(self.key,
+            self.owner,
+            tuple(self.data_shape) if self.data_shape is not None else None,
+            getattr(self, 'data_dtype', None),
+            self.key_hash,
+            self.data_hash,
+            self.create_time,
+            self.last_modified_time,
+            self.path,
+            getattr(self, 'location', None),
+            self.size
+        )
+
+
+class Segment:
+    def __init__(self, path: str, data_dtype: str, data_shape: tuple, capacity: int):
+        self.path = path  # append-only segment file
+        self.capacity = capacity  # rows this segment can hold
+        self.count = 0  # rows appended so far
+        self.live = 0  # rows still referenced by a key
+        self.tombstones = set()  # rows of deleted or overwritten data
+
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.truncate(capacity * max(1, np.dtype(data_dtype).itemsize * int(np.prod(data_shape))))
+        self.array = np.memmap(path, dtype=np.dtype(data_dtype), mode='r+', shape=(capacity, ) + tuple(data_shape))
+
+
+class SegmentStore:
+    def __init__(self, root: str='segment', segment_bytes: int=64 * 1024 * 1024):
+        self.root = root  # one directory per (owner, data_shape, dtype) partition
+        self.segment_bytes = segment_bytes  # target size of one segment file
+        self.partitions = {}  # partition name -> (owner, data_shape, dtype)
+        self.segments = {}  # partition name -> {segment number: Segment}
+        self.active = {}  # partition name -> segment number being appended
+        self.offsets = {}  # key -> (partition name, segment number, row)
+        self.dirty = set()  # (partition name, segment number) not yet flushed
+        self.lock = threading.RLock()
+
+
+    def partition_name(self, owner: str, data_shape: tuple, data_dtype: str) -> str:
+        return hashlib.sha256(f"{owner}#{tuple(data_shape)}#{data_dtype}".encode('utf-8')).hexdigest()
+
+
+    def segment_path(self, location: tuple) -> str:
+        name, seg_no, _ = location
+        return os.path.join(self.root, name, f"{seg_no:06d}.seg")
+
+
+    def open_segment(self, name: str, seg_no: int) -> Segment:
+        _, data_shape, data_dtype = self.partitions[name]
+        row_bytes = max(1, np.dtype(data_dtype).itemsize * int(np.prod(data_shape)))
+        capacity = max(1, self.segment_bytes // row_bytes)
+        path = self.segment_path((name, seg_no, 0))
+        if os.path.exists(path):
+            capacity = max(1, os.path.getsize(path) // row_bytes)
+        segment = Segment(path, data_dtype, data_shape, capacity)
+        self.segments[name][seg_no] = segment
+        return segment
+
+
+    def get_partition(self, owner: str, data_shape: tuple, data_dtype: str) -> str:
+        name = self.partition_name(owner, data_shape, data_dtype)
+        if name not in self.partitions:
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+            self.partitions[name] = (owner, tuple(data_shape), data_dtype)
+            with open(os.path.join(self.root, name, 'partition.pkl'), 'wb') as file:
+                pickle.dump(self.partitions[name], file)
+            self.segments[name] = {}
+            self.active[name] = 0
+            self.open_segment(name, 0)
+        return name
+
+
+    def tombstone(self, key: str) -> None:
+        name, seg_no, row = self.offsets.pop(key)
+        segment = self.segments[name][seg_no]
+        segment.tombstones.add(row)
+        segment.live -= 1
+
+
+    @traced('disk.write')
+    def append(self, owner: str, key: str, vector: np.array) -> tuple[bool, tuple, str]:
+        try:
+            with self.lock:
+                name = self.get_partition(owner, vector.shape, vector.dtype.str)
+                seg_no = self.active[name]
+                segment = self.segments[name][seg_no]
+                if segment.count >= segment.capacity:
+                    seg_no = max(self.segments[name].keys()) + 1
+                    self.active[name] = seg_no
+                    segment = self.open_segment(name, seg_no)
+
+                row = segment.count
+                segment.array[row] = vector
+                segment.count += 1
+                segment.live += 1
+                if key in self.offsets:
+                    self.tombstone(key)
+                self.offsets[key] = (name, seg_no, row)
+                self.dirty.add((name, seg_no))
+
+            return True, (name, seg_no, row), f"Append [{key}] to segment [{seg_no}] row [{row}]."
+
+        except Exception as e:
+            return False, None, str(e)
+
+
+    @traced('disk.write')
+    def append_batch(self, owner: str, key_list: list, vectors: np.array) -> tuple[bool, list, str]:
+        try:
+            locations = []
+            with self.lock:
+                name = self.get_partition(owner, vectors.shape[1:], vectors.dtype.str)
+                start = 0
+                while start < len(key_list):
+                    seg_no = self.active[name]
+                    segment = self.segments[name][seg_no]
+                    if segment.count >= segment.capacity:
+                        seg_no = max(self.segments[name].keys()) + 1
+                        self.active[name] = seg_no
+                        segment = self.open_segment(name, seg_no)
+
+                    end = min(len(key_list), start + segment.capacity - segment.count)
+                    row = segment.count
+                    segment.array[row:row + end - start] = vectors[start:end]
+                    segment.count += end - start
+                    segment.live += end - start
+                    for num, key in enumerate(key_list[start:end]):
+                        if key in self.offsets:
+                            self.tombstone(key)
+                        self.offsets[key] = (name, seg_no, row + num)
+                        locations.append((name, seg_no, row + num))
+                    self.dirty.add((name, seg_no))
+                    start = end
+
+            return True, locations, f"Append [{len(key_list)}] data to partition [{name}]."
+
+        except Exception as e:
+            return False, [], str(e)
+
+
+    @traced('disk.read')
+    def read(self, key: str) -> tuple[bool, np.array, str]:
+        try:
+            with self.lock:
+                name, seg_no, row = self.offsets[key]
+                vector = np.array(self.segments[name][seg_no].array[row])
+            return True, vector, f"Read [{key}] from segment [{seg_no}] row [{row}]."
+
+        except Exception as e:
+            return False, None, str(e)
+
+
+    def delete(self, key: str) -> tuple[bool, str]:
+        try:
+            with self.lock:
+                if key in self.offsets:
+                    self.tombstone(key)
+            return True, f"Tombstone [{key}] in segment store."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def scan(self, name: str) -> tuple[list, np.array]:
+        with self.lock:
+            rows = {}
+            for key, (part, seg_no, row) in self.offsets.items():
+                if part == name:
+                    rows.setdefault(seg_no, []).append((row, key))
+
+            key_list, data_list = [], []
+            for seg_no in sorted(rows.keys()):
+                seg_rows = sorted(rows[seg_no])
+                key_list += [key for _, key in seg_rows]
+                data_list.append(self.segments[name][seg_no].array[[row for row, _ in seg_rows]])
+
+        if not data_list:
+            return [], None
+        return key_list, np.concatenate(data_list)
+
+
+    def flush(self, logger: Logger) -> bool:
+        try:
+            with self.lock:
+                dirty = list(self.dirty)
+                self.dirty = set()
+                for name, seg_no in dirty:
+                    if seg_no in self.segments.get(name, {}):
+                        self.segments[name][seg_no].array.flush()
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def load(self, locations: dict, logger: Logger) -> tuple[bool, list]:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+
+            with self.lock:
+                for meta_path in glob.glob(os.path.join(self.root, '*', 'partition.pkl')):
+                    name = os.path.basename(os.path.dirname(meta_path))
+                    with open(meta_path, 'rb') as file:
+                        self.partitions[name] = pickle.load(file)
+                    self.segments[name] = {}
+                    for path in glob.glob(os.path.join(self.root, name, '*.seg')):
+                        self.open_segment(name, int(os.path.basename(path).split('.')[0]))
+                    if not self.segments[name]:
+                        self.open_segment(name, 0)
+                    self.active[name] = max(self.segments[name].keys())
+
+                missing_keys = []
+                for key, location in locations.items():
+                    name, seg_no, row = location
+                    if seg_no not in self.segments.get(name, {}) or row >= self.segments[name][seg_no].capacity:
+                        missing_keys.append(key)
+                        continue
+                    segment = self.segments[name][seg_no]
+                    segment.count = max(segment.count, row + 1)
+                    segment.live += 1
+                    self.offsets[key] = location
+
+                live_rows = set(self.offsets.values())
+                for name, segments in self.segments.items():
+                    for seg_no, segment in segments.items():
+                        segment.tombstones = {row for row in range(segment.count) if (name, seg_no, row) not in live_rows}
+
+            logger.log(f"Open [{len(self.partitions)}] segment partition(s) holding [{len(self.offsets)}] data, [{len(missing_keys)}] missing.")
+            return True, missing_keys
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False, []
+
+
+    def compact(self, ratio: float) -> tuple[bool, dict, list, str]:
+        moved, dropped = {}, []
+        with self.lock:
+            for name, segments in self.segments.items():
+                for seg_no in sorted(segments.keys()):
+                    segment = segments[seg_no]
+                    if seg_no == self.active[name] or segment.count == 0:
+                        continue
+                    if len(segment.tombstones) < segment.count * ratio:
+                        continue
+
+                    owner = self.partitions[name][0]
+                    for key in [key for key, location in self.offsets.items() if location[:2] == (name, seg_no)]:
+                        old_location = self.offsets[key]
+                        OK_append, location, msg = self.append(owner, key, np.array(segment.array[old_location[2]]))
+                        if not OK_append:
+                            self.rollback(moved)
+                            return False, {}, [], f"Abort compaction at [{key}], keep every segment: {msg}"
+                        moved[key] = (old_location, location)
+                    dropped.append((name, seg_no))
+
+            for name, seg_no in dropped:
+                del self.segments[name][seg_no]
+        return True, {key: location for key, (_, location) in moved.items()}, dropped, f"Compact [{len(dropped)}] segment(s)."
+
+
+    def rollback(self, moved: dict) -> None:
+        # point every relocated key back at its old row, the copies become tombstones of the active segment
+        for key, ((name, seg_no, row), (new_name, new_seg_no, new_row)) in moved.items():
+            new_segment = self.segments[new_name][new_seg_no]
+            new_segment.tombstones.add(new_row)
+            new_segment.live -= 1
+            segment = self.segments[name][seg_no]
+            segment.tombstones.discard(row)
+            segment.live += 1
+            self.offsets[key] = (name, seg_no, row)
+
+
+    def drop(self, dropped: list, logger: Logger) -> bool:
+        try:
+            for name, seg_no in dropped:
+                path = self.segment_path((name, seg_no, 0))
+                if os.path.exists(path):
+                    os.remove(path)
+            if dropped:
+                logger.log(f"Compaction drops [{len(dropped)}] segment file(s).")
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+class VectorIndex:
+    def __init__(self, root: str='faiss', index_config: dict=None):
+        index_config = index_config or {}
+        self.root = root  # where partition indexes are persisted
+        self.index_type = index_config.get('index_type', 'Flat')  # Flat, IVFFlat, IVFPQ or HNSW
+        self.index_types = index_config.get('index_types', {})  # owner or (owner, data_shape) -> index type
+        self.train_threshold = index_config.get('train_threshold', 10000)  # exact search below this size
+        self.nlist = index_config.get('nlist', None)  # IVF lists, 4 * sqrt(size) when None
+        self.pq_m = index_config.get('pq_m', 8)  # max PQ sub-quantizers
+        self.hnsw_m = index_config.get('hnsw_m', 32)  # HNSW neighbours per node
+        self.nprobe = index_config.get('nprobe', 8)  # default IVF lists probed per query
+        self.ef_search = index_config.get('ef_search', 64)  # default HNSW search depth
+        self.rebuild_ratio = index_config.get('rebuild_ratio', 0.2)  # rebuild HNSW with this removed ratio
+
+        self.partitions = {}  # (owner, data_shape) -> faiss index
+        self.partition_types = {}  # (owner, data_shape) -> index type built
+        self.removed = {}  # (owner, data_shape) -> ids hidden in an index without remove support
+        self.selectors = {}  # (owner, data_shape) -> (removed set, its size, faiss selector, id batch) skipping removed ids
+        self.training = {}  # (owner, data_shape) -> (target type, ops applied while training)
+        self.key_to_id = {}  # key -> stable int id
+        self.id_to_key = {}  # stable int id -> key
+        self.key_partition = {}  # key -> (owner, data_shape)
+        self.partition_keys = {}  # (owner, data_shape) -> set of keys
+        self.next_id = 0
+        self.dirty = set()  # partitions changed since last persist
+        self.lock = RWLock()  # searches share it, mutations take it whole
+        self.persist_lock = threading.Lock()  # one persist at a time, its files are written outside self.lock
+
+
+    def partition_name(self, partition: tuple) -> str:
+        owner, data_shape = partition
+        return hashlib.sha256(f"{owner}#{data_shape}".encode('utf-8')).hexdigest()
+
+
+    def get_partition(self, owner: str, data_shape: tuple) -> tuple:
+        partition = (owner, tuple(data_shape))
+        if partition not in self.partitions:
+            dimension = int(np.prod(data_shape))
+            self.partitions[partition] = self.build_index('Flat', dimension, None)
+            self.partition_types[partition] = 'Flat'
+            self.removed[partition] = set()
+            self.partition_keys[partition] = set()
+        return partition
+
+
+    def target_type(self, partition: tuple) -> str:
+        if len(self.partition_keys[partition]) < self.train_threshold:
+            return 'Flat'
+        if partition in self.index_types:
+            return self.index_types[partition]
+        return self.index_types.get(partition[0], self.index_type)
+
+
+    def can_remove(self, partition: tuple) -> bool:
+        if self.partition_types[partition] == 'HNSW':
+            return False
+        if partition in self.training and self.training[partition][0] == 'HNSW':
+            return False
+        return True
+
+
+    def build_index(self, index_type: str, dimension: int, data_bank: np.array):
+        if index_type == 'Flat':
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+        if index_type == 'HNSW':
+            hnsw_index = faiss.IndexHNSWFlat(dimension, self.hnsw_m)
+            hnsw_index.hnsw.efSearch = self.ef_search
+            return faiss.IndexIDMap2(hnsw_index)
+
+        size = len(data_bank)
+        nlist = self.nlist or int(4 * np.sqrt(size))
+        nlist = max(1, min(nlist, size // 39))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == 'IVFFlat':
+            ivf_index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        elif index_type == 'IVFPQ':
+            pq_m = max(m for m in range(1, min(self.pq_m, dimension) + 1) if dimension % m == 0)
+            nbits = max(1, min(8, int(np.log2(size)) - 2))
+            ivf_index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, nbits)
+        else:
+            raise ValueError(f"Unknown index type [{index_type}].")
+        ivf_index.train(data_bank)
+        ivf_index.nprobe = self.nprobe
+        return ivf_index
+
+
+    @traced('faiss.add')
+    def add(self, owner: str, key: str, vector: np.array) -> tuple[bool, str]:
+        try:
+            with self.lock:
+                partition = self.get_partition(owner, vector.shape)
+                if key in self.key_to_id and self.key_partition[key] == partition and self.can_remove(partition):
+                    index_id = self.key_to_id[key]
+                    self.remove_locked(key)
+                else:
+                    if key in self.key_to_id:
+                        self.remove_locked(key)
+                    index_id = self.next_id
+                    self.next_id += 1
+
+                flatten_vector = np.ascontiguousarray(vector.reshape(1, -1), dtype=np.float32)
+                self.partitions[partition].add_with_ids(flatten_vector, np.array([index_id], dtype=np.int64))
+                if partition in self.training:
+                    self.training[partition][1].append(('add', index_id, flatten_vector))
+                self.key_to_id[key] = index_id
+                self.id_to_key[index_id] = key
+                self.key_partition[key] = partition
+                self.partition_keys[partition].add(key)
+                self.dirty.add(partition)
+
+            return True, f"Add [{key}] to index partition [{owner}]-[{vector.shape}] with id [{index_id}]."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    @traced('faiss.add')
+    def add_batch(self, owner: str, key_list: list, vectors: np.array) -> tuple[bool, str]:
+        try:
+            with self.lock:
+                partition = self.get_partition(owner, vectors.shape[1:])
+                for key in key_list:
+                    if key in self.key_to_id:
+                        self.remove_locked(key)
+                ids = np.arange(self.next_id, self.next_id + len(key_list), dtype=np.int64)
+                self.next_id += len(key_list)
+
+                flatten_vectors = np.ascontiguousarray(vectors.reshape(len(key_list), -1), dtype=np.float32)
+                self.partitions[partition].add_with_ids(flatten_vectors, ids)
+                if partition in self.training:
+                    self.training[partition][1] += [('add', ids[num:num + 1], flatten_vectors[num:num + 1]) for num in range(len(key_list))]
+                for key, index_id in zip(key_list, ids.tolist()):
+                    self.key_to_id[key] = index_id
+                    self.id_to_key[index_id] = key
+                    self.key_partition[key] = partition
+                self.partition_keys[partition].update(key_list)
+                self.dirty.add(partition)
+
+            return True, f"Add [{len(key_list)}] data to index partition [{owner}]-[{vectors.shape[1:]}]."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def remove_locked(self, key: str) -> None:
+        index_id = self.key_to_id.pop(key)
+        partition = self.key_partition.pop(key)
+        del self.id_to_key[index_id]
+        self.partition_keys[partition].discard(key)
+        if self.partition_types[partition] == 'HNSW':
+            self.removed[partition].add(index_id)
+        else:
+            self.partitions[partition].remove_ids(np.array([index_id], dtype=np.int64))
+        if partition in self.training:
+            self.training[partition][1].append(('remove', index_id, None))
+        self.dirty.add(partition)
+
+
+    @traced('faiss.remove')
+    def remove(self, key: str) -> tuple[bool, str]:
+        try:
+            with self.lock:
+                if key not in self.key_to_id:
+                    return True, f"[{key}] is not in index."
+                self.remove_locked(key)
+            return True, f"Remove [{key}] from index."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def search(self, owner: str, vector: np.array, K: int, params: dict=None) -> tuple[bool, list, list, str]:
+        OK_search, key_lists, dis_lists, msg = self.search_batch(owner, vector[None], K, params)
+        if not OK_search:
+            return False, [], [], msg
+        return True, key_lists[0], dis_lists[0], msg
+
+
+    def selector(self, partition: tuple) -> tuple:
+        # faiss skips removed ids while it walks the index, so a search still asks for K results only
+        removed = self.removed[partition]
+        if not removed:
+            return (None, 0, None, None)
+        cached = self.selectors.get(partition)
+        if cached is None or cached[0] is not removed or cached[1] != len(removed):
+            batch = faiss.IDSelectorBatch(np.fromiter(removed, dtype=np.int64, count=len(removed)))
+            cached = (removed, len(removed), faiss.IDSelectorNot(batch), batch)  # IDSelectorNot does not own batch
+            self.selectors[partition] = cached
+        return cached  # callers hold the tuple while searching, it keeps both selectors alive
+
+
+    @traced('faiss.search')
+    def search_batch(self, owner: str, vectors: np.array, K: int, params: dict=None) -> tuple[bool, list, list, str]:
+        try:
+            params = params or {}
+            nq = vectors.shape[0]
+            with self.lock.read():
+                partition = (owner, tuple(vectors.shape[1:]))
+                if partition not in self.partitions or len(self.partition_keys[partition]) == 0:
+                    return True, [[] for _ in range(nq)], [[] for _ in range(nq)], f"No data of [{owner}] with shape [{vectors.shape[1:]}] found."
+
+                topK_index = self.partitions[partition]
+                index_type = self.partition_types[partition]
+                selection = self.selector(partition)
+                selector = selection[2]
+                if index_type in ['IVFFlat', 'IVFPQ']:
+                    search_params = faiss.SearchParametersIVF(sel=selector, nprobe=int(params.get('nprobe', self.nprobe)))
+                elif index_type == 'HNSW':
+                    search_params = faiss.SearchParametersHNSW(sel=selector, efSearch=int(params.get('efSearch', self.ef_search)))
+                else:
+                    search_params = faiss.SearchParameters(sel=selector)
+
+                k = min(K, topK_index.ntotal)
+                flatten_target = np.ascontiguousarray(vectors.reshape(nq, -1), dtype=np.float32)
+                dis, ind = topK_index.search(flatten_target, k, params=search_params)
+
+                key_lists, dis_lists = [], []
+                for query_ind, query_dis in zip(ind.tolist(), dis.tolist()):
+                    pairs = [(self.id_to_key[num], distance) for num, distance in zip(query_ind, query_dis) if num >= 0]
+                    key_lists.append([key for key, _ in pairs])
+                    dis_lists.append([distance for _, distance in pairs])
+
+            return True, key_lists, dis_lists, f"Search [{nq}] quer(ies) in [{index_type}] partition [{owner}]-[{vectors.shape[1:]}]."
+
+        except Exception as e:
+            return False, [], [], str(e)
+
+
+    def train(self, loader, logger: Logger) -> bool:
+        try:
+            for partition in list(self.partitions.keys()):
+                with self.lock:
+                    if partition in self.training:
+                        continue
+                    target = self.target_type(partition)
+                    current = self.partition_types[partition]
+                    live_num = len(self.partition_keys[partition])
+                    if target == current and len(self.removed[partition]) <= live_num * self.rebuild_ratio:
+                        continue
+                    key_list = list(self.partition_keys[partition])
+                    id_list = [self.key_to_id[key] for key in key_list]
+                    self.training[partition] = (target, [])
+
+                try:
+                    dimension = int(np.prod(partition[1]))
+                    vectors = loader(key_list)
+                    ids = np.array([index_id for index_id, vector in zip(id_list, vectors) if vector is not None], dtype=np.int64)
+                    data_bank = np.ascontiguousarray(
+                        np.array([vector for vector in vectors if vector is not None]).reshape(len(ids), dimension),
+                        dtype=np.float32
+                    )
+                    new_index = self.build_index(target, dimension, data_bank)
+                    new_index.add_with_ids(data_bank, ids)
+                except Exception as e:
+                    with self.lock:
+                        del self.training[partition]
+                    logger.log(f"Fail to train [{target}] index of partition [{partition[0]}]-[{partition[1]}]: {e}")
+                    continue
+
+                with self.lock:
+                    _, ops = self.training.pop(partition)
+                    removed = set()
+                    for op, index_id, flatten_vector in ops:
+                        if op == 'add':
+                            new_index.add_with_ids(flatten_vector, np.array(index_id, dtype=np.int64).reshape(-1))
+                        elif target == 'HNSW':
+                            removed.add(index_id)
+                        else:
+                            new_index.remove_ids(np.array(index_id, dtype=np.int64).reshape(-1))
+                    self.partitions[partition] = new_index
+                    self.partition_types[partition] = target
+                    self.removed[partition] = removed
+                    self.dirty.add(partition)
+
+                logger.log(f"Switch partition [{partition[0]}]-[{partition[1]}] from [{current}] to [{target}] index with [{len(ids)}] data.")
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def persist(self, logger: Logger) -> bool:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+
+            with self.persist_lock:
+                # serialize in memory under the shared lock, searches keep running and only writers wait
+                with self.lock.read():
+                    dirty = list(self.dirty)
+                    self.dirty = set()
+                    snapshots = []
+                    for partition in dirty:
+                        if len(self.partition_keys[partition]) == 0:
+                            snapshots.append((partition, None, None))
+                            continue
+                        ids = {key: self.key_to_id[key] for key in self.partition_keys[partition]}
+                        snapshots.append((partition, faiss.serialize_index(self.partitions[partition]),
+                            pickle.dumps((partition, ids, self.partition_types[partition], self.removed[partition]))))
+
+                try:
+                    for partition, index_bytes, meta_bytes in snapshots:
+                        name = self.partition_name(partition)
+                        index_path = os.path.join(self.root, f"{name}.index")
+                        meta_path = os.path.join(self.root, f"{name}.pkl")
+                        if index_bytes is None:
+                            for path in [index_path, meta_path]:
+                                if os.path.exists(path):
+                                    os.remove(path)
+                            continue
+
+                        index_bytes.tofile(index_path + '.tmp')
+                        with open(meta_path + '.tmp', 'wb') as file:
+                            file.write(meta_bytes)
+                        os.replace(index_path + '.tmp', index_path)
+                        os.replace(meta_path + '.tmp', meta_path)
+                except Exception:
+                    with self.lock:
+                        self.dirty.update(dirty)
+                    raise
+
+            if dirty:
+                logger.log(f"Persist [{len(dirty)}] index partition(s) to [{self.root}].")
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def load(self, logger: Logger) -> bool:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+
+            with self.lock:
+                for meta_path in glob.glob(os.path.join(self.root, '*.pkl')):
+                    index_path = meta_path.replace('.pkl', '.index')
+                    if not os.path.exists(index_path):
+                        continue
+                    with open(meta_path, 'rb') as file:
+                        meta = pickle.load(file)
+                    partition, ids = meta[0], meta[1]
+                    index_type, removed = (meta[2], meta[3]) if len(meta) > 2 else ('Flat', set())
+
+                    self.partitions[partition] = faiss.read_index(index_path)
+                    self.partition_types[partition] = index_type
+                    self.removed[partition] = removed
+                    self.partition_keys[partition] = set(ids.keys())
+                    for key, index_id in ids.items():
+                        self.key_to_id[key] = index_id
+                        self.id_to_key[index_id] = key
+                        self.key_partition[key] = partition
+                        self.next_id = max(self.next_id, index_id + 1)
+                    for index_id in removed:
+                        self.next_id = max(self.next_id, index_id + 1)
+
+            logger.log(f"Load [{len(self.key_to_id)}] indexed data in [{len(self.partitions)}] partition(s) from [{self.root}].")
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+class Record:
+    __slots__ = ('key', 'owner', 'data_shape', 'data_dtype', 'key_hash', 'data_hash',
+        'create_time', 'last_modified_time', 'path', 'location', 'size')
+
+    def __init__(self, key: str, owner: str, data_shape: tuple, data_dtype: str, key_hash: str, data_hash: str,
+        create_time: str, last_modified_time: str, path: str, location: tuple, size: str
+    ):
+        self.key = key
+        self.owner = owner
+        self.data_shape = data_shape
+        self.data_dtype = data_dtype
+        self.key_hash = key_hash
+        self.data_hash = data_hash
+        self.create_time = create_time
+        self.last_modified_time = last_modified_time
+        self.path = path
+        self.location = location
+        self.size = size
+
+
+    def to_data(self) -> Data:
+        data = Data(self.key, self.create_time, self.owner, self.path)
+        data.last_modified_time = self.last_modified_time
+        data.data_shape = self.data_shape
+        data.data_dtype = self.data_dtype
+        data.key_hash = self.key_hash
+        data.data_hash = self.data_hash
+        data.location = self.location
+        data.size = self.size
+        return data
+
+
+class Catalog:
+    def __init__(self, root: str='index'):
+        self.root = root  # holds the manifest snapshot of the catalog
+        self.manifest_path = os.path.join(root, 'manifest.npz')
+        self.records = {}  # key -> Record
+        self.data_hashes = {}  # data hash -> key
+        self.changed = False  # records differ from the manifest on disk
+        self.legacy_paths = []  # per-key index files replaced by the manifest
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # one manifest write at a time, from snapshot to replace, so an older one never lands last
+
+
+    def get(self, key: str) -> Record:
+        return self.records.get(key)
+
+
+    def get_by_hash(self, data_hash: str) -> Record:
+        key = self.data_hashes.get(data_hash)
+        if key is None:
+            return None
+        return self.records.get(key)
+
+
+    def put(self, record: Record) -> None:
+        with self.lock:
+            old_record = self.records.get(record.key)
+            if old_record is not None and self.data_hashes.get(old_record.data_hash) == record.key:
+                del self.data_hashes[old_record.data_hash]
+            self.records[record.key] = record
+            self.data_hashes[record.data_hash] = record.key
+            self.changed = True
+
+
+    def remove(self, key: str) -> Record:
+        with self.lock:
+            record = self.records.pop(key)
+            if self.data_hashes.get(record.data_hash) == key:
+                del self.data_hashes[record.data_hash]
+            self.changed = True
+            return record
+
+
+    def touch(self, key: str, now_time: str) -> None:
+        # access time only, it rides along with the next manifest a write causes instead of dirtying it on every read
+        with self.lock:
+            self.records[key].last_modified_time = now_time
+
+
+    def relocate(self, key: str, location: tuple, path: str) -> None:
+        with self.lock:
+            if key in self.records:
+                self.records[key].location = location
+                self.records[key].path = path
+                self.changed = True
+
+
+    def flush(self, logger: Logger) -> bool:
+        with self.flush_lock:
+            return self.write_manifest(logger)
+
+
+    def write_manifest(self, logger: Logger) -> bool:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+
+            with self.lock:
+                if not self.changed:
+                    return True
+                records = list(self.records.values())
+                self.changed = False
+
+            columns = {
+                'key': np.array([record.key for record in records], dtype=str),
+                'owner': np.array([record.owner for record in records], dtype=str),
+                'shape_ndim': np.array([len(record.data_shape) for record in records], dtype=np.int64),
+                'shape_dims': np.array([dim for record in records for dim in record.data_shape], dtype=np.int64),
+                'data_dtype': np.array([record.data_dtype for record in records], dtype=str),
+                'key_hash': np.array([record.key_hash or '' for record in records], dtype=str),
+                'data_hash': np.array([record.data_hash or '' for record in records], dtype=str),
+                'create_time': np.array([record.create_time for record in records], dtype=str),
+                'last_modified_time': np.array([record.last_modified_time for record in records], dtype=str),
+                'path': np.array([record.path for record in records], dtype=str),
+                'partition': np.array([record.location[0] for record in records], dtype=str),
+                'segment': np.array([record.location[1] for record in records], dtype=np.int64),
+                'row': np.array([record.location[2] for record in records], dtype=np.int64),
+                'size': np.array([record.size or '' for record in records], dtype=str),
+            }
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, **columns)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.manifest_path)
+
+            for path in self.legacy_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.legacy_paths = []
+
+            logger.log(f"Write manifest of [{len(records)}] record(s) to [{self.manifest_path}].")
+            return True
+
+        except Exception as e:
+            with self.lock:
+                self.changed = True
+            logger.log(e, level='error')
+            return False
+
+
+    def load(self, logger: Logger) -> bool:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+
+            if os.path.exists(self.manifest_path):
+                with np.load(self.manifest_path, allow_pickle=False) as manifest:
+                    columns = {name: manifest[name].tolist() for name in manifest.files}
+
+                offset = 0
+                for i, key in enumerate(columns['key']):
+                    ndim = columns['shape_ndim'][i]
+                    record = Record(key,
+                        columns['owner'][i],
+                        tuple(columns['shape_dims'][offset:offset + ndim]),
+                        columns['data_dtype'][i],
+                        columns['key_hash'][i] or None,
+                        columns['data_hash'][i] or None,
+                        columns['create_time'][i],
+                        columns['last_modified_time'][i],
+                        columns['path'][i],
+                        (columns['partition'][i], columns['segment'][i], columns['row'][i]),
+                        columns['size'][i] or None
+                    )
+                    offset += ndim
+                    self.records[key] = record
+                    self.data_hashes[record.data_hash] = key
+                logger.log(f"Load [{len(self.records)}] record(s) into catalog from [{self.manifest_path}].")
+
+            else:
+                self.legacy_paths = glob.glob(os.path.join(self.root, '*.pkl'))
+                for ind in self.legacy_paths:
+                    with open(ind, 'rb') as file:
+                        record = pickle.load(file).to_record()
+                    self.records[record.key] = record
+                    self.data_hashes[record.data_hash] = record.key
+                self.changed = len(self.legacy_paths) > 0
+                logger.log(f"Load [{len(self.records)}] record(s) into catalog from legacy index files.")
+
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+class WriteAheadLog:
+    def __init__(self, root: str='wal', commit_interval: float=0.005, commit_batch: int=128):
+        self.root = root  # directory of log files named by their first lsn
+        self.commit_interval = commit_interval  # max seconds a record waits for its group
+        self.commit_batch = commit_batch  # commit at once when this many records wait
+        self.header = struct.Struct('!QII')  # lsn, payload length, crc32
+        self.next_lsn = 1
+        self.committed_lsn = 0
+        self.checkpoint_lsn = 0  # every record up to it is materialized
+        self.pending = []  # (lsn, payload) waiting for group commit
+        self.cond = threading.Condition()
+        self.file_lock = threading.Lock()
+        self.file = None
+        self.file_start = None
+
+
+    def log_path(self, start_lsn: int) -> str:
+        return os.path.join(self.root, f"{start_lsn:020d}.log")
+
+
+    def log_files(self) -> list:
+        return sorted(glob.glob(os.path.join(self.root, '*.log')))
+
+
+    def open(self, logger: Logger) -> bool:
+        try:
+            if not os.path.exists(self.root):
+                os.mkdir(self.root)
+            checkpoint_path = os.path.join(self.root, 'checkpoint')
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path, 'r') as file:
+                    self.checkpoint_lsn = int(file.readline())
+
+            last_lsn = self.checkpoint_lsn
+            for lsn, _ in self.read():
+                last_lsn = max(last_lsn, lsn)
+            self.next_lsn = last_lsn + 1
+            self.committed_lsn = last_lsn
+            self.roll(self.next_lsn)
+
+            logger.log(f"Open write-ahead log at lsn [{self.next_lsn}], checkpoint at lsn [{self.checkpoint_lsn}].")
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def read(self):
+        for path in self.log_files():
+            with open(path, 'rb') as file:
+                while True:
+                    header = file.read(self.header.size)
+                    if len(header) < self.header.size:
+                        break
+                    lsn, length, crc = self.header.unpack(header)
+                    payload = file.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break  # torn tail of a crashed group commit
+                    if lsn > self.checkpoint_lsn:
+                        yield lsn, pickle.loads(payload)
+
+
+    def roll(self, start_lsn: int) -> None:
+        with self.file_lock:
+            if self.file is not None:
+                self.file.close()
+            self.file_start = start_lsn
+            self.file = open(self.log_path(start_lsn), 'ab')
+
+
+    def append(self, entry: tuple) -> int:
+        payload = pickle.dumps(entry)
+        with self.cond:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.pending.append((lsn, payload))
+            if len(self.pending) == 1 or len(self.pending) >= self.commit_batch:
+                self.cond.notify_all()
+        return lsn
+
+
+    @traced('wal.commit')
+    def wait(self, lsn: int, timeout: float=10) -> bool:
+        with self.cond:
+            return self.cond.wait_for(lambda: self.committed_lsn >= lsn, timeout)
+
+
+    def commit(self) -> int:
+        with self.cond:
+            batch = self.pending
+            self.pending = []
+        if not batch:
+            return 0
+
+        with self.file_lock:
+            for lsn, payload in batch:
+                self.file.write(self.header.pack(lsn, len(payload), zlib.crc32(payload)))
+                self.file.write(payload)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+        with self.cond:
+            self.committed_lsn = max(self.committed_lsn, batch[-1][0])
+            self.cond.notify_all()
+        return len(batch)
+
+
+    def run_commit(self, logger: Logger) -> bool:
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: len(self.pending) > 0)
+                    if len(self.pending) < self.commit_batch:
+                        self.cond.wait(self.commit_interval)
+                self.commit()
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def truncate(self, lsn: int, logger: Logger) -> bool:
+        try:
+            checkpoint_path = os.path.join(self.root, 'checkpoint')
+            with open(checkpoint_path + '.tmp', 'w') as file:
+                file.write(str(lsn))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(checkpoint_path + '.tmp', checkpoint_path)
+            self.checkpoint_lsn = lsn
+
+            for path in self.log_files():
+                if path < self.log_path(self.file_start):
+                    os.remove(path)
+            return True
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
 class Handler:
-    def __init__(self):
-        self.keys = {}
-        self.data_hashes = {}
+    def __init__(self, commit_interval: float=0.005, commit_batch: int=128, index_config: dict=None, metrics: Metrics=None):
+        self.catalog = Catalog()
+        self.store = SegmentStore()
+        self.vector_index = VectorIndex(index_config=index_config)
+        self.wal = WriteAheadLog(commit_interval=commit_interval, commit_batch=commit_batch)
+        self.rw_lock = RWLock()  # mutations take it whole and in log order, lookups share it
+        self.read_opt = ['find', 'hash', 'topK', 'batchTopK', 'catalog', 'stats']
+        self.compact_ratio = 0.5  # compact sealed segments with this tombstone ratio
+        self.startup_time = None  # seconds the last rebuild took
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.gauge('azu_slave_keys', lambda: len(self.catalog.records))
+        self.metrics.gauge('azu_slave_index_vectors', lambda: len(self.vector_index.key_to_id))
+        self.metrics.gauge('azu_slave_index_partitions', lambda: len(self.vector_index.partitions))
+        self.metrics.gauge('azu_slave_segments', lambda: sum(len(segments) for segments in self.store.segments.values()))
+        self.metrics.gauge('azu_slave_wal_pending', lambda: len(self.wal.pending))
+        self.metrics.gauge('azu_slave_wal_lag', lambda: self.wal.next_lsn - 1 - self.wal.committed_lsn)
 
 
     def rebuild(self, logger: Logger) -> bool:
         try:
-            rebuild_num = 0
-            index_root = 'index/'
-            if not os.path.exists(index_root):
-                os.mkdir(index_root)
-            for ind in glob.glob(index_root + '/*.pkl'):
-                with open(ind, 'rb') as file:
-                    index = pickle.load(file)
-                    key, data_path = index.key, index.path
-                    index_path = data_path.replace('data/', 'index/').replace('.npy', '.pkl')
-                    hash_value = data_path.split('/')[-1].split('.')[0]
-                    self.keys[key] = [hash_value, index_path, data_path]
-                    self.data_hashes[hash_value] = [key, index_path, data_path]
-                    rebuild_num += 1
-            logger.log(f"Rebuild [{rebuild_num}] data from disk successfully.")
+            start_time = time.time()
+            if not self.catalog.load(logger):
+                return False
+            locations = {key: record.location for key, record in self.catalog.records.items() if record.location is not None}
+            OK_load_store, missing_keys = self.store.load(locations, logger)
+            if not OK_load_store:
+                return False
+            for key in missing_keys:
+                self.catalog.remove(key)
+                logger.log(f"Drop [{key}] whose data is missing in segment store.")
+
+            OK_migrate, msg = self.migrate_npy(logger)
+            logger.log(msg)
+
+            owners = {key: (record.owner, record.data_shape) for key, record in self.catalog.records.items()}
+            logger.log(f"Rebuild [{len(owners)}] data from disk successfully.")
+
+            self.vector_index.load(logger)
+            OK_sync_index, msg = self.sync_index(owners)
+            logger.log(msg)
+
+            if not self.wal.open(logger):
+                return False
+            OK_replay, msg = self.replay(logger)
+            logger.log(msg)
+            if not OK_replay or not self.checkpoint(logger):
+                return False
+
+            self.startup_time = time.time() - start_time
+            logger.log(f"Slave startup takes [{self.startup_time:.3f}] seconds.")
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def sync_index(self, owners: dict) -> tuple[bool, str]:
+        try:
+            stale_keys = [key for key in self.vector_index.key_to_id if key not in owners]
+            for key in stale_keys:
+                self.vector_index.remove(key)
+
+            missing = set()
+            for key, (owner, data_shape) in owners.items():
+                if self.vector_index.key_partition.get(key) != (owner, tuple(data_shape)):
+                    missing.add(self.catalog.get(key).location[0])
+
+            added_num = 0
+            for name in missing:
+                owner = self.store.partitions[name][0]
+                key_list, data_bank = self.store.scan(name)
+                for key, vector in zip(key_list, data_bank):
+                    if self.vector_index.key_partition.get(key) == (owner, vector.shape):
+                        continue
+                    OK_add, msg = self.vector_index.add(owner, key, vector)
+                    if not OK_add:
+                        return False, msg
+                    added_num += 1
+
+            return True, f"Sync index with disk, remove [{len(stale_keys)}] stale and add [{added_num}] missing data."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def migrate_npy(self, logger: Logger) -> tuple[bool, str]:
+        try:
+            legacy_paths = []
+            for key, record in list(self.catalog.records.items()):
+                if record.location is not None:
+                    continue
+                if not os.path.exists(record.path):
+                    self.catalog.remove(key)
+                    continue
+                index = record.to_data()
+                legacy_paths.append(index.path)
+                OK_save_data, msg = index.save_data(np.load(index.path), self.store)
+                if not OK_save_data:
+                    return False, msg
+                self.catalog.put(index.to_record())
+
+            if legacy_paths:
+                self.flush(logger)
+                for path in legacy_paths:
+                    os.remove(path)
+            return True, f"Migrate [{len(legacy_paths)}] .npy data into segment store."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def replay(self, logger: Logger) -> tuple[bool, str]:
+        try:
+            replay_num = 0
+            for lsn, entry in self.wal.read():
+                if entry[0] == 'put':
+                    _, key, owner, vector, create_time, now_time = entry
+                    OK_put, msg = self.put_data(key, owner, vector, create_time, now_time, logger)
+                elif entry[0] == 'bulk':
+                    _, key_list, owner, vectors, now_time = entry
+                    OK_put, msg = self.put_batch(key_list, owner, vectors, now_time, logger)
+                elif entry[0] == 'delete':
+                    _, key = entry
+                    OK_put, msg = True, ''
+                    if self.catalog.get(key) is not None:
+                        OK_put, msg = self.drop_data(key)
+                if not OK_put:
+                    return False, f"Fail to replay lsn [{lsn}]: {msg}"
+                replay_num += 1
+            return True, f"Replay [{replay_num}] write-ahead log record(s)."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def flush(self, logger: Logger) -> bool:
+        if not self.store.flush(logger):
+            return False
+        return self.catalog.flush(logger)
+
+
+    def checkpoint(self, logger: Logger) -> bool:
+        try:
+            with self.rw_lock:
+                lsn = self.wal.next_lsn - 1
+                if lsn <= self.wal.checkpoint_lsn:
+                    return self.flush(logger) and self.vector_index.persist(logger)
+                self.wal.roll(lsn + 1)
+
+            if not self.flush(logger):
+                return False
+            if not self.vector_index.persist(logger):
+                return False
+            if not self.wal.truncate(lsn, logger):
+                return False
+            logger.log(f"Checkpoint materialized data up to lsn [{lsn}].")
             return True
+
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
-    def handle(self, msg, logger: Logger) -> tuple[bool, bytes]:
+    def run_checkpoint(self, inter: int, logger: Logger) -> bool:
+        try:
+            while True:
+                time.sleep(inter)
+                self.checkpoint(logger)
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def compact(self, logger: Logger) -> bool:
+        try:
+            OK_compact, moved, dropped, msg = self.store.compact(self.compact_ratio)
+            if not OK_compact:
+                logger.log(msg, level='error')
+                return False
+            if not dropped:
+                return True
+            with self.store.lock:
+                for key, location in moved.items():
+                    if self.store.offsets.get(key) == location:
+                        self.catalog.relocate(key, location, self.store.segment_path(location))
+            if not self.flush(logger):
+                return False
+            logger.log(f"Compaction moves [{len(moved)}] live data out of [{len(dropped)}] segment(s).")
+            return self.store.drop(dropped, logger)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def load_vectors(self, key_list: list) -> list:
+        vectors = []
+        for key in key_list:
+            OK_read, vector, _ = self.store.read(key)
+            vectors.append(vector if OK_read else None)
+        return vectors
+
+
+    def run_train(self, inter: int, logger: Logger) -> bool:
+        try:
+            while True:
+                time.sleep(inter)
+                self.vector_index.train(self.load_vectors, logger)
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def run_compact(self, inter: int, logger: Logger) -> bool:
+        try:
+            while True:
+                time.sleep(inter)
+                self.compact(logger)
+            return True
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+
+    def handle(self, msg, logger: Logger) -> tuple[bool, object]:
         try:
             if isinstance(msg, str):
                 opt = msg.split('#')[1]
@@ -196,31 +1473,52 @@ class Handler:
                 cmd, vector = msg[0], msg[1]
                 opt = cmd.split('#')[1]
 
-            print(opt, msg)
+            logger.log(f"Handle [{opt}] [{summary(msg)}].", level='debug')
+            start_time = time.perf_counter()
+            signal, return_msg = False, f"{False}#No operation mapping to [{opt}]."
+
+            shared = self.rw_lock.read() if opt in self.read_opt else contextlib.nullcontext()
+            with shared:
+                if opt == 'upload':
+                    signal, return_msg = self.create_data(cmd, vector, logger)
+
+                elif opt == 'bulkUpload':
+                    signal, return_msg = self.create_batch_data(cmd, vector, logger)
+
+                elif opt == 'delete':
+                    signal, return_msg = self.delete_data(msg, logger)
 
-            if opt == 'upload':
-                signal, return_msg_bytes = self.create_data(cmd, vector, logger)
+                elif opt == 'modify':
+                    signal, return_msg = self.modify_data(cmd, vector, logger)
 
-            elif opt == 'delete':
-                signal, return_msg_bytes = self.delete_data(msg, logger)
+                elif opt == 'find':
+                    signal, return_msg = self.look_data(msg, logger)
 
-            elif opt == 'modify':
-                signal, return_msg_bytes = self.modify_data(cmd, vector, logger)
+                elif opt == 'hash':
+                    signal, return_msg = self.find_hash_data(msg, logger)
 
-            elif opt == 'find':
-                signal, return_msg_bytes = self.look_data(msg, logger)
+                elif opt == 'topK':
+                    signal, return_msg = self.find_similar_topK(cmd, vector, logger)
 
-            elif opt == 'hash':
-                signal, return_msg_bytes = self.find_hash_data(msg, logger)
+                elif opt == 'batchTopK':
+                    signal, return_msg = self.find_similar_batch_topK(cmd, vector, logger)
 
-            elif opt == 'topK':
-                signal, return_msg_bytes = self.find_similar_topK(cmd, vector, logger)
+                elif opt == 'catalog':
+                    signal, return_msg = self.export_catalog(msg, logger)
 
-            return signal, return_msg_bytes
+                elif opt == 'ping':
+                    signal, return_msg = True, f"{True}#pong"
+
+                elif opt == 'stats':
+                    signal, return_msg = self.export_stats(msg, logger)
+
+            self.metrics.observe('azu_handler_seconds', time.perf_counter() - start_time, op=opt)
+            self.metrics.inc('azu_handler_requests_total', op=opt, status=signal)
+            return signal, return_msg
 
         except Exception as e:
-            logger.log(e)
-            return False, pickle.dumps(str(e))
+            logger.log(e, level='error')
+            return False, str(e)
 
 
     def get_time(self) -> str:
@@ -228,61 +1526,192 @@ class Handler:
         return str(now_time)
 
 
-    def create_data(self, cmd: str, vector: np.array, logger: Logger) -> tuple[bool, bytes]:
+    def create_data(self, cmd: str, vector: np.array, logger: Logger) -> tuple[bool, object]:
         try:
             name, opt, key = cmd.split('#')
             if name != 'admin':
                 return_msg = f"False#[{name}] have no privilege to upload data. This operation is logged."
                 logger.log(return_msg)
-                return False, pickle.dumps(return_msg)
-            if key in self.keys.keys():
-                msg = f"[{key}] is not unique. Fail to create data."
-                logger.log(msg)
-                return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
-            else:
-                if not os.path.exists('data'):
-                    os.mkdir('data')
-                    
+                return False, return_msg
+            with self.rw_lock:
+                if self.catalog.get(key) is not None:
+                    msg = f"[{key}] is not unique. Fail to create data."
+                    logger.log(msg)
+                    return_msg = f"{False}#{msg}"
+                    return False, return_msg
+
                 now_time = self.get_time()
-                OK_cal_key_hash, key_hash_value, msg = self.cal_key_hash(key)
+                OK_save_index, msg = self.put_data(key, name, vector, now_time, now_time, logger)
+                if OK_save_index:
+                    lsn = self.wal.append(('put', key, name, vector, now_time, now_time))
+
+            OK_commit = OK_save_index and self.wal.wait(lsn)
+            if OK_save_index and not OK_commit:
+                msg = f"Fail to commit [{key}] to write-ahead log."
                 logger.log(msg)
-                tensor_save_path = os.path.join('data', f"{key_hash_value}.npy")
 
-                new_data = Data(key,
-                    now_time,
-                    name,
-                    tensor_save_path
-                )
+            record = self.catalog.get(key)
+            return_msg = (f"{OK_save_index and OK_commit}#{msg}", record.data_hash if record is not None else None)
+            return True, return_msg
 
-                logger.log(f"Create data [{key}] successfully.")
+        except Exception as e:
+            logger.log(e, level='error')
+            return_msg = f"{False}#{e}"
+            return False, return_msg
 
-                OK_cal_vector_hash, data_hash_value, msg = self.cal_vector_hash(vector)
-                if not OK_cal_vector_hash:
-                    logger.log(msg)
-                else:
-                    OK_update_data_hash, msg = new_data.update_data_hash(data_hash_value)
-                    logger.log(msg)
 
-                OK_save_data, msg = new_data.save_data(vector)
-                logger.log(msg)
+    def put_data(self, key: str, owner: str, vector: np.array, create_time: str, now_time: str, logger: Logger) -> tuple[bool, str]:
+        try:
+            OK_cal_key_hash, key_hash_value, msg = self.cal_key_hash(key)
+            logger.log(msg)
+            new_data = Data(key,
+                create_time,
+                owner,
+                None
+            )
+            OK_update_key_hash, msg = new_data.update_key_hash(key_hash_value)
+            logger.log(msg)
+            OK_update_last_modified_time, msg = new_data.update_last_modified_time(now_time)
+            logger.log(msg)
 
-                OK_get_shape, msg = new_data.get_shape(vector)
-                logger.log(msg)
+            logger.log(f"Create data [{key}] successfully.")
 
-                OK_get_size, msg = new_data.get_size()
+            OK_cal_vector_hash, data_hash_value, msg = self.cal_vector_hash(vector)
+            if not OK_cal_vector_hash:
                 logger.log(msg)
-
-                OK_save_index, msg = self.save_index(new_data)
+            else:
+                OK_update_data_hash, msg = new_data.update_data_hash(data_hash_value)
                 logger.log(msg)
 
-                return_msg = f"{OK_save_index}#{msg}"
-                return True, pickle.dumps(return_msg)
+            OK_save_data, msg = new_data.save_data(vector, self.store)
+            logger.log(msg)
+            if not OK_save_data:
+                return False, msg
+
+            OK_get_shape, msg = new_data.get_shape(vector)
+            logger.log(msg)
+
+            OK_get_size, msg = new_data.get_size()
+            logger.log(msg)
+
+            OK_save_index, msg = self.save_index(new_data)
+            logger.log(msg)
+
+            OK_add_index, add_msg = self.vector_index.add(owner, key, vector)
+            logger.log(add_msg)
+
+            return OK_save_index, msg
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def create_batch_data(self, cmd: str, payload: tuple, logger: Logger) -> tuple[bool, object]:
+        try:
+            name, opt = cmd.split('#')[:2]
+            if name != 'admin':
+                return_msg = f"False#[{name}] have no privilege to upload data. This operation is logged."
+                logger.log(return_msg)
+                return False, return_msg
+
+            key_list, vectors = payload
+            if len(key_list) != len(vectors):
+                msg = f"Got [{len(key_list)}] keys for [{len(vectors)}] vectors. Fail to create data."
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+            key_status = []
+            with self.rw_lock:
+                accept, seen = [], set()
+                for num, key in enumerate(key_list):
+                    if key in seen or self.catalog.get(key) is not None:
+                        key_status.append((key, False, f"[{key}] is not unique."))
+                    else:
+                        key_status.append((key, True, f"Create [{key}]."))
+                        accept.append(num)
+                        seen.add(key)
+
+                OK_put_batch, msg = True, "No new data."
+                if accept:
+                    accept_keys = [key_list[num] for num in accept]
+                    accept_vectors = vectors if len(accept) == len(key_list) else vectors[accept]
+                    now_time = self.get_time()
+                    OK_put_batch, msg = self.put_batch(accept_keys, name, accept_vectors, now_time, logger)
+                    if OK_put_batch:
+                        lsn = self.wal.append(('bulk', accept_keys, name, accept_vectors, now_time))
+
+            OK_commit = True
+            if accept and OK_put_batch:
+                OK_commit = self.wal.wait(lsn)
+            if not OK_put_batch or not OK_commit:
+                for num in accept:
+                    key_status[num] = (key_list[num], False, msg if not OK_put_batch else "Fail to commit to write-ahead log.")
+
+            done_num = sum(1 for _, OK_create, _ in key_status if OK_create)
+            msg = f"Create [{done_num}] of [{len(key_list)}] data in bulk."
+            logger.log(msg)
+            data_hashes = {key: self.catalog.get(key).data_hash for key, OK_create, _ in key_status if OK_create}
+            return_msg = (f"{done_num == len(key_list)}#{msg}", key_status, data_hashes)
+            return True, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
+            return False, return_msg
+
+
+    def put_batch(self, key_list: list, owner: str, vectors: np.array, now_time: str, logger: Logger) -> tuple[bool, str]:
+        try:
+            OK_cal_vector_hashes, data_hashes, msg = self.cal_vector_hashes(vectors)
+            if not OK_cal_vector_hashes:
+                return False, msg
+
+            OK_append, locations, msg = self.store.append_batch(owner, key_list, vectors)
+            logger.log(msg)
+            if not OK_append:
+                return False, msg
+
+            template = Data(None, now_time, owner, None)
+            template.get_shape(vectors[0])
+            template.get_size()
+            for key, data_hash, location in zip(key_list, data_hashes, locations):
+                self.catalog.put(Record(key,
+                    owner,
+                    template.data_shape,
+                    template.data_dtype,
+                    hashlib.sha256(key.encode('utf-8')).hexdigest(),
+                    data_hash,
+                    now_time,
+                    now_time,
+                    self.store.segment_path(location),
+                    location,
+                    template.size
+                ))
+
+            OK_add_index, msg = self.vector_index.add_batch(owner, key_list, vectors)
+            logger.log(msg)
+            if not OK_add_index:
+                return False, msg
+
+            return True, f"Put [{len(key_list)}] data of [{owner}] in one batch."
+
+        except Exception as e:
+            return False, str(e)
+
+
+    @traced('hash')
+    def cal_vector_hashes(self, vectors: np.array) -> tuple[bool, list, str]:
+        try:
+            rows = np.ascontiguousarray(vectors).reshape(len(vectors), -1)
+            row_bytes = rows.shape[1] * rows.itemsize
+            buffer = memoryview(rows).cast('B')
+            hash_values = [hashlib.sha256(buffer[num * row_bytes:(num + 1) * row_bytes]).hexdigest() for num in range(len(rows))]
+
+            return True, hash_values, f"[{len(hash_values)}] data map to sha256 values."
+
+        except Exception as e:
+            return False, [], str(e)
 
 
     def cal_key_hash(self, key: str) -> tuple[bool, str, str]:
@@ -296,6 +1725,7 @@ class Handler:
             return False, '', str(e)
 
 
+    @traced('hash')
     def cal_vector_hash(self, vector: np.array) -> tuple[bool, str, str]:
         try:
             vector_bytes = vector.flatten().tobytes()
@@ -309,117 +1739,132 @@ class Handler:
 
     def save_index(self, index: Data) -> tuple[bool, str]:
         try:
-            index_path = index.path.replace('data/', 'index/').replace('.npy', '.pkl')
+            self.catalog.put(index.to_record())
 
-            with open(index_path, 'wb') as file:
-                pickle.dump(index, file)
-            data_hash = index.data_hash
-            self.keys[index.key] = [data_hash, index_path, index.path]
-            self.data_hashes[data_hash] = [index.key, index_path, index.path]
-
-            return True, f"Save index [{index.key}] to [{index.path}] successfully."
+            return True, f"Save index [{index.key}] to catalog successfully."
 
         except Exception as e:
             return False, str(e)
 
 
-    def delete_data(self, cmd: str, logger: Logger) -> tuple[bool, bytes]:
+    def delete_data(self, cmd: str, logger: Logger) -> tuple[bool, object]:
         try:
             name, opt, key = cmd.split('#')
             if name != 'admin':
                 msg = f"[{name}] has no privilege to delete data. This operation is logged."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
-
-            if key in self.keys.keys():
-                index_path = self.keys[key][1]
+                return False, return_msg
 
-                with open(index_path, 'rb') as file:
-                    index = pickle.load(file)
-                data_owner = index.owner
+            record = self.catalog.get(key)
+            if record is not None:
+                data_owner = record.owner
 
                 if data_owner != name:
                     msg = f"[{name}] has no privilege to delete other's data. This operation is logged."
                     logger.log(msg)
                     return_msg = f"{False}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return False, return_msg
 
                 else:
                     OK_delete_data, msg = self.delete_target_data(key)
                     logger.log(msg)
                     return_msg = f"{OK_delete_data}#{msg}"
-                    return OK_delete_data, pickle.dumps(return_msg)
+                    return OK_delete_data, return_msg
             else:
                 msg = f"[{key}] is not stored here."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
+            return False, return_msg
 
 
     def delete_target_data(self, key: str) -> tuple[bool, str]:
         try:
-            data_hash_value, index_path, data_path = self.keys[key]
-            del self.data_hashes[data_hash_value]
-            os.remove(index_path)
-            os.remove(data_path)
-            del self.keys[key]
+            with self.rw_lock:
+                OK_drop_data, msg = self.drop_data(key)
+                if OK_drop_data:
+                    lsn = self.wal.append(('delete', key))
+            if OK_drop_data and not self.wal.wait(lsn):
+                return False, f"Fail to commit deletion of [{key}] to write-ahead log."
+            return OK_drop_data, msg
+        except Exception as e:
+            return False, str(e)
+
+
+    def drop_data(self, key: str) -> tuple[bool, str]:
+        try:
+            record = self.catalog.remove(key)
+            data_hash_value = record.data_hash
+            OK_delete, msg = self.store.delete(key)
+            if not OK_delete:
+                return False, msg
+            OK_remove_index, msg = self.vector_index.remove(key)
+            if not OK_remove_index:
+                return False, msg
             return True, f"Data [{key}-{data_hash_value}] has been deleted successfully."
         except Exception as e:
             return False, str(e)
 
 
-    def modify_data(self, input_msg: str, vector: np.array, logger: Logger) -> tuple[bool, bytes]:
+    def modify_data(self, input_msg: str, vector: np.array, logger: Logger) -> tuple[bool, object]:
         try:
             name, opt, key, cmd = input_msg.split('#')
             if name != 'admin':
                 msg = f"[{name}] has no privilege to modify data. This operation is logged."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
-
-            if key in self.keys.keys():
-                index_path = self.keys[key][1]
+                return False, return_msg
 
-                with open(index_path, 'rb') as file:
-                    index = pickle.load(file)
-                data_owner = index.owner
+            record = self.catalog.get(key)
+            if record is not None:
+                data_owner = record.owner
 
                 if data_owner != name:
                     msg = f"[{name}] has no privilege to modify other's data. This operation is logged."
                     logger.log(msg)
                     return_msg = f"{False}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return False, return_msg
 
                 else:
                     OK_modify_data, msg = self.modify_target_data(key, cmd, vector, logger)
                     logger.log(msg)
-                    return_msg = f"{OK_modify_data}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return_msg = (f"{OK_modify_data}#{msg}", self.catalog.get(key).data_hash)
+                    return OK_modify_data, return_msg
             else:
                 msg = f"[{key}] is not stored here."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
+            return False, return_msg
 
 
     def modify_target_data(self, key: str, cmd: str, new_data: np.array, logger: Logger) -> tuple[bool, str]:
         try:
-            _, index_path, data_path = self.keys[key]
-            with open(index_path, 'rb') as file:
-                index = pickle.load(file)
+            with self.rw_lock:
+                OK_modify_data, modified_data, index, msg = self.change_data(key, cmd, new_data, logger)
+                if OK_modify_data:
+                    lsn = self.wal.append(('put', key, index.owner, modified_data, index.create_time, index.last_modified_time))
+            if OK_modify_data and not self.wal.wait(lsn):
+                return False, f"Fail to commit modification of [{key}] to write-ahead log."
+            return OK_modify_data, msg
+        except Exception as e:
+            return False, str(e)
+
+
+    def change_data(self, key: str, cmd: str, new_data: np.array, logger: Logger) -> tuple[bool, np.array, Data, str]:
+        try:
+            index = self.catalog.get(key).to_data()
 
-            OK_modify_data, modified_data, msg = index.modify_data(cmd, new_data)
+            OK_modify_data, modified_data, msg = index.modify_data(cmd, new_data, self.store)
             logger.log(msg)
 
             if OK_modify_data:
@@ -432,72 +1877,65 @@ class Handler:
                 OK_update_last_modified_time, msg = index.update_last_modified_time(now_time)
                 logger.log(msg)
 
-                with open(index_path, 'wb') as file:
-                    pickle.dump(index, file)
+                self.catalog.put(index.to_record())
 
-                return OK_modify_data, f"Modify [{key}] done."
+                OK_add_index, msg = self.vector_index.add(index.owner, key, modified_data)
+                logger.log(msg)
+
+                return OK_modify_data, modified_data, index, f"Modify [{key}] done."
 
             else:
-                return OK_modify_data, msg
+                return OK_modify_data, None, index, msg
         except Exception as e:
-            return False, str(e)
+            return False, None, None, str(e)
 
 
-    def look_data(self, cmd: str, logger: Logger) -> tuple[bool, bytes]:
+    def look_data(self, cmd: str, logger: Logger) -> tuple[bool, object]:
         try:
             name, opt, key = cmd.split('#')
             if name == 'other':
                 msg = f"[{name}] has no privilege to look data. This operation is logged."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
-            if key in self.keys.keys():
-                index_path = self.keys[key][1]
-
-                with open(index_path, 'rb') as file:
-                    index = pickle.load(file)
-                data_owner = index.owner
+            record = self.catalog.get(key)
+            if record is not None:
+                data_owner = record.owner
 
                 if data_owner != name:
                     msg = f"[{name}] has no privilege to look other's data. This operation is logged."
                     logger.log(msg)
                     return_msg = f"{False}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return False, return_msg
 
                 else:
                     OK_look_data, msg, vector = self.look_target_data(key, logger)
                     logger.log(msg)
                     return_msg = (f"{OK_look_data}#{msg}", vector)
-                    return OK_look_data, pickle.dumps(return_msg)
+                    return OK_look_data, return_msg
             else:
                 msg = f"[{key}] is not stored here."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
+            return False, return_msg
 
 
     def look_target_data(self, key: str, logger: Logger) -> tuple[bool, str, np.array]:
         try:
-            _, index_path, data_path = self.keys[key]
-            with open(index_path, 'rb') as file:
-                index = pickle.load(file)
+            index = self.catalog.get(key).to_data()
 
-            OK_look_data, look_data, msg = index.look_data()
+            OK_look_data, look_data, msg = index.look_data(self.store)
             logger.log(msg)
 
             if OK_look_data:
                 now_time = self.get_time()
-                OK_update_last_modified_time, msg = index.update_last_modified_time(now_time)
-                logger.log(msg)
-
-                with open(index_path, 'wb') as file:
-                    pickle.dump(index, file)
+                self.catalog.touch(key, now_time)
 
                 return OK_look_data, f"Return [{key}] data.", look_data
 
@@ -505,61 +1943,52 @@ class Handler:
                 return OK_look_data, f"Fail to look [{key}] data.", None
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False, str(e), None
 
 
-    def find_hash_data(self, cmd: str, logger: Logger) -> tuple[bool, bytes]:
+    def find_hash_data(self, cmd: str, logger: Logger) -> tuple[bool, object]:
         try:
             name, opt, hash_value = cmd.split('#')
             if name == 'other':
                 msg = f"[{name}] has no privilege to find data. This operation is logged."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
-
-            if hash_value in self.data_hashes.keys():
-                index_path = self.data_hashes[hash_value][1]
+                return False, return_msg
 
-                with open(index_path, 'rb') as file:
-                    index = pickle.load(file)
-                data_owner = index.owner
+            record = self.catalog.get_by_hash(hash_value)
+            if record is not None:
+                data_owner = record.owner
 
                 if data_owner !=name:
                     msg = "No target data found."
                     logger.log(msg)
                     return_msg = f"{False}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return False, return_msg
 
                 else:
                     OK_find_hash_data, key, msg = self.find_target_hash_data(hash_value, logger)
                     logger.log(msg)
-                    return_msg = f"{OK_find_hash_data}#{msg}"
-                    return False, pickle.dumps(return_msg)
+                    return_msg = (f"{OK_find_hash_data}#{msg}", key)
+                    return OK_find_hash_data, return_msg
             else:
                 msg = f"[{hash_value}] is not stored here."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
+            return False, return_msg
 
 
     def find_target_hash_data(self, data_hash: str, logger: Logger) -> tuple[bool, str, str]:
         try:
-            key, index_path, _ = self.data_hashes[data_hash]
-            with open(index_path, 'rb') as file:
-                index = pickle.load(file)
+            key = self.catalog.get_by_hash(data_hash).key
 
             now_time = self.get_time()
-            OK_update_last_modified_time, msg = index.update_last_modified_time(now_time)
-            logger.log(msg)
-
-            with open(index_path, 'wb') as file:
-                pickle.dump(index, file)
+            self.catalog.touch(key, now_time)
 
             return True, key, f"Find hash [{data_hash}] with key [{key}]"
 
@@ -567,79 +1996,282 @@ class Handler:
             return False, '', str(e)
 
 
-    def find_similar_topK(self, cmd: str, vector: np.array, logger: Logger) -> tuple[bool, bytes]:
+    def find_similar_topK(self, cmd: str, vector: np.array, logger: Logger) -> tuple[bool, object]:
         try:
-            name, opt, K = cmd.split('#')
+            name, opt, K = cmd.split('#')[:3]
             K = int(K)
             if name == 'other':
                 msg = f"[{name}] has no privilege to find data. This operation is logged."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
+
+            OK_parse, params, msg = self.parse_search_params(cmd)
+            if not OK_parse:
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
 
-            OK_find_topK, topK_list, msg = self.find_topK(name, vector, K, logger)
+            OK_find_topK, topK_list, dis_list, msg = self.find_topK(name, vector, K, logger, params)
             logger.log(msg)
 
             if OK_find_topK:
-                return_msg = f"{OK_find_topK}#{msg}"
-                return True, pickle.dumps(return_msg)
+                return_msg = (f"{OK_find_topK}#{msg}", (topK_list, dis_list))
+                return True, return_msg
 
             else:
                 msg = f"Fail to find top-[{K}] similar data."
                 logger.log(msg)
                 return_msg = f"{False}#{msg}"
-                return False, pickle.dumps(return_msg)
+                return False, return_msg
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return_msg = f"{False}#{e}"
-            return False, pickle.dumps(return_msg)
-
-
-    def find_topK(self, name: str, vector: np.array, K: int, logger: Logger) -> tuple[bool, list, str]:
-        try:
-            target_vector_shape = vector.shape
-            key_list = []
-            data_list = []
-            for key in self.keys.keys():
-                data_hash, index_path, data_path = self.keys[key]
-                with open(index_path, 'rb') as file:
-                    index = pickle.load(file)
-                if index.owner == name and index.data_shape == target_vector_shape:
-                    data = np.load(data_path)
-                    key_list.append(index.key)
-                    data_list.append(data.flatten()[None, :])
-                print(index.owner, name, index.data_shape, target_vector_shape)
-
-            if len(key_list) < K:
-                return True, key_list, f"Only [{len(key_list)}] data found, return them all back {key_list}."
+            return False, return_msg
+
+
+    def find_similar_batch_topK(self, cmd: str, vectors: np.array, logger: Logger) -> tuple[bool, object]:
+        try:
+            name, opt, K = cmd.split('#')[:3]
+            K = int(K)
+            if name == 'other':
+                msg = f"[{name}] has no privilege to find data. This operation is logged."
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+            OK_parse, params, msg = self.parse_search_params(cmd)
+            if not OK_parse:
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+            OK_search, key_lists, dis_lists, msg = self.vector_index.search_batch(name, vectors, K, params)
+            logger.log(msg)
+
+            if OK_search:
+                msg = f"Find top-[{K}] similar data for [{len(key_lists)}] quer(ies)."
+                logger.log(msg)
+                return_msg = (f"{True}#{msg}", list(zip(key_lists, dis_lists)))
+                return True, return_msg
+
             else:
-                flatten_target = vector.flatten()[None, :]
-                data_bank = np.concatenate(data_list)
-                dimension = flatten_target.shape[-1]
-                topK_index = faiss.IndexFlatL2(dimension)
-                topK_index.add(data_bank)
-                dis, ind = topK_index.search(flatten_target, K)
+                msg = f"Fail to find top-[{K}] similar data in batch: {msg}"
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return_msg = f"{False}#{e}"
+            return False, return_msg
+
+
+    def export_catalog(self, cmd: str, logger: Logger) -> tuple[bool, object]:
+        try:
+            name, opt = cmd.split('#')[:2]
+            if name != 'master':
+                msg = f"[{name}] has no privilege to export catalog. This operation is logged."
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+            with self.catalog.lock:
+                records = list(self.catalog.records.values())
+            key_list = [record.key for record in records]
+            data_hashes = [record.data_hash for record in records]
+            msg = f"Export [{len(key_list)}] catalog entries."
+            logger.log(msg)
+            return_msg = (f"{True}#{msg}", (key_list, data_hashes))
+            return True, return_msg
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return_msg = f"{False}#{e}"
+            return False, return_msg
+
+
+    def export_stats(self, cmd: str, logger: Logger) -> tuple[bool, object]:
+        try:
+            name, opt = cmd.split('#')[:2]
+            if name != 'master':
+                msg = f"[{name}] has no privilege to export stats. This operation is logged."
+                logger.log(msg)
+                return_msg = f"{False}#{msg}"
+                return False, return_msg
+
+            return_msg = (f"{True}#Export slave metrics.", self.metrics.snapshot())
+            return True, return_msg
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return_msg = f"{False}#{e}"
+            return False, return_msg
+
+
+    def parse_search_params(self, cmd: str) -> tuple[bool, dict, str]:
+        try:
+            params = {}
+            parts = cmd.split('#')
+            if len(parts) > 3 and parts[3]:
+                for item in parts[3].split(','):
+                    param, value = item.split('=')
+                    if param.strip() not in ['nprobe', 'efSearch']:
+                        return False, {}, f"Unknown search param [{param}], expect nprobe or efSearch."
+                    params[param.strip()] = int(value)
+            return True, params, f"Search with params [{params}]."
+
+        except Exception as e:
+            return False, {}, str(e)
 
-                select_key = []
-                ind = ind.tolist()[0]
-                for num in ind:
-                    select_key.append(key_list[num])
 
-                return True, select_key, f"Find top-[{K}] similar data with key [{select_key}] and instances [{dis}]."
+    def find_topK(self, name: str, vector: np.array, K: int, logger: Logger, params: dict=None) -> tuple[bool, list, list, str]:
+        try:
+            OK_search, select_key, select_dis, msg = self.vector_index.search(name, vector, K, params)
+            logger.log(msg)
+            if not OK_search:
+                return False, [], [], msg
+
+            if len(select_key) < K:
+                return True, select_key, select_dis, f"Only [{len(select_key)}] data found, return them all back {select_key}."
+            else:
+                return True, select_key, select_dis, f"Find top-[{K}] similar data with key [{select_key}] and instances [{select_dis}]."
 
         except Exception as e:
-            logger.log(e)
-            return False, [], "Fail to find similar data."
+            logger.log(e, level='error')
+            return False, [], [], "Fail to find similar data."
 
 
 class SlaveSocket:
-    def __init__(self, local_ip: str, local_port: int, remote_ip: str, remote_port: int, buffer: int=1024):
+    def __init__(self, local_ip: str, local_port: int, remote_ip: str, remote_port: int, buffer: int=1024, workers: int=8, max_queue: int=64,
+        metrics: Metrics=None, tracer: Tracer=None, node: str=None):
         self.local_ip = local_ip
         self.local_port = local_port
         self.remote_ip = remote_ip
         self.remote_port = remote_port
         self.buffer = buffer
+        self.transport = Transport(buffer)
+
+        self.workers = ThreadPoolExecutor(max_workers=workers)  # runs handler calls, connections only do I/O
+        self.max_queue = max_queue  # requests waiting for a worker before new ones are turned away
+        self.pending = 0
+        self.active = 0
+        self.peak_pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.stats_lock = threading.Lock()
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.gauge('azu_slave_queue_pending', lambda: self.pending)
+        self.metrics.gauge('azu_slave_queue_active', lambda: self.active)
+        self.metrics.gauge('azu_slave_queue_peak_pending', lambda: self.peak_pending)
+        self.tracer = tracer  # writes traces of requests the client asked to trace, None keeps them in replies only
+        self.hop = f"slave {local_ip}:{local_port}"
+        self.node = node  # <ip>:<port> the master knows this slave by, None to be known by the address alone
+
+
+    def queue_stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                'pending': self.pending,
+                'active': self.active,
+                'peak_pending': self.peak_pending,
+                'served': self.served,
+                'rejected': self.rejected,
+            }
+
+
+    def work(self, handler: Handler, message_from_master, logger: Logger, received_time: float) -> tuple[bool, object]:
+        with self.stats_lock:
+            self.pending -= 1
+            self.active += 1
+        queue_time = time.perf_counter() - received_time
+        self.metrics.observe('azu_slave_queue_seconds', queue_time)
+        trace = tracing.current()
+        if trace is not None:
+            trace.add('slave.queue', queue_time)
+        try:
+            with tracing.span('slave.handle'):
+                return handler.handle(message_from_master, logger)
+        finally:
+            self.transport.release(message_from_master)
+            with self.stats_lock:
+                self.active -= 1
+                self.served += 1
+
+
+    def reply(self, conn: socket.socket, send_lock: threading.Lock, header, return_msg, addr: list, logger: Logger, trace: Trace=None) -> bool:
+        spans = trace.spans if trace is not None and header.flags & tracing.RETURN else None
+        with send_lock:
+            OK_send, msg = self.transport.send(conn, return_msg, header.request_id, 0, header.trace_id, header.flags, spans)
+        logger.log(f"Slave sent [{msg}] to Master [{addr[0]}]-[{addr[1]}].")
+        logger.log(f"Slave sent [{summary(return_msg)}] to Master [{addr[0]}]-[{addr[1]}].", level='debug')
+        if OK_send:
+            self.metrics.inc('azu_slave_bytes_sent_total', self.transport.frame.size + msg.length)
+            if trace is not None:
+                trace.add_timing('slave', msg, 'encode', 'send')
+        if trace is not None and self.tracer is not None:
+            self.tracer.finish(trace)
+        return OK_send
+
+
+    def work_reply(self, conn: socket.socket, send_lock: threading.Lock, header, handler: Handler, message_from_master, addr: list, logger: Logger,
+        received_time: float) -> bool:
+        trace = None
+        if header.flags & tracing.TRACE:
+            trace = Trace(header.trace_id, self.hop, header.flags)
+            trace.add_timing('slave', header, 'decode', 'recv')
+        token = tracing.current_trace.set(trace)
+        try:
+            OK_handle, return_msg = self.work(handler, message_from_master, logger, received_time)
+        finally:
+            tracing.current_trace.reset(token)
+        OK_reply = self.reply(conn, send_lock, header, return_msg, addr, logger, trace)
+        self.metrics.observe('azu_slave_request_seconds', time.perf_counter() - received_time, op=header.op)
+        return OK_reply
+
+
+    def dispatch(self, conn: socket.socket, send_lock: threading.Lock, header, handler: Handler, message_from_master, addr: list, logger: Logger) -> bool:
+        received_time = time.perf_counter()
+        self.metrics.inc('azu_slave_requests_total', op=header.op)
+        self.metrics.inc('azu_slave_bytes_received_total', self.transport.frame.size + header.length)
+        with self.stats_lock:
+            busy = self.pending >= self.max_queue
+            if busy:
+                self.rejected += 1
+                msg = f"Slave busy, [{self.pending}] request(s) queued."
+            else:
+                self.pending += 1
+                self.peak_pending = max(self.peak_pending, self.pending)
+        if busy:
+            logger.log(msg)
+            self.metrics.inc('azu_slave_rejected_total')
+            self.transport.release(message_from_master)
+            return self.reply(conn, send_lock, header, f"{False}#{msg}", addr, logger)
+        self.workers.submit(self.work_reply, conn, send_lock, header, handler, message_from_master, addr, logger, received_time)
+        return True
+
+
+    def serve(self, conn: socket.socket, addr: list, handler: Handler, logger: Logger) -> bool:
+        send_lock = threading.Lock()  # replies finish out of order, one frame on the wire at a time
+        try:
+            while True:
+                OK_receive, message_from_master, msg = self.transport.receive(conn)
+                if not OK_receive:
+                    logger.log(f"Master [{addr[0]}]-[{addr[1]}] closes connection: [{msg}].")
+                    return True
+                logger.log(f"Slave receive [{msg}] from Master [{addr[0]}]-[{addr[1]}].")
+                logger.log(f"Slave receive [{summary(message_from_master)}] from Master [{addr[0]}]-[{addr[1]}].", level='debug')
+
+                self.dispatch(conn, send_lock, msg, handler, message_from_master, addr, logger)
+
+        except Exception as e:
+            logger.log(e, level='error')
+            return False
+
+        finally:
+            conn.close()
 
 
     def send(self, logger: Logger) -> bool:
@@ -654,18 +2286,21 @@ class SlaveSocket:
                     now_time = int(time.time())
                     slave_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                     slave_socket.connect((self.remote_ip, self.remote_port))
-                    msg = pickle.dumps(f"{now_time}")
-                    slave_socket.sendall(msg)
+                    heart_beat = f"{now_time}#{self.node}" if self.node else f"{now_time}"
+                    OK_send_heart_beat, msg = self.transport.send(slave_socket, heart_beat, op=Transport.ops.index('heartbeat'))
+                    if not OK_send_heart_beat:
+                        raise ConnectionError(msg)
                     logger.log(f"Slave sent heart-beat to Master [{self.remote_ip}]-[{self.remote_port}] as [{now_time}].")
                     OK_send_heart_beat = True
                     slave_socket.close()
                 except Exception as e:
-                    logger.log(e)
+                    logger.log(e, level='error')
                     OK_send_heart_beat = False
 
                 if OK_send_heart_beat:
                     retry = 0
                     logger.log("Send heart beat.")
+                    logger.log(f"Slave request queue [{self.queue_stats()}].")
                     time.sleep(heart_beats_inter)
                 else:
                     logger.log("Fail to send heart beat. Waiting for retry.")
@@ -674,13 +2309,14 @@ class SlaveSocket:
             return True
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
     def receive(self, handler: Handler, logger: Logger) -> bool:
         try:
             slave_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            slave_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             slave_socket.bind((self.local_ip, self.local_port))
             slave_socket.listen(10)
             logger.log(f"Slave Socket listens on [{self.local_ip}]-[{self.local_port}], max for 10 incomes.")
@@ -688,84 +2324,117 @@ class SlaveSocket:
             try:
                 while True:
                     conn, addr = slave_socket.accept()
-
-                    data_from_master = conn.recv(self.buffer)
-                    message_from_master = pickle.loads(data_from_master)
-                    logger.log(f"Slave receive [{message_from_master}] from Client [{addr[0]}]-[{addr[1]}].")
-
-                    _, msg_len = message_from_master.split('#')
-                    data_from_master = conn.recv(int(msg_len))
-                    message_from_master = pickle.loads(data_from_master)
-                    logger.log(f"Master receive [{message_from_master}] from Client [{addr[0]}]-[{addr[1]}].")
-
-                    OK_handle, return_bytes = handler.handle(message_from_master, logger)
-
-                    return_len = len(return_bytes)
-                    return_len_msg = pickle.dumps(f"len#{return_len}")
-                    conn.sendall(return_len_msg)
-                    logger.log(f"Slave sent [{pickle.loads(return_len_msg)}] to Master [{addr[0]}]-[{addr[1]}].")
-                    time.sleep(0.1)
-
-                    conn.sendall(return_bytes)
-                    logger.log(f"Slave sent [{pickle.loads(return_bytes)}] to Master [{addr[0]}]-[{addr[1]}].")
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    thread = threading.Thread(target=self.serve, args=(conn, addr, handler, logger))
+                    thread.daemon = True
+                    thread.start()
+                    logger.log(f"Slave connect to Master [{addr[0]}]-[{addr[1]}].")
 
                 return True
 
             except Exception as e:
-                logger.log(e)
+                logger.log(e, level='error')
                 slave_socket.close()
                 return False
 
         except Exception as e:
-            logger.log(e)
+            logger.log(e, level='error')
             return False
 
 
 class Slave:
-    def __init__(self, slave_ip: str, slave_port: int, master_ip: str, master_port: int):
+    def __init__(self, slave_ip: str, slave_port: int, master_ip: str, master_port: int, node: str=None, index_type: str='Flat',
+        log_level: str='info'):
         self.slave_ip = slave_ip
         self.slave_port = slave_port
         self.master_ip = master_ip
         self.master_port = master_port
+        self.node = node  # <ip>:<port> as listed on the master, lets several slaves share one host
 
         self.heart_beats_inter = 20
+        self.checkpoint_inter = 30
+        self.compact_inter = 60
+        self.commit_interval = 0.005
+        self.commit_batch = 128
+        self.train_inter = 30
+        self.index_config = {
+            'index_type': index_type,  # Flat, IVFFlat, IVFPQ or HNSW
+            'index_types': {},  # per owner or (owner, data_shape) override
+            'train_threshold': 10000,  # partitions below this size keep exact search
+        }
+
+        self.metrics_file = 'metrics/slave.prom'  # Prometheus text dump, None to disable
+        self.metrics_inter = 15
 
-        self.logger = Logger('slave')
+        self.logger = Logger('slave', level=log_level)
+        self.metrics = Metrics()
+        self.tracer = Tracer('slave')
 
 
     def threads(self, ) -> bool:
         try:
-            slavesocket = SlaveSocket(self.slave_ip, self.slave_port, self.master_ip, self.master_port)
-            handler = Handler()
+            slavesocket = SlaveSocket(self.slave_ip, self.slave_port, self.master_ip, self.master_port, metrics=self.metrics, tracer=self.tracer,
+                node=self.node)
+            handler = Handler(self.commit_interval, self.commit_batch, self.index_config, self.metrics)
 
-            handler.rebuild(self.logger)
+            if not handler.rebuild(self.logger):
+                self.logger.log(f"Fail to rebuild Handler, [{self.slave_ip}:{self.slave_port}] does not register with master.", level='error')
+                return False
 
             ss_send = threading.Thread(target=slavesocket.send, args=(self.logger, ))
             ss_recv = threading.Thread(target=slavesocket.receive, args=(handler, self.logger, ))
 
+            ss_commit = threading.Thread(target=handler.wal.run_commit, args=(self.logger, ))
+            ss_checkpoint = threading.Thread(target=handler.run_checkpoint, args=(self.checkpoint_inter, self.logger, ))
+            ss_compact = threading.Thread(target=handler.run_compact, args=(self.compact_inter, self.logger, ))
+            ss_train = threading.Thread(target=handler.run_train, args=(self.train_inter, self.logger, ))
+
             ss_send.daemon = True
             ss_recv.daemon = True
+            ss_commit.daemon = True
+            ss_checkpoint.daemon = True
+            ss_compact.daemon = True
+            ss_train.daemon = True
 
             ss_send.start()
             ss_recv.start()
+            ss_commit.start()
+            ss_checkpoint.start()
+            ss_compact.start()
+            ss_train.start()
 
             self.logger.log(f"Start SlaveSend.run thread [{ss_send}] successfully.")
             self.logger.log(f"Start SlaveReceive.run thread [{ss_recv}] successfully.")
+            self.logger.log(f"Start WriteAheadLog.run_commit thread [{ss_commit}] successfully.")
+            self.logger.log(f"Start Handler.run_checkpoint thread [{ss_checkpoint}] successfully.")
+            self.logger.log(f"Start Handler.run_compact thread [{ss_compact}] successfully.")
+            self.logger.log(f"Start Handler.run_train thread [{ss_train}] successfully.")
+
+            if self.metrics_file:
+                ss_metrics = threading.Thread(target=self.metrics.run_dump, args=(self.metrics_file, self.metrics_inter, self.logger, ))
+                ss_metrics.daemon = True
+                ss_metrics.start()
+                self.logger.log(f"Start Metrics.run_dump thread [{ss_metrics}] successfully.")
             
             while True:
                 time.sleep(20)
 
             return True
         except Exception as e:
-            self.logger.log(e)
+            self.logger.log(e, level='error')
             return False
 
 
 if __name__ == '__main__':
-    slave_ip = '0.0.0.0'  # '10.211.55.75' '10.211.55.76'
-    slave_port = 65531
-    master_ip = 'master_IP'
-    master_port = 65530
-    slave = Slave(slave_ip, slave_port, master_ip, master_port)
-    slave.threads()
-
+    parser = argparse.ArgumentParser(description='AZU slave node.')
+    parser.add_argument('--ip', default='0.0.0.0', help='address the slave listens on')
+    parser.add_argument('--port', type=int, default=65531)
+    parser.add_argument('--master-ip', default='master_IP')
+    parser.add_argument('--master-port', type=int, default=65530)
+    parser.add_argument('--node', default=None, help='<ip>:<port> this slave is listed as on the master')
+    parser.add_argument('--index-type', default='Flat', choices=['Flat', 'IVFFlat', 'IVFPQ', 'HNSW'])
+    parser.add_argument('--log-level', default='info', choices=list(Logger.levels))
+    args = parser.parse_args()
+
+    slave = Slave(args.ip, args.port, args.master_ip, args.master_port, args.node, args.index_type, args.log_level)
+    sys.exit(0 if slave.threads() else 1)
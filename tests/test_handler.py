@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # master.py, slave.py and client.py live here
+sys.path.insert(0, ROOT)
+
+from slave import Handler
+from logger import Logger
+
+
+DIM = 16
+
+
+@pytest.fixture
+def logger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Handler keeps catalog, segments, index and log under the working directory
+    return Logger('test', echo=False)
+
+
+def open_handler(logger: Logger) -> Handler:
+    handler = Handler(commit_interval=0.001, index_config={'index_type': 'Flat'})
+    assert handler.rebuild(logger)
+    commit = threading.Thread(target=handler.wal.run_commit, args=(logger, ))
+    commit.daemon = True
+    commit.start()
+    return handler
+
+
+def vector(seed: int) -> np.array:
+    return np.random.default_rng(seed).standard_normal(DIM, dtype=np.float32)
+
+
+def test_replay_after_crash_without_checkpoint(logger):
+    handler = open_handler(logger)
+    for num in range(20):
+        OK_create, return_msg = handler.create_data(f"admin#upload#k{num}", vector(num), logger)
+        assert OK_create and return_msg[0].startswith('True#')
+    OK_bulk, return_msg = handler.create_batch_data('admin#bulkUpload',
+        ([f"b{num}" for num in range(50)], np.stack([vector(100 + num) for num in range(50)])), logger)
+    assert OK_bulk and return_msg[0].startswith('True#')
+    assert handler.delete_target_data('k0')[0]
+    assert handler.modify_data('admin#modify#k1#TARGET_VECTOR[:] += INPUT_VECTOR[:]', np.ones(DIM, dtype=np.float32), logger)[0]
+    # no checkpoint and no flush: the write-ahead log is all that survives
+    assert handler.wal.checkpoint_lsn < handler.wal.committed_lsn
+
+    recovered = Handler(commit_interval=0.001, index_config={'index_type': 'Flat'})
+    assert recovered.rebuild(logger)
+    assert recovered.catalog.get('k0') is None
+    for num in range(2, 20):
+        OK_read, data, _ = recovered.store.read(f"k{num}")
+        assert OK_read and np.array_equal(data, vector(num))
+    OK_read, data, _ = recovered.store.read('k1')
+    assert OK_read and np.allclose(data, vector(1) + 1)
+    assert len(recovered.catalog.records) == 19 + 50
+
+    OK_search, keys, _, _ = recovered.find_topK('admin', vector(120), 1, logger)
+    assert OK_search and keys == ['b20']
+
+
+def test_rejected_put_is_not_replayed(logger, monkeypatch):
+    handler = open_handler(logger)
+    assert handler.create_data('admin#upload#kept', vector(1), logger)[0]
+
+    monkeypatch.setattr(handler, 'put_data', lambda *args: (False, 'Segment store is full.'))
+    OK_create, return_msg = handler.create_data('admin#upload#rejected', vector(2), logger)
+    assert return_msg[0].startswith('False#')
+    monkeypatch.setattr(handler, 'put_batch', lambda *args: (False, 'Segment store is full.'))
+    OK_bulk, return_msg = handler.create_batch_data('admin#bulkUpload', (['r0', 'r1'], np.stack([vector(3), vector(4)])), logger)
+    assert return_msg[0].startswith('False#')
+    assert [entry[1] for _, entry in handler.wal.read()] == ['kept']
+
+    recovered = Handler(commit_interval=0.001, index_config={'index_type': 'Flat'})
+    assert recovered.rebuild(logger)
+    assert recovered.catalog.get('kept') is not None
+    for key in ['rejected', 'r0', 'r1']:
+        assert recovered.catalog.get(key) is None
+
+
+def test_concurrent_put_and_topK(logger):
+    handler = open_handler(logger)
+    writers, per_writer = 4, 25
+    errors = []
+    done = threading.Event()
+
+    def write(writer: int) -> None:
+        for num in range(per_writer):
+            seed = writer * per_writer + num
+            OK_create, return_msg = handler.create_data(f"admin#upload#w{seed}", vector(seed), logger)
+            if not OK_create or not return_msg[0].startswith('True#'):
+                errors.append(return_msg)
+
+    def search() -> None:
+        while not done.is_set():
+            OK_search, keys, distances, msg = handler.find_topK('admin', vector(0), 5, logger)
+            if not OK_search or len(keys) != len(distances) or len(set(keys)) != len(keys):
+                errors.append(msg)
+
+    threads = [threading.Thread(target=write, args=(writer, )) for writer in range(writers)]
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    for thread in readers + threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert len(handler.catalog.records) == writers * per_writer
+    for seed in range(writers * per_writer):
+        OK_search, keys, _, _ = handler.find_topK('admin', vector(seed), 1, logger)
+        assert OK_search and keys == [f"w{seed}"]
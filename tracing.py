@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import queue
+import threading
+import functools
+import contextlib
+import contextvars
+import collections
+
+
+TRACE = 1  # frame flag, record spans for this request at every hop
+RETURN = 2  # frame flag, hand the spans back to the caller inside the reply
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: int, hop: str, flags: int=TRACE):
+        self.trace_id = trace_id
+        self.hop = hop  # who records the spans: client, master or slave <ip>:<port>
+        self.flags = flags
+        self.start_time = time.time()
+        self.spans = []  # (hop, stage, start time, seconds)
+
+
+    def add(self, stage: str, seconds: float, start_time: float=None) -> None:
+        self.spans.append((self.hop, stage, time.time() - seconds if start_time is None else start_time, seconds))
+
+
+    def add_timing(self, prefix: str, header, first: str, second: str) -> None:
+        if header.timing is not None:
+            self.add(f"{prefix}.{first}", header.timing[0])
+            self.add(f"{prefix}.{second}", header.timing[1])
+
+
+    def extend(self, spans: list) -> None:
+        if spans:
+            self.spans.extend(tuple(span) for span in spans)
+
+
+    @contextlib.contextmanager
+    def span(self, stage: str):
+        start_time, start = time.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, start_time)
+
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': f"{self.trace_id:016x}",
+            'hop': self.hop,
+            'start': self.start_time,
+            'spans': [{'hop': hop, 'stage': stage, 'start': start, 'seconds': seconds} for hop, stage, start, seconds in self.spans],
+        }
+
+
+def current() -> Trace:
+    return current_trace.get()
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+def traced(stage: str):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            trace = current_trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with trace.span(stage):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+def new_id() -> int:
+    return int.from_bytes(os.urandom(8), 'big') >> 1 or 1
+
+
+class Tracer:
+    def __init__(self, name: str, root: str='trace', keep: int=1024, max_queue: int=4096):
+        self.name = name
+        self.trace_file = os.path.join(root, f"{name}.jsonl")  # one JSON trace per line
+        self.recent = collections.deque(maxlen=keep)  # last finished traces, newest last
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0  # traces not written because the queue was full
+
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+        writer = threading.Thread(target=self.write)
+        writer.daemon = True
+        writer.start()
+
+
+    def finish(self, trace: Trace) -> None:
+        self.recent.append(trace)
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+
+    def write(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.trace_file, 'a') as file:
+                    file.write(''.join(json.dumps(trace.to_dict()) + '\n' for trace in batch))
+            except Exception as e:
+                print(f"Fail to write [{len(batch)}] trace(s) to [{self.trace_file}]: [{e}].")
+            for _ in batch:
+                self.queue.task_done()
+
+
+    def flush(self) -> None:
+        self.queue.join()
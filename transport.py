@@ -0,0 +1,331 @@
+import socket
+import numpy as np
+import struct
+import os
+import uuid
+import asyncio
+import collections
+import time
+
+
+FrameHeader = collections.namedtuple('FrameHeader', ['op', 'kind', 'request_id', 'length', 'trace_id', 'flags', 'spans', 'timing'],
+    defaults=(0, 0, None, None))  # timing is (encode or decode, send or recv) seconds
+ArraySlot = collections.namedtuple('ArraySlot', ['index', 'data_dtype', 'data_shape'])
+
+
+class Transport:
+    magic = b'AZ'
+    version = 3
+    frame = struct.Struct('!2sBBBBQQQ')  # magic, version, op code, kind, trace flags, request id, trace id, payload length
+    skeleton_len = struct.Struct('!Q')  # leads the payload, the encoded skeleton and raw arrays follow
+    ops = ['reply', 'upload', 'bulkUpload', 'delete', 'modify', 'find', 'hash', 'topK', 'batchTopK',
+        'catalog', 'ping', 'queue', 'heartbeat', 'stats']
+    encoded = 0  # payload is a skeleton followed by the raw bytes of its arrays
+    traced = 1  # as encoded, the skeleton is (msg, spans) with the spans recorded by the hops behind
+    max_depth = 32  # nesting allowed in a decoded skeleton
+    iov_max = 512  # buffers handed to one sendmsg call
+
+
+    def __init__(self, buffer: int=1024, chunk_size: int=1024 * 1024, stream_threshold: int=4 * 1024 * 1024, spool: str='spool'):
+        self.buffer = buffer
+        self.chunk_size = chunk_size  # bytes per recv_into call
+        self.stream_threshold = stream_threshold  # arrays this large land in a spool file instead of memory
+        self.spool = spool  # where large arrays land when no destination is given
+
+
+    def op_code(self, msg) -> int:
+        cmd = msg[0] if isinstance(msg, tuple) and len(msg) > 0 else msg
+        if isinstance(cmd, str) and cmd.count('#') > 0 and cmd.split('#')[1] in self.ops:
+            return self.ops.index(cmd.split('#')[1])
+        return 0
+
+
+    def pack_header(self, op: int, kind: int, request_id: int, length: int, trace_id: int=0, flags: int=0) -> bytes:
+        return self.frame.pack(self.magic, self.version, op, kind, flags, request_id, trace_id, length)
+
+
+    def unpack_header(self, data: bytes) -> FrameHeader:
+        magic, version, op, kind, flags, request_id, trace_id, length = self.frame.unpack(data)
+        if magic != self.magic:
+            raise ValueError(f"Bad frame magic [{magic}].")
+        if version != self.version:
+            raise ValueError(f"Unsupported frame version [{version}].")
+        if op >= len(self.ops):
+            raise ValueError(f"Unknown op code [{op}].")
+        if kind not in [self.encoded, self.traced]:
+            raise ValueError(f"Unknown payload kind [{kind}].")
+        return FrameHeader(self.ops[op], kind, request_id, length, trace_id, flags)
+
+
+    def pack_value(self, value, out: bytearray, arrays: list) -> None:
+        if value is None:
+            out += b'N'
+        elif isinstance(value, (bool, np.bool_)):
+            out += b'T' if value else b'F'
+        elif isinstance(value, (int, np.integer)):
+            value = int(value)
+            if -2 ** 63 <= value < 2 ** 63:
+                out += b'i' + struct.pack('!q', value)
+            else:
+                data = str(value).encode('ascii')
+                out += b'I' + struct.pack('!I', len(data)) + data
+        elif isinstance(value, (float, np.floating)):
+            out += b'f' + struct.pack('!d', float(value))
+        elif isinstance(value, str):
+            data = value.encode('utf-8')
+            out += b's' + struct.pack('!I', len(data)) + data
+        elif isinstance(value, (bytes, bytearray)):
+            out += b'b' + struct.pack('!I', len(value)) + value
+        elif isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError(f"Cannot send array of dtype [{value.dtype}].")
+            value = np.ascontiguousarray(value)
+            data_dtype = value.dtype.str.encode('ascii')
+            out += b'a' + struct.pack('!I', len(data_dtype)) + data_dtype
+            out += struct.pack('!B', value.ndim) + struct.pack(f'!{value.ndim}Q', *value.shape)
+            arrays.append(value)
+        elif isinstance(value, (list, tuple)):
+            out += (b't' if isinstance(value, tuple) else b'l') + struct.pack('!I', len(value))
+            for item in value:
+                self.pack_value(item, out, arrays)
+        elif isinstance(value, dict):
+            out += b'd' + struct.pack('!I', len(value))
+            for key, item in value.items():
+                self.pack_value(key, out, arrays)
+                self.pack_value(item, out, arrays)
+        else:
+            raise TypeError(f"Cannot send value of type [{type(value).__name__}].")
+
+
+    def unpack_value(self, data: memoryview, offset: int, slots: list, depth: int=0) -> tuple[object, int]:
+        if depth > self.max_depth:
+            raise ValueError("Skeleton nests too deep.")
+        tag = bytes(data[offset:offset + 1])
+        offset += 1
+        if tag == b'N':
+            return None, offset
+        if tag in (b'T', b'F'):
+            return tag == b'T', offset
+        if tag == b'i':
+            return struct.unpack_from('!q', data, offset)[0], offset + 8
+        if tag == b'f':
+            return struct.unpack_from('!d', data, offset)[0], offset + 8
+        if tag in (b'I', b's', b'b'):
+            size, = struct.unpack_from('!I', data, offset)
+            offset += 4
+            if offset + size > len(data):
+                raise ValueError("Skeleton is truncated.")
+            raw = bytes(data[offset:offset + size])
+            if tag == b'I':
+                return int(raw.decode('ascii')), offset + size
+            return (raw.decode('utf-8') if tag == b's' else raw), offset + size
+        if tag == b'a':
+            size, = struct.unpack_from('!I', data, offset)
+            data_dtype = np.dtype(bytes(data[offset + 4:offset + 4 + size]).decode('ascii'))
+            if data_dtype.hasobject:
+                raise ValueError(f"Refuse array of dtype [{data_dtype}].")
+            offset += 4 + size
+            ndim, = struct.unpack_from('!B', data, offset)
+            data_shape = struct.unpack_from(f'!{ndim}Q', data, offset + 1)
+            slots.append(ArraySlot(len(slots), data_dtype.str, tuple(data_shape)))
+            return slots[-1], offset + 1 + 8 * ndim
+        if tag in (b'l', b't'):
+            count, = struct.unpack_from('!I', data, offset)
+            offset += 4
+            items = []
+            for _ in range(count):
+                item, offset = self.unpack_value(data, offset, slots, depth + 1)
+                items.append(item)
+            return (tuple(items) if tag == b't' else items), offset
+        if tag == b'd':
+            count, = struct.unpack_from('!I', data, offset)
+            offset += 4
+            items = {}
+            for _ in range(count):
+                key, offset = self.unpack_value(data, offset, slots, depth + 1)
+                items[key], offset = self.unpack_value(data, offset, slots, depth + 1)
+            return items, offset
+        raise ValueError(f"Unknown skeleton tag [{tag}].")
+
+
+    def fill(self, value, arrays: list):
+        if isinstance(value, ArraySlot):
+            return arrays[value.index]
+        if isinstance(value, tuple):
+            return tuple(self.fill(item, arrays) for item in value)
+        if isinstance(value, list):
+            return [self.fill(item, arrays) for item in value]
+        if isinstance(value, dict):
+            return {key: self.fill(item, arrays) for key, item in value.items()}
+        return value
+
+
+    def walk_arrays(self, value) -> list:
+        if isinstance(value, np.ndarray):
+            return [value]
+        if isinstance(value, (tuple, list)):
+            return [array for item in value for array in self.walk_arrays(item)]
+        if isinstance(value, dict):
+            return [array for item in value.values() for array in self.walk_arrays(item)]
+        return []
+
+
+    def spool_array(self, data_dtype: str, data_shape: tuple) -> np.array:
+        if not os.path.exists(self.spool):
+            os.mkdir(self.spool)
+        path = os.path.join(self.spool, f"{uuid.uuid4().hex}.npy")
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.dtype(data_dtype), shape=data_shape)
+
+
+    def allocate(self, skeleton, slots: list, body_len: int, destination) -> list:
+        need = sum(np.dtype(slot.data_dtype).itemsize * int(np.prod(slot.data_shape)) for slot in slots)
+        if need != body_len:
+            raise ValueError(f"Frame carries [{body_len}] array bytes but skeleton needs [{need}].")
+
+        arrays = []
+        try:
+            for slot in slots:
+                array = None
+                if np.dtype(slot.data_dtype).itemsize * int(np.prod(slot.data_shape)) >= self.stream_threshold:
+                    if destination is not None:
+                        array = destination(skeleton, slot.data_dtype, slot.data_shape)
+                    if array is None:
+                        array = self.spool_array(slot.data_dtype, slot.data_shape)
+                else:
+                    array = np.empty(slot.data_shape, dtype=np.dtype(slot.data_dtype))
+                arrays.append(array)
+        except Exception:
+            self.release(arrays)
+            raise
+        return arrays
+
+
+    def release(self, msg) -> None:
+        for array in self.walk_arrays(msg):
+            if isinstance(array, np.memmap) and array.filename is not None \
+                and os.path.dirname(array.filename) == os.path.abspath(self.spool) and os.path.exists(array.filename):
+                os.remove(array.filename)
+
+
+    def encode(self, msg, request_id: int=0, op: int=None, trace_id: int=0, flags: int=0, spans: list=None) -> tuple[FrameHeader, list]:
+        op = self.op_code(msg) if op is None else op
+        kind = self.encoded if spans is None else self.traced
+        skeleton, arrays = bytearray(), []
+        self.pack_value(msg if spans is None else (msg, spans), skeleton, arrays)
+        views = [memoryview(array).cast('B') for array in arrays if array.nbytes > 0]
+        length = self.skeleton_len.size + len(skeleton) + sum(len(view) for view in views)
+        head = self.pack_header(op, kind, request_id, length, trace_id, flags) + self.skeleton_len.pack(len(skeleton)) + skeleton
+        return FrameHeader(self.ops[op], kind, request_id, length, trace_id, flags), [head] + views
+
+
+    def decode(self, header: FrameHeader, data: bytes, destination) -> tuple[object, list, list]:
+        slots = []
+        skeleton, offset = self.unpack_value(memoryview(data), 0, slots)
+        if offset != len(data):
+            raise ValueError(f"Skeleton has [{len(data) - offset}] trailing bytes.")
+        spans = None
+        if header.kind == self.traced:
+            skeleton, spans = skeleton
+        body_len = header.length - self.skeleton_len.size - len(data)
+        arrays = self.allocate(skeleton, slots, body_len, destination)
+        return self.fill(skeleton, arrays), arrays, spans
+
+
+    def recv_into(self, conn: socket.socket, view: memoryview) -> None:
+        received = 0
+        while received < len(view):
+            num = conn.recv_into(view[received:received + self.chunk_size])
+            if num == 0:
+                raise ConnectionError(f"Connection closed after [{received}] of [{len(view)}] bytes.")
+            received += num
+
+
+    def recv_exact(self, conn: socket.socket, size: int) -> bytes:
+        data = bytearray(size)
+        self.recv_into(conn, memoryview(data))
+        return bytes(data)
+
+
+    def sendmsg_all(self, conn: socket.socket, parts: list) -> None:
+        views = [memoryview(part).cast('B') for part in parts]
+        while views:
+            sent = conn.sendmsg(views[:self.iov_max])
+            while sent > 0:
+                if sent >= len(views[0]):
+                    sent -= len(views[0])
+                    views.pop(0)
+                else:
+                    views[0] = views[0][sent:]
+                    sent = 0
+
+
+    def send(self, conn: socket.socket, msg, request_id: int=0, op: int=None, trace_id: int=0, flags: int=0, spans: list=None) -> tuple[bool, object]:
+        try:
+            start_time = time.perf_counter()
+            header, parts = self.encode(msg, request_id, op, trace_id, flags, spans)
+            encode_time = time.perf_counter()
+            self.sendmsg_all(conn, parts)
+            return True, header._replace(timing=(encode_time - start_time, time.perf_counter() - encode_time))
+
+        except Exception as e:
+            return False, str(e)
+
+
+    def receive(self, conn: socket.socket, destination=None) -> tuple[bool, object, object]:
+        arrays = []
+        try:
+            header = self.unpack_header(self.recv_exact(conn, self.frame.size))
+            start_time = time.perf_counter()
+            size, = self.skeleton_len.unpack(self.recv_exact(conn, self.skeleton_len.size))
+            if self.skeleton_len.size + size > header.length:
+                raise ValueError(f"Skeleton of [{size}] bytes overruns frame of [{header.length}].")
+            data = self.recv_exact(conn, size)
+            decode_time = time.perf_counter()
+            msg, arrays, spans = self.decode(header, data, destination)
+            decode_time = time.perf_counter() - decode_time
+            for array in arrays:
+                if array.nbytes > 0:
+                    self.recv_into(conn, memoryview(array.reshape(-1)).cast('B'))
+            return True, msg, header._replace(spans=spans, timing=(decode_time, time.perf_counter() - start_time - decode_time))
+
+        except Exception as e:
+            self.release(arrays)  # spool files of a frame cut off mid-body
+            return False, None, str(e)
+
+
+    async def send_async(self, writer: asyncio.StreamWriter, msg, request_id: int=0, op: int=None, trace_id: int=0, flags: int=0,
+        spans: list=None) -> tuple[bool, object]:
+        try:
+            start_time = time.perf_counter()
+            header, parts = self.encode(msg, request_id, op, trace_id, flags, spans)
+            encode_time = time.perf_counter()
+            for part in parts:
+                writer.write(part)
+                await writer.drain()
+            return True, header._replace(timing=(encode_time - start_time, time.perf_counter() - encode_time))
+
+        except Exception as e:
+            return False, str(e)
+
+
+    async def receive_async(self, reader: asyncio.StreamReader, destination=None) -> tuple[bool, object, object]:
+        arrays = []
+        try:
+            header = self.unpack_header(await reader.readexactly(self.frame.size))
+            start_time = time.perf_counter()
+            size, = self.skeleton_len.unpack(await reader.readexactly(self.skeleton_len.size))
+            if self.skeleton_len.size + size > header.length:
+                raise ValueError(f"Skeleton of [{size}] bytes overruns frame of [{header.length}].")
+            data = await reader.readexactly(size)
+            decode_time = time.perf_counter()
+            msg, arrays, spans = self.decode(header, data, destination)
+            decode_time = time.perf_counter() - decode_time
+            for array in arrays:
+                view = memoryview(array.reshape(-1)).cast('B')
+                for start in range(0, len(view), self.chunk_size):
+                    view[start:start + self.chunk_size] = await reader.readexactly(min(self.chunk_size, len(view) - start))
+            return True, msg, header._replace(spans=spans, timing=(decode_time, time.perf_counter() - start_time - decode_time))
+
+        except Exception as e:
+            self.release(arrays)  # spool files of a frame cut off mid-body
+            return False, None, str(e)